@@ -0,0 +1,100 @@
+import logging
+import random
+
+import battle
+
+# Game rules of time driven activities, shared by bot commands and offline benchmarks
+# config is anything with the change API of Configuration (player, add, assign, add_income, save, loot, [key])
+
+
+def work(config, player_id: int, stats, now: float):
+    """Pay income for time since last work, returns None while work is on cooldown
+    stats are derived.DerivedStats of player"""
+    player = config.player(player_id)
+    if now < player.last_work + config["deltatime"]:
+        return None
+
+    income = stats.income
+    rate = random.randrange(
+        100-config["work_range"]*100, 100+config["work_range"]*100) / 100 if config["work_range"] != 0 else 1
+    if player.last_work != 0:
+        timedelta = (now - player.last_work) / config["deltatime"]
+        config.add(player_id, "balance", int(income * timedelta * rate))
+    else:
+        timedelta = 1
+        config.add(player_id, "balance", income)
+    config.assign(player_id, "last-work", now)
+
+    return {
+        "income": income,
+        "timedelta": timedelta,
+        "rate": rate,
+        "boost": stats.boost,
+        "multiplier": stats.multiplier
+    }
+
+
+def settle_expedition(config, job: dict):
+    """Roll result of expedition, give loot and return manpower on hold
+    Returns {"success", "item" (name in loot-table or None), "full" (inventory limit reached)}"""
+    player = job["player"]
+    expedition = job["args"]
+    result = {"success": False, "item": None, "full": False}
+
+    if random.randint(0, 100) < expedition["chance"]:
+        result["success"] = True
+        config.add(player, "xp", expedition["xp"] + expedition["xp"] *
+                   config.player(player).stats.learning * config["learning_rate"])
+
+        if len(config.player(player).inventory) < config["max_player_items"]:
+            _, chosen_item = config.loot.roll(expedition["loot-table"])
+            if chosen_item != None:
+                result["item"] = chosen_item
+
+                record = config["players"][player]
+                record.inventory.add(chosen_item, {
+                                     **config["loot-table"][chosen_item], "id": config.item_id()}, record.equiped)
+                config.save(player)
+        else:
+            result["full"] = True
+
+    config.add(player, "manpower", expedition["manpower"])
+    return result
+
+
+def settle_attack(config, job: dict):
+    """Roll battle, return surviving manpower and pay colonization back if attack did not win
+    Returns {"result", "player_manpower", "enemy_manpower" (survivors), "income_too_high"}"""
+    player = job["player"]
+    attack = job["args"]
+    estart = attack["enemy_manpower"]
+    player_manpower, enemy_manpower = attack["player_manpower"], estart
+    player_support, enemy_support = attack["player_support"], attack["enemy_support"]
+    skip_colonization = attack["skip_colonization"]
+    income, income_role = attack["income"], attack["income_role"]
+    income_too_high = False
+
+    survivors = battle.fight(
+        player_manpower, enemy_manpower, player_support, enemy_support)
+    player_manpower, enemy_manpower = int(survivors[0]), int(survivors[1])
+    result = battle.OUTCOMES[int(battle.outcome(
+        player_manpower, enemy_manpower))]
+
+    if result == "won":
+        if config["allow_attack_income"]:
+            if income_role != None:
+                if income >= 200000:
+                    income_too_high = True
+                else:
+                    config.add_income(income_role, income)
+
+    if result != "won" and skip_colonization == False:
+        config.add(player, "balance", estart)
+    config.add(player, "manpower", player_manpower)
+
+    return {
+        "result": result,
+        "player_manpower": player_manpower,
+        "enemy_manpower": enemy_manpower,
+        "income_too_high": income_too_high
+    }
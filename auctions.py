@@ -0,0 +1,129 @@
+import heapq
+import logging
+
+from transactions import TransactionError, charge
+
+# Only these items can be auctioned, the rest is sold in player shop
+RARITIES = ["legendary", "event"]
+
+
+class AuctionHouse():
+    """Sealed-bid auctions of rare items, highest bid wins and pays what it bid
+    Auctions are records in config["auctions"], item and bids are held in escrow until auction closes.
+    Bids of each auction are kept in max-heap, so bid is O(log n) and settlement reads just the top.
+    Closing is scheduled as scheduler job, so all auctions share one timer queue"""
+
+    def __init__(self, config, clock):
+        self.config = config
+        self.clock = clock
+        self.heaps = {}
+        self.next_id = 1
+
+    def load(self):
+        "Rebuild bid heaps from auctions in config, call after config is replaced"
+        auctions = self.config["auctions"]
+        self.heaps = {}
+        for auction_id, auction in auctions.items():
+            heap = self.heaps[auction_id] = [(-amount, order, bidder)
+                                             for bidder, (amount, order) in auction["bids"].items()]
+            heapq.heapify(heap)
+        self.next_id = max(auctions, default=0) + 1
+
+    def open(self, seller: int, name: str, minimum: int, seconds: float):
+        "Move item of seller to escrow and open auction, returns (auction id, auction), call under lock of seller"
+        player = self.config.player(seller)
+        item = player.inventory.get(name)
+        if item == None:
+            raise TransactionError(f"{name} not found in your inventory")
+        if not item.rarity in RARITIES:
+            raise TransactionError(
+                f"Only {' and '.join(RARITIES)} items can be auctioned")
+        if name in player.player_shop:
+            raise TransactionError(
+                f"{name} is listed in your shop, retrieve it first")
+        if minimum <= 0 or seconds <= 0:
+            raise TransactionError("Invalid value")
+
+        now = self.clock.time()
+        auction_id = self.next_id
+        self.next_id += 1
+        auction = {
+            "seller": seller,
+            "item": name,
+            "record": item.to_json(),
+            "minimum": minimum,
+            "created": now,
+            "due": now + seconds,
+            "bids": {},
+            "bid_count": 0
+        }
+        del self.config["players"][seller].inventory[name]
+        self.config.put("auctions", auction_id, auction)
+        self.heaps[auction_id] = []
+        self.config.save(seller)
+        return auction_id, auction
+
+    def bid(self, auction_id: int, bidder: int, amount: int):
+        """Place or raise sealed bid, only the difference to previous bid of bidder is taken to escrow
+        Call under lock of bidder"""
+        auction = self.config["auctions"].get(auction_id)
+        if auction == None or auction["due"] <= self.clock.time():
+            raise TransactionError("Auction not found or already closed")
+        if bidder == auction["seller"]:
+            raise TransactionError("Can't bid on your own auction")
+        if amount < auction["minimum"]:
+            raise TransactionError(
+                f"Bid is lower than minimum {auction['minimum']}")
+        previous = auction["bids"].get(bidder, (0, 0))[0]
+        if amount <= previous:
+            raise TransactionError(f"Your bid is already {previous}")
+
+        charge(self.config, bidder, balance=amount - previous)
+        # Equal bids are won by the one placed first
+        auction["bid_count"] += 1
+        order = auction["bid_count"]
+        auction["bids"][bidder] = [amount, order]
+        heapq.heappush(self.heaps[auction_id], (-amount, order, bidder))
+        self.config.put("auctions", auction_id, auction)
+        return previous
+
+    def winner(self, auction_id: int):
+        "(bidder, amount) of highest current bid, None without bids, raised bids leave stale heap entries which are dropped here"
+        bids = self.config["auctions"][auction_id]["bids"]
+        heap = self.heaps[auction_id]
+        while heap != []:
+            amount, order, bidder = heap[0]
+            if bids.get(bidder) == [-amount, order]:
+                return bidder, -amount
+            heapq.heappop(heap)
+        return None
+
+    def settle(self, auction_id: int):
+        """Close auction: item goes to highest bidder and bid to seller, other bids are refunded
+        Returns {"seller", "item", "winner", "price", "name" (item name in new inventory), "bids"}"""
+        auction = self.config["auctions"][auction_id]
+        seller = auction["seller"]
+        top = self.winner(auction_id)
+        winner, price = top if top != None else (seller, None)
+
+        for bidder, (amount, _) in auction["bids"].items():
+            if bidder != winner:
+                self.config.add(bidder, "balance", amount)
+        if price != None:
+            self.config.add(seller, "balance", price)
+
+        record = self.config["players"][winner]
+        name = record.inventory.add(
+            auction["item"], auction["record"], record.equiped)
+
+        self.config.put("auctions", auction_id, None)
+        del self.heaps[auction_id]
+        self.config.save(winner)
+        logging.debug(
+            f"Auction {auction_id} of {auction['item']} settled: {winner} for {price}")
+        return {"seller": seller, "item": auction["item"], "winner": winner if price != None else None,
+                "price": price, "name": name, "bids": len(auction["bids"])}
+
+    def pending(self):
+        "Sorted list of (id, auction), closing first"
+        return sorted(self.config["auctions"].items(), key=lambda x: (x[1]["due"], x[0]))
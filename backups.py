@@ -0,0 +1,229 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from clock import Clock
+from storage import fsync_dir, jsonKeys2int, read_snapshot
+
+
+def units(data: dict):
+    "Split config to independently diffed parts: one per player and one per other top level key"
+    parts = {}
+    for key, value in data.items():
+        if key == "players":
+            for player, record in value.items():
+                parts[("players", player)] = record
+        else:
+            parts[(key,)] = value
+    return parts
+
+
+def fingerprint(value):
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=16).digest()
+
+
+def make_delta(base: int, old: dict, new: dict, parts: dict):
+    "Delta from fingerprints old to fingerprints new, parts hold values of new"
+    return {
+        "base": base,
+        "set": [[list(path), parts[path]] for path in new if old.get(path) != new[path]],
+        "del": [list(path) for path in old if path not in new]
+    }
+
+
+def apply_delta(data: dict, delta: dict):
+    for path in delta["del"]:
+        container = data
+        for key in path[:-1]:
+            container = container[key]
+        container.pop(path[-1], None)
+    for path, value in delta["set"]:
+        container = data
+        for key in path[:-1]:
+            container = container.setdefault(key, {})
+        container[path[-1]] = value
+    return data
+
+
+class BackupEngine():
+    """Compressed full backups followed by compressed deltas against previous backup
+    Files: <timestamp>.full.gz, <timestamp>.delta.gz and legacy <timestamp> json files"""
+
+    def __init__(self, directory: str, clock: Clock = None):
+        self.directory = directory
+        self.clock = clock if clock != None else Clock()
+        self.lock = threading.Lock()
+        self.prints = None
+        self.last = None
+
+    def points(self):
+        "Sorted list of (timestamp, kind)"
+        if not os.path.exists(self.directory):
+            return []
+        points = []
+        for name in os.listdir(self.directory):
+            parts = name.split(".")
+            if not parts[0].isdigit():
+                continue
+            if len(parts) == 1:
+                points.append((int(parts[0]), "legacy"))
+            elif len(parts) == 3 and parts[1] in ["full", "delta"] and parts[2] == "gz":
+                points.append((int(parts[0]), parts[1]))
+        return sorted(points)
+
+    def path(self, timestamp: int, kind: str):
+        if kind == "legacy":
+            return os.path.join(self.directory, str(timestamp))
+        return os.path.join(self.directory, f"{timestamp}.{kind}.gz")
+
+    def read(self, timestamp: int, kind: str):
+        if kind == "legacy":
+            return read_snapshot(self.path(timestamp, kind))
+        with open(self.path(timestamp, kind), "rb") as f:
+            return json.loads(gzip.decompress(f.read()), object_hook=jsonKeys2int)
+
+    def write(self, timestamp: int, kind: str, payload: dict):
+        "Write compressed payload through temporary file, returns size in bytes"
+        path = self.path(timestamp, kind)
+        content = gzip.compress(json.dumps(
+            payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with open(path + ".tmp", "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        fsync_dir(path)
+        return len(content)
+
+    def create(self, data: dict, retention: dict, chain: int):
+        "Save backup of data (snapshot), delta if possible, then apply retention"
+        with self.lock:
+            start = time.perf_counter()
+            if not os.path.exists(self.directory):
+                os.mkdir(self.directory)
+
+            points = self.points()
+            timestamp = int(self.clock.time())
+            if points != [] and timestamp <= points[-1][0]:
+                timestamp = points[-1][0] + 1
+
+            parts = units(data)
+            prints = {path: fingerprint(value)
+                      for path, value in parts.items()}
+            if self.prints is None and points != []:
+                self.prints = {path: fingerprint(value) for path, value in units(
+                    self._restore(points, points[-1][0])).items()}
+
+            deltas = 0
+            for _, kind in reversed(points):
+                if kind != "delta":
+                    break
+                deltas += 1
+
+            if points == [] or deltas >= chain:
+                kind = "full"
+                size = self.write(timestamp, kind, data)
+            else:
+                kind = "delta"
+                size = self.write(timestamp, kind, make_delta(
+                    points[-1][0], self.prints, prints, parts))
+            self.prints = prints
+
+            self.prune(retention)
+            self.last = {
+                "timestamp": timestamp,
+                "kind": kind,
+                "size": size,
+                "duration": time.perf_counter() - start
+            }
+            return self.last
+
+    def keep(self, points: list, retention: dict):
+        "Timestamps kept by retention: newest `latest` points and newest point of each hour, day and week tier"
+        timestamps = [timestamp for timestamp, _ in reversed(points)]
+        keep = set(timestamps[:max(retention["latest"], 1)])
+        for tier, seconds in [("hourly", 3600), ("daily", 86400), ("weekly", 604800)]:
+            buckets = set()
+            for timestamp in timestamps:
+                bucket = timestamp // seconds
+                if bucket in buckets:
+                    continue
+                if len(buckets) >= retention[tier]:
+                    break
+                buckets.add(bucket)
+                keep.add(timestamp)
+        return keep
+
+    def prune(self, retention: dict):
+        "Delete points outside retention, deltas depending on deleted points are rebased"
+        points = self.points()
+        keep = self.keep(points, retention)
+        if len(keep) == len(points):
+            return
+
+        # Replay starts at the full backup of the chain holding the first deleted point
+        start = min(i for i, (timestamp, _) in enumerate(points)
+                    if timestamp not in keep)
+        while points[start][1] == "delta":
+            start -= 1
+
+        state = None
+        kept = None
+        last_kept = None
+        previous_deleted = False
+        for timestamp, kind in points[start:]:
+            if timestamp not in keep and not previous_deleted and kept is not None:
+                # State still belongs to last kept point, remember it as new base
+                last_kept = (kept, {path: fingerprint(value)
+                                    for path, value in units(state).items()})
+
+            if kind == "delta":
+                state = apply_delta(state, self.read(timestamp, kind))
+            else:
+                state = self.read(timestamp, kind)
+
+            if timestamp not in keep:
+                logging.info(f"Deleting backup {timestamp}")
+                previous_deleted = True
+                continue
+
+            if previous_deleted and kind == "delta":
+                if last_kept is None:
+                    self.write(timestamp, "full", state)
+                    os.remove(self.path(timestamp, "delta"))
+                else:
+                    parts = units(state)
+                    prints = {path: fingerprint(value)
+                              for path, value in parts.items()}
+                    self.write(timestamp, "delta", make_delta(
+                        last_kept[0], last_kept[1], prints, parts))
+                logging.info(f"Backup {timestamp} rebased")
+            kept = timestamp
+            previous_deleted = False
+
+        for timestamp, kind in points:
+            if timestamp not in keep:
+                os.remove(self.path(timestamp, kind))
+
+    def _restore(self, points: list, timestamp: int):
+        index = [t for t, _ in points].index(timestamp)
+        start = index
+        while points[start][1] == "delta":
+            start -= 1
+        data = self.read(*points[start])
+        for point in points[start + 1:index + 1]:
+            delta = self.read(*point)
+            apply_delta(data, delta)
+        return data
+
+    def restore(self, timestamp: int):
+        "Rebuild config of backup from nearest full backup and following deltas"
+        with self.lock:
+            points = self.points()
+            if timestamp not in [t for t, _ in points]:
+                raise KeyError(timestamp)
+            return self._restore(points, timestamp)
@@ -0,0 +1,135 @@
+import functools
+
+import numpy as np
+
+# Rules of attack, the only place where they are defined
+# Works elementwise on arrays, so one real battle and millions of simulated ones run the same code
+
+ROUNDS = 3
+OUTCOMES = ["won", "lost", "tie", "out of rolls"]
+
+rng = np.random.default_rng()
+
+
+def fight(player, enemy, player_support, enemy_support, generator: np.random.Generator = None):
+    """Surviving (player, enemy) armies, every argument is int or array of ints
+    Supports roll first, then both armies roll up to ROUNDS times while both are alive"""
+    generator = rng if generator == None else generator
+
+    player, enemy = np.asarray(player), np.asarray(enemy)
+    shape = np.broadcast(player, enemy).shape
+
+    def roll(high):
+        "Uniform integers from 0 to high (inclusive), like random.randint(0, high) for each battle"
+        return generator.integers(0, np.maximum(high, 0) + 1, size=shape)
+
+    enemy = np.maximum(enemy - roll(player_support), 0)
+    player = np.maximum(player - roll(enemy_support), 0)
+
+    for _ in range(ROUNDS):
+        alive = (player > 0) & (enemy > 0)
+        before = enemy
+        enemy = np.where(alive, np.maximum(enemy - roll(player), 0), enemy)
+        # Enemy rolls with what is left, or with whole army if it was wiped out in this round
+        enemy_roll = roll(np.where(enemy > 0, enemy, before))
+        player = np.where(alive, np.maximum(player - enemy_roll, 0), player)
+
+    return player, enemy
+
+
+def outcome(player, enemy):
+    "Index to OUTCOMES of surviving armies"
+    return np.select([(player > 0) & (enemy == 0), (player == 0) & (enemy > 0), (player == 0) & (enemy == 0)], [0, 1, 2], 3)
+
+
+def odds(player_manpower: int, enemy_manpower: int, player_support: int = 0, enemy_support: int = 0, trials: int = 100000, generator: np.random.Generator = None):
+    "Monte Carlo estimate of outcome probabilities and expected casualties"
+    player, enemy = fight(np.full(trials, player_manpower), np.full(
+        trials, enemy_manpower), player_support, enemy_support, generator)
+    counts = np.bincount(outcome(player, enemy), minlength=len(OUTCOMES))
+    return {
+        "trials": trials,
+        "probabilities": {name: int(count) / trials for name, count in zip(OUTCOMES, counts)},
+        "player_casualties": player_manpower - float(player.mean()),
+        "enemy_casualties": enemy_manpower - float(enemy.mean())
+    }
+
+
+def terminal(player, enemy):
+    "Outcome indicators followed by surviving armies, last axis has len(OUTCOMES) + 2 values"
+    index = outcome(player, enemy)
+    values = np.zeros(player.shape + (len(OUTCOMES) + 2,))
+    for i in range(len(OUTCOMES)):
+        values[..., i] = index == i
+    values[..., -2] = player
+    values[..., -1] = enemy
+    return values
+
+
+def window(prefix, rows, columns, count):
+    """Sums of values[max(row - s, 0), column] for s in 0..count-1, from prefix sums over rows
+    prefix[i, column] is sum of values[:i, column], rows below zero are clamped to row 0"""
+    low = np.maximum(rows - count + 1, 0)
+    first = prefix[1, columns] - prefix[0, columns]
+    return prefix[rows + 1, columns] - prefix[low, columns] + np.maximum(count - rows - 1, 0)[..., None] * first
+
+
+def rounds(values, player, enemy):
+    "Add one round of exchanges to table values[player, enemy]"
+    players = values.shape[0]
+    prefix = np.concatenate(
+        [np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+
+    # Enemy survived player roll with e1 = enemy, rolls from 0 to e1
+    survived = window(prefix, player, enemy, enemy + 1) / \
+        (enemy + 1)[..., None]
+    # Enemy was wiped out, rolls from 0 to its army before the round
+    wiped = window(prefix, player, np.zeros_like(enemy),
+                   enemy + 1) / (enemy + 1)[..., None]
+
+    # Player rolls r from 0 to p, enemy keeps e1 = e - r for r < e and is wiped out for the rest
+    survived[:, 0] = 0
+    cumulative = np.concatenate(
+        [np.zeros((players, 1, values.shape[2])), np.cumsum(survived, axis=1)], axis=1)
+    low = enemy - np.minimum(player, enemy - 1)
+    rows = np.arange(players)[:, None]
+    kept = cumulative[rows, enemy + 1] - cumulative[rows, np.maximum(low, 0)]
+    result = (kept + np.maximum(player - enemy + 1, 0)
+              [..., None] * wiped) / (player + 1)[..., None]
+
+    ended = (player == 0) | (enemy == 0)
+    return np.where(ended[..., None], terminal(player, enemy), result)
+
+
+@functools.lru_cache(maxsize=256)
+def exact(player_manpower: int, enemy_manpower: int, player_support: int = 0, enemy_support: int = 0):
+    """Exact outcome probabilities and expected casualties
+    Dynamic programming over table of (player, enemy) states, one pass per round, cost is O(player_manpower * enemy_manpower)"""
+    player, enemy = np.meshgrid(np.arange(player_manpower + 1),
+                                np.arange(enemy_manpower + 1), indexing="ij")
+    values = terminal(player, enemy)
+    for _ in range(ROUNDS):
+        values = rounds(values, player, enemy)
+
+    # Armies after support rolls are independent and uniform
+    player_start = np.zeros(player_manpower + 1)
+    np.add.at(player_start, np.maximum(player_manpower -
+              np.arange(max(enemy_support, 0) + 1), 0), 1 / (max(enemy_support, 0) + 1))
+    enemy_start = np.zeros(enemy_manpower + 1)
+    np.add.at(enemy_start, np.maximum(enemy_manpower -
+              np.arange(max(player_support, 0) + 1), 0), 1 / (max(player_support, 0) + 1))
+    expected = np.einsum("p,e,pev->v", player_start, enemy_start, values)
+
+    return {
+        "trials": None,
+        "probabilities": {name: float(expected[i]) for i, name in enumerate(OUTCOMES)},
+        "player_casualties": player_manpower - float(expected[-2]),
+        "enemy_casualties": enemy_manpower - float(expected[-1])
+    }
+
+
+def solve(player_manpower: int, enemy_manpower: int, player_support: int = 0, enemy_support: int = 0, states: int = 250000, trials: int = 100000):
+    "Exact result if table of states fits in budget, Monte Carlo estimate (trials is not None) otherwise"
+    if player_manpower < 0 or enemy_manpower < 0 or (player_manpower + 1) * (enemy_manpower + 1) > states:
+        return odds(player_manpower, enemy_manpower, player_support, enemy_support, trials)
+    return exact(player_manpower, enemy_manpower, player_support, enemy_support)
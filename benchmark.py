@@ -0,0 +1,553 @@
+import argparse
+import asyncio
+import difflib
+import gc
+import logging
+import random
+import time
+import timeit
+import tracemalloc
+
+import activities
+import battle
+from auctions import AuctionHouse
+from clock import SimulatedClock
+from derived import derive
+from fuzzy import TrigramIndex
+from loot import LootIndex
+from models import Player, Players
+from scheduler import Scheduler
+from schema import new_player
+from storage import apply_record, snapshot
+from transactions import (PlayerLocks, TransactionError, charge, trade,
+                          transfer)
+
+parser = argparse.ArgumentParser(
+    prog="Trinity benchmarks", description="Offline benchmarks of economy code paths")
+subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+models_parser = subparsers.add_parser(
+    "models", help="Memory per player and work/buy/income hot paths of dict records and Player models")
+models_parser.add_argument("-p", "--players", type=int, default=20000)
+models_parser.add_argument("-n", "--number", type=int, default=200000)
+
+transactions_parser = subparsers.add_parser(
+    "transactions", help="Interleaved transfers and trades, checks that money and items are conserved")
+transactions_parser.add_argument("-p", "--players", type=int, default=50)
+transactions_parser.add_argument("-t", "--transfers", type=int, default=20000)
+transactions_parser.add_argument("-i", "--items", type=int, default=500)
+
+activities_parser = subparsers.add_parser(
+    "activities", help="Expeditions, attacks and work on simulated clock, measures settlement throughput")
+activities_parser.add_argument("-p", "--players", type=int, default=1000)
+activities_parser.add_argument(
+    "-e", "--expeditions", type=int, default=10000)
+activities_parser.add_argument("-a", "--attacks", type=int, default=10000)
+activities_parser.add_argument(
+    "--hours", type=float, default=48, help="Simulated time span")
+
+battle_parser = subparsers.add_parser(
+    "battle", help="Solve time of exact attack odds against army size, compared with Monte Carlo estimate")
+battle_parser.add_argument("-s", "--sizes", type=int, nargs="+",
+                           default=[10, 50, 100, 250, 500, 1000])
+battle_parser.add_argument("-t", "--trials", type=int, default=200000)
+
+fuzzy_parser = subparsers.add_parser(
+    "fuzzy", help="Lookup of misspelled names in trigram index, compared with difflib.get_close_matches")
+fuzzy_parser.add_argument("-s", "--sizes", type=int, nargs="+",
+                          default=[100, 1000, 10000, 100000])
+fuzzy_parser.add_argument("-q", "--queries", type=int, default=200)
+
+auctions_parser = subparsers.add_parser(
+    "auctions", help="Concurrent sealed-bid auctions closed by scheduler on simulated clock, checks that money and items are conserved")
+auctions_parser.add_argument("-p", "--players", type=int, default=1000)
+auctions_parser.add_argument("-a", "--auctions", type=int, default=5000)
+auctions_parser.add_argument("-b", "--bids", type=int, default=200000)
+
+
+def sample_player(index: int):
+    "Player with few upgrades and items, like an active player"
+    player = new_player(1000 + index)
+    player["upgrade"] = {"farm": index % 5, "mine": 1}
+    player["stats"]["stewardship"] = index % 7
+    player["stats"]["bartering"] = index % 3
+    for name, slot in [("sword", "equiped"), ("ring", "equiped"), ("potion", "inventory")]:
+        player[slot][name] = {"description": None, "type": "weapon", "rarity": "common", "income": 10,
+                              "income_percent": 110, "discount": "farm", "discount_percent": 5, "equiped": slot == "equiped"}
+    return player
+
+
+def measure(build, count: int):
+    "Bytes allocated per player by build"
+    gc.collect()
+    tracemalloc.start()
+    players = [build(i) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del players
+    return size / count
+
+
+# region Hot paths, same expressions as Money.user_work, Money.buy_upgrade and Income.income used before and after models
+def work_dict(config, player_id, income):
+    income_multiplier = 1
+    for item in config["players"][player_id]["equiped"]:
+        item = config["players"][player_id]["equiped"][item]
+        income_multiplier = income_multiplier * (item["income_percent"] / 100)
+    income_boost = 0
+    for item in config["players"][player_id]["equiped"]:
+        item = config["players"][player_id]["equiped"][item]
+        income_boost += item["income"]
+    return (income*income_multiplier)+income_boost+(round(config["players"][player_id]["stats"]["stewardship"]*income*0.025, 5))
+
+
+def work_model(config, player_id, income):
+    player = config["players"][player_id]
+    income_multiplier = 1
+    income_boost = 0
+    for item in player.equiped.values():
+        income_multiplier = income_multiplier * (item.income_percent / 100)
+        income_boost += item.income
+    return (income*income_multiplier)+income_boost+(round(player.stats.stewardship*income*0.025, 5))
+
+
+def buy_dict(config, player_id, type):
+    discount = 0
+    for item in config["players"][player_id]["equiped"]:
+        item = config["players"][player_id]["equiped"][item]
+        if item["discount"] != None:
+            if type == item["discount"]:
+                discount += item["discount_percent"]
+    discount = round((discount * 0.01) +
+                     (config["players"][player_id]["stats"]["bartering"]*0.025), 5)
+    generation = config["generations"].get(type, 0)
+    if config["players"][player_id]["generation"].get(type, 0) != generation:
+        owned, limit = 0, config["maxupgrade"].get(type)
+    else:
+        owned = config["players"][player_id]["upgrade"].get(type, 0)
+        limit = config["players"][player_id]["maxupgrade"].get(
+            type, config["maxupgrade"].get(type))
+    cost = 0.001 * (100 - 100 * discount)
+    if (limit == None or owned + 1 <= limit) and config["players"][player_id]["balance"] >= cost:
+        apply_record(config, ("add", player_id, "balance", -cost))
+        apply_record(config, ("upgrade", player_id, type, 1, generation))
+        return True
+    return False
+
+
+def buy_model(config, player_id, type):
+    player = config["players"][player_id]
+    discount = 0
+    for item in player.equiped.values():
+        if item.discount != None:
+            if type == item.discount:
+                discount += item.discount_percent
+    discount = round((discount * 0.01) +
+                     (player.stats.bartering*0.025), 5)
+    generation = config["generations"].get(type, 0)
+    if player.generation.get(type, 0) != generation:
+        owned, limit = 0, config["maxupgrade"].get(type)
+    else:
+        owned = player.upgrade.get(type, 0)
+        limit = player.maxupgrade.get(type, config["maxupgrade"].get(type))
+    cost = 0.001 * (100 - 100 * discount)
+    if (limit == None or owned + 1 <= limit) and player.balance >= cost:
+        apply_record(config, ("add", player_id, "balance", -cost))
+        apply_record(config, ("upgrade", player_id, type, 1, generation))
+        return True
+    return False
+# endregion
+
+
+def benchmark_models(args):
+    dict_size = measure(sample_player, args.players)
+    model_size = measure(lambda i: Player.from_json(
+        sample_player(i)), args.players)
+    print(f"Memory per player: dict {dict_size:.0f} B, Player {model_size:.0f} B ({100 - model_size / dict_size * 100:.1f}% less)")
+
+    records = {i: sample_player(i) for i in range(args.players)}
+    models = {"players": {i: Player.from_json(snapshot(record))
+                          for i, record in records.items()}, "maxupgrade": {}, "generations": {}}
+    dicts = {"players": records, "maxupgrade": {}, "generations": {}}
+    assert all(models["players"][i].to_json() == records[i]
+               for i in records), "Conversion is not lossless"
+    ids = [random.randrange(args.players) for _ in range(1000)]
+
+    for name, with_dict, with_model, argument in [("work/income", work_dict, work_model, 500), ("buy", buy_dict, buy_model, "farm")]:
+        assert all(with_dict(dicts, i, argument) == with_model(
+            models, i, argument) for i in ids)
+        times = []
+        for config, function in [(dicts, with_dict), (models, with_model)]:
+            times.append(min(timeit.repeat(lambda: [function(config, i, argument)
+                                                    for i in ids], number=args.number // 1000, repeat=5)))
+        print(f"{name}: dict {times[0] / args.number * 1e9:.0f} ns, Player {times[1] / args.number * 1e9:.0f} ns ({times[0] / times[1]:.2f}x)")
+
+
+class Ledger():
+    "Change API of Configuration over in-memory players, without storage"
+
+    def __init__(self, players: int, balance: int, **settings):
+        self.config = {"players": Players(
+            {i: new_player(balance) for i in range(players)}, None), "jobs": {}, "income": {}, **settings}
+        self.locks = PlayerLocks()
+        self.loot = LootIndex()
+        self.loot.build(self.config.get("loot-table", {}), {})
+
+    def __getitem__(self, key: str):
+        return self.config[key]
+
+    def save(self, *targets):
+        pass
+
+    def player(self, player: int):
+        return self.config["players"][player]
+
+    def record(self, *record):
+        apply_record(self.config, record)
+
+    def add(self, player: int, field: str, delta):
+        self.record("add", player, field, delta)
+
+    def assign(self, player: int, field: str, value):
+        self.record("assign", player, field, value)
+
+    def add_income(self, role: int, delta):
+        self.record("income", role, delta)
+
+    def item_id(self):
+        self.config["item_id"] = self.config.get("item_id", 0) + 1
+        return self.config["item_id"]
+
+    def list_item(self, player: int, name: str, price=None):
+        self.record("list", player, name, price)
+
+    def put(self, key: str, entry: int, value):
+        self.record("entry", key, entry, value)
+
+    def give_item(self, source: int, target: int, name: str):
+        record = self.config["players"][target]
+        rename = record.inventory.free_name(name, record.equiped)
+        self.record("give", source, target, name, rename)
+        return rename
+
+
+async def naive_transfer(ledger: Ledger, source: int, target: int, amount: int):
+    "Check, await (ctx.send, confirm) and write, like commands did before transactions"
+    if ledger.player(source).balance >= amount:
+        await asyncio.sleep(0)
+        ledger.add(source, "balance", -amount)
+        ledger.add(target, "balance", amount)
+        return True
+    return False
+
+
+async def locked_transfer(ledger: Ledger, source: int, target: int, amount: int):
+    await asyncio.sleep(0)
+    try:
+        async with ledger.locks(source, target):
+            await asyncio.sleep(0)
+            transfer(ledger, source, target, amount)
+        return True
+    except TransactionError:
+        return False
+
+
+async def naive_trade(ledger: Ledger, buyer: int, seller: int, item: str):
+    if item in ledger.player(seller).player_shop:
+        price = ledger.player(seller).player_shop[item]
+        if ledger.player(buyer).balance >= price:
+            await asyncio.sleep(0)
+            ledger.add(buyer, "balance", -price)
+            ledger.add(seller, "balance", price)
+            ledger.player(buyer).inventory[item] = ledger.player(
+                seller).inventory.get(item, {})
+            ledger.player(seller).player_shop.pop(item, None)
+            ledger.player(seller).inventory.pop(item, None)
+            return True
+    return False
+
+
+async def locked_trade(ledger: Ledger, buyer: int, seller: int, item: str):
+    price = ledger.player(seller).player_shop.get(item)
+    if price == None:
+        return False
+    await asyncio.sleep(0)
+    try:
+        async with ledger.locks(buyer, seller):
+            await asyncio.sleep(0)
+            trade(ledger, buyer, seller, item, price, price)
+        return True
+    except TransactionError:
+        return False
+
+
+async def stress(args, do_transfer, do_trade):
+    random.seed(1)
+    ledger = Ledger(args.players, 1000)
+    items = {}
+    for i in range(args.items):
+        seller = random.randrange(args.players)
+        ledger.player(seller).inventory[f"item-{i}"] = {"description": None, "type": "weapon", "rarity": "common",
+                                                        "income": 0, "income_percent": 100, "discount": None, "discount_percent": 0, "equiped": False}
+        ledger.player(seller).player_shop[f"item-{i}"] = 300
+        items[f"item-{i}"] = seller
+    # Some buyers already own an item of the same name, buying must not replace it
+    owners = {}
+    for item, seller in list(items.items())[::5]:
+        owner = random.choice([p for p in range(args.players) if p != seller])
+        ledger.player(owner).inventory[item] = {"description": None, "type": "armor", "rarity": "common",
+                                                "income": 0, "income_percent": 100, "discount": None, "discount_percent": 0, "equiped": False}
+        owners[item] = owner
+    supply = sum(player.balance for player in ledger.config["players"].values())
+
+    jobs = []
+    for _ in range(args.transfers):
+        source, target = random.sample(range(args.players), 2)
+        jobs.append(do_transfer(ledger, source, target, random.randint(1, 400)))
+    for item, seller in items.items():
+        for buyer in random.sample([p for p in range(args.players) if p != seller], 3):
+            jobs.append(do_trade(ledger, buyer, seller, item))
+    random.shuffle(jobs)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - start
+
+    players = ledger.config["players"].values()
+    owned = sum(len(player.inventory) for player in players)
+    print(f"  {len(jobs)} jobs, {sum(results)} succeeded in {elapsed:.3f}s ({len(jobs) / elapsed:.0f} jobs/s)")
+    print(f"  Money supply: {supply} -> {sum(player.balance for player in players)}, negative balances: {sum(player.balance < 0 for player in players)}")
+    kept = sum(ledger.player(owner).inventory.get(item, {}).get("type") == "armor" for item, owner in owners.items())
+    print(f"  Items: {len(items) + len(owners)} -> {owned}, still listed: {sum(len(player.player_shop) for player in players)}, items of the same name kept by their owners: {kept}/{len(owners)}")
+    return supply == sum(player.balance for player in players) and owned == len(items) + len(owners) and kept == len(owners) and all(player.balance >= 0 for player in players)
+
+
+def benchmark_transactions(args):
+    print("Without locks:")
+    asyncio.run(stress(args, naive_transfer, naive_trade))
+    print("With transactions:")
+    assert asyncio.run(stress(args, locked_transfer, locked_trade)
+                       ), "Money or items were not conserved"
+
+
+SETTINGS = {
+    "deltatime": 7200,
+    "work_range": 0.2,
+    "stewardship_rate": 0.025,
+    "bartering_rate": 0.025,
+    "trading_rate": 0.025,
+    "warlord_rate": 0.025,
+    "learning_rate": 0.25,
+    "max_player_items": 30,
+    "allow_attack_income": True,
+    "loot-table": {f"{rarity}-{i}": {"description": None, "type": "weapon", "rarity": rarity, "income": 10, "income_percent": 100, "discount": None, "discount_percent": 0, "equiped": False}
+                   for rarity in ["common", "uncommon", "rare", "epic", "legendary"] for i in range(20)}
+}
+EXPEDITION = {"manpower": 100, "chance": 60, "xp": 100, "loot-table": {
+    "common": 0.5, "uncommon": 0.25, "rare": 0.15, "epic": 0.08, "legendary": 0.02}}
+
+
+async def simulate(args):
+    random.seed(1)
+    clock = SimulatedClock()
+    ledger = Ledger(args.players, 10 ** 9, **SETTINGS)
+    ledger.config["income"][1] = 0
+    for player in range(args.players):
+        ledger.add(player, "manpower", 10 ** 6)
+    manpower = sum(player.manpower for player in ledger.config["players"].values())
+
+    settled = {"expedition": 0, "attack": 0}
+    spent = {"expedition": 0, "attack": 0}
+    survivors = 0
+
+    def timed(kind, settle):
+        def handler(job):
+            nonlocal survivors
+            start = time.perf_counter()
+            result = settle(ledger, job)
+            spent[kind] += time.perf_counter() - start
+            settled[kind] += 1
+            if kind == "attack":
+                survivors += result["player_manpower"]
+            return []
+        return handler
+
+    async def send(job, messages):
+        pass
+
+    scheduler = Scheduler(ledger, send, clock)
+    scheduler.handler("expedition")(
+        timed("expedition", activities.settle_expedition))
+    scheduler.handler("attack")(timed("attack", activities.settle_attack))
+    scheduler.start()
+
+    sent = 0
+    for _ in range(args.expeditions):
+        player = random.randrange(args.players)
+        charge(ledger, player, manpower=EXPEDITION["manpower"])
+        scheduler.schedule("expedition", player, 0, random.uniform(
+            0.5, args.hours) * 3600, mention=False, **EXPEDITION)
+    for _ in range(args.attacks):
+        player = random.randrange(args.players)
+        army = random.randint(1, 5000)
+        sent += army
+        charge(ledger, player, manpower=army)
+        scheduler.schedule("attack", player, 0, random.uniform(0.5, args.hours) * 3600, player_manpower=army, enemy_manpower=random.randint(1, 5000),
+                           player_support=random.randint(0, 500), enemy_support=random.randint(0, 500), mention=False, skip_colonization=True, income=1, income_role=1)
+
+    paid = 0
+
+    async def worker(player: int):
+        "Work as soon as cooldown allows, like a very active player"
+        nonlocal paid
+        while True:
+            if activities.work(ledger, player, derive(ledger.player(player), 500, ledger), clock.time()) != None:
+                paid += 1
+            await clock.sleep(ledger["deltatime"])
+
+    workers = [asyncio.ensure_future(worker(player))
+               for player in range(args.players)]
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await clock.advance(args.hours * 3600)
+    elapsed = time.perf_counter() - start
+    for task in workers + [scheduler.task]:
+        task.cancel()
+
+    print(f"  {args.hours:g}h simulated in {elapsed:.3f}s, {len(scheduler.pending())} jobs still pending")
+    for kind in settled:
+        print(f"  {kind}: {settled[kind]} settled, {settled[kind] / spent[kind]:.0f}/s in settle code" if settled[kind] != 0 else f"  {kind}: none settled")
+    print(f"  work: {paid} payouts ({paid / args.players:.1f} per player, cooldown {ledger['deltatime'] / 3600:g}h)")
+    returned = manpower - sent + survivors
+    return len(scheduler.pending()) == 0 and sum(player.manpower for player in ledger.config["players"].values()) == returned
+
+
+def benchmark_activities(args):
+    logging.disable(logging.INFO)
+    assert asyncio.run(
+        simulate(args)), "Jobs left pending or manpower was not returned"
+
+
+def benchmark_battle(args):
+    for size in args.sizes:
+        armies = (size, size * 4 // 5, size // 10, size // 20)
+        start = time.perf_counter()
+        exact = battle.exact(*armies)
+        solved = time.perf_counter() - start
+        start = time.perf_counter()
+        estimate = battle.odds(*armies, trials=args.trials)
+        sampled = time.perf_counter() - start
+        error = max(abs(exact["probabilities"][name] - estimate["probabilities"][name])
+                    for name in battle.OUTCOMES)
+        print(f"{size:>5} vs {armies[1]:<5} states {(armies[0] + 1) * (armies[1] + 1):>9,}: exact {solved:.3f}s, Monte Carlo {sampled:.3f}s, max difference {error:.4f}, win {exact['probabilities']['won']:.4f}")
+
+
+def misspell(name: str):
+    "Name with one character replaced, dropped or swapped with next one"
+    i = random.randrange(len(name) - 1)
+    return random.choice([name[:i] + random.choice("aeiourstn") + name[i + 1:], name[:i] + name[i + 1:], name[:i] + name[i + 1] + name[i] + name[i + 2:]])
+
+
+def benchmark_fuzzy(args):
+    syllables = [consonant + vowel for consonant in "bcdfghklmnprstvz" for vowel in "aeiou"] + \
+        [consonant + vowel + end for consonant in "bcdfghkl" for vowel in "aeiou" for end in "nrst"]
+    kinds = ["sword", "helmet", "boots", "farm", "mine",
+             "forge", "tower", "ring", "amulet", "shield"]
+    for size in args.sizes:
+        names = set()
+        while len(names) < size:
+            names.add("".join(random.choices(syllables, k=random.randint(2, 3))) +
+                      " " + random.choice(kinds))
+        names = list(names)
+        start = time.perf_counter()
+        index = TrigramIndex(names)
+        built = time.perf_counter() - start
+
+        queries = [(name, misspell(name)) for name in random.sample(
+            names, min(args.queries, size))]
+        start = time.perf_counter()
+        found = sum(name in index.search(query) for name, query in queries)
+        indexed = (time.perf_counter() - start) / len(queries)
+
+        sample = queries[:max(1, min(len(queries), 200000 // size))]
+        start = time.perf_counter()
+        scanned = sum(name in difflib.get_close_matches(query, names)
+                      for name, query in sample)
+        scan = (time.perf_counter() - start) / len(sample)
+        print(f"{size:>7} names: build {built:.3f}s, trigram {indexed * 1000:.3f} ms ({found / len(queries) * 100:.0f}% found), difflib {scan * 1000:.1f} ms ({scanned / len(sample) * 100:.0f}% found)")
+
+
+async def run_auctions(args):
+    random.seed(1)
+    clock = SimulatedClock()
+    ledger = Ledger(args.players, 10 ** 9, auctions={})
+    house = AuctionHouse(ledger, clock)
+
+    async def send(job, messages):
+        pass
+
+    settled = 0
+    winners = 0
+
+    def settle(job):
+        nonlocal settled, winners
+        winners += house.settle(job["args"]["auction"])["winner"] != None
+        settled += 1
+        return []
+
+    scheduler = Scheduler(ledger, send, clock)
+    scheduler.handler("auction")(settle)
+    scheduler.start()
+
+    supply = sum(player.balance for player in ledger.config["players"].values())
+    start = time.perf_counter()
+    for i in range(args.auctions):
+        seller = random.randrange(args.players)
+        ledger.player(seller).inventory[f"relic-{i}"] = {"description": None, "type": "artefact", "rarity": "legendary",
+                                                         "income": 0, "income_percent": 100, "discount": None, "discount_percent": 0, "equiped": False}
+        auction_id, _ = house.open(
+            seller, f"relic-{i}", 100, random.uniform(1, 24) * 3600)
+        scheduler.schedule("auction", seller, 0,
+                           ledger["auctions"][auction_id]["due"] - clock.time(), auction=auction_id)
+    opened = time.perf_counter() - start
+
+    placed = 0
+    start = time.perf_counter()
+    for _ in range(args.bids):
+        try:
+            house.bid(random.randint(1, args.auctions), random.randrange(
+                args.players), random.randint(100, 100000))
+            placed += 1
+        except TransactionError:
+            pass
+    bidding = time.perf_counter() - start
+
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await clock.advance(25 * 3600)
+    closing = time.perf_counter() - start
+    scheduler.task.cancel()
+
+    players = ledger.config["players"].values()
+    owned = sum(len(player.inventory) for player in players)
+    print(f"  {args.auctions} auctions opened in {opened:.3f}s")
+    print(f"  {placed} of {args.bids} bids placed in {bidding:.3f}s ({args.bids / bidding:.0f} bids/s), the rest were below bidder's own bid or from seller")
+    print(f"  {settled} settled in {closing:.3f}s, {winners} with winner, {len(ledger['auctions'])} still open")
+    print(f"  Money supply: {supply} -> {sum(player.balance for player in players)}, items: {args.auctions} -> {owned}")
+    return supply == sum(player.balance for player in players) and owned == args.auctions and ledger["auctions"] == {}
+
+
+def benchmark_auctions(args):
+    logging.disable(logging.INFO)
+    assert asyncio.run(run_auctions(args)), "Auctions left open or money or items were not conserved"
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    {"models": benchmark_models,
+     "transactions": benchmark_transactions,
+     "activities": benchmark_activities,
+     "battle": benchmark_battle,
+     "fuzzy": benchmark_fuzzy,
+     "auctions": benchmark_auctions}[args.benchmark](args)
@@ -0,0 +1,70 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import time
+
+import pytz
+
+TIMEZONE = pytz.timezone('Europe/Prague')
+
+
+class Clock():
+    "Wall clock, everything time driven (work, expeditions, attacks, backups) asks this instead of time module"
+
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.time(), tz=TIMEZONE)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+    async def wait(self, event: asyncio.Event, timeout: float = None):
+        "Wait for event or timeout (seconds of this clock), returns True if event was set"
+        if timeout == None:
+            await event.wait()
+            return True
+        waiter = asyncio.ensure_future(event.wait())
+        sleeper = asyncio.ensure_future(self.sleep(timeout))
+        try:
+            await asyncio.wait([waiter, sleeper], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            sleeper.cancel()
+        return event.is_set()
+
+
+class SimulatedClock(Clock):
+    """Clock that only moves when advanced, for benchmarks and load tests
+    Sleepers wake up in order of their due time, each with time set to its due time"""
+
+    def __init__(self, start: float = None):
+        self.current = time.time() if start == None else start
+        self.sleepers = []
+        self.counter = itertools.count()
+
+    def time(self):
+        return self.current
+
+    def sleep(self, seconds: float):
+        "Awaitable future, registered right away so advance can not skip over it"
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.sleepers, (self.current +
+                       max(seconds, 0), next(self.counter), future))
+        return future
+
+    async def advance(self, seconds: float):
+        "Move time forward, waking every sleeper due on the way"
+        target = self.current + seconds
+        while self.sleepers != [] and self.sleepers[0][0] <= target:
+            due, _, future = heapq.heappop(self.sleepers)
+            self.current = max(self.current, due)
+            if future.done():
+                continue
+            future.set_result(None)
+            # Let woken tasks run (and register new sleepers) before time moves on
+            for _ in range(5):
+                await asyncio.sleep(0)
+        self.current = target
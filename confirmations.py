@@ -0,0 +1,139 @@
+import asyncio
+import logging
+
+import discord
+
+YES = "✅"
+NO = "❌"
+
+
+class TimingWheel():
+    """Deadlines in circular buckets of ticks, advancing costs O(ticks passed + expired)
+    Deadline further than one turn of wheel stays in its bucket until its tick comes"""
+
+    def __init__(self, slots: int = 64, current: int = 0):
+        self.buckets = [{} for _ in range(slots)]
+        self.slot = {}
+        self.current = current
+
+    def __len__(self):
+        return len(self.slot)
+
+    def add(self, key, deadline: int):
+        deadline = max(deadline, self.current + 1)
+        bucket = deadline % len(self.buckets)
+        self.buckets[bucket][key] = deadline
+        self.slot[key] = bucket
+
+    def remove(self, key):
+        bucket = self.slot.pop(key, None)
+        if bucket != None:
+            del self.buckets[bucket][key]
+
+    def advance(self, tick: int):
+        "Keys with deadline up to tick, each bucket is visited at most once"
+        expired = []
+        for current in range(self.current + 1, min(tick, self.current + len(self.buckets)) + 1):
+            bucket = self.buckets[current % len(self.buckets)]
+            for key in [key for key, deadline in bucket.items() if deadline <= tick]:
+                del bucket[key]
+                del self.slot[key]
+                expired.append(key)
+        self.current = max(self.current, tick)
+        return expired
+
+
+class Prompt():
+    "Confirmation waiting for reaction of author"
+    __slots__ = ("message", "author", "future", "started")
+
+    def __init__(self, message, author: int, future, started: float):
+        self.message = message
+        self.author = author
+        self.future = future
+        self.started = started
+
+
+class ConfirmationRegistry():
+    """Pending confirmations by message id, decided from one reaction handler
+    Expired prompts are collected by timing wheel and their messages deleted in bulk"""
+
+    def __init__(self, clock, tick: float = 1):
+        self.clock = clock
+        self.tick = tick
+        self.pending = {}
+        self.wheel = TimingWheel(current=int(clock.time() / tick))
+        self.decided = 0
+        self.timed_out = 0
+        self.latency = 0.0
+
+    async def ask(self, ctx, embed, timeout: int = 20):
+        "Send prompt and wait for decision of author, returns False if it timed out"
+        message = await ctx.send(embed=embed)
+        await message.add_reaction(YES)
+        await message.add_reaction(NO)
+
+        future = asyncio.get_event_loop().create_future()
+        self.pending[message.id] = Prompt(
+            message, ctx.author.id, future, self.clock.time())
+        self.wheel.add(message.id, int(
+            (self.clock.time() + timeout) / self.tick) + 1)
+        return await future
+
+    async def dispatch(self, message_id: int, user_id: int, emoji: str):
+        "Decide prompt on message, returns False if reaction does not belong to any"
+        prompt = self.pending.get(message_id)
+        if prompt == None or user_id != prompt.author or not emoji in [YES, NO]:
+            return False
+
+        del self.pending[message_id]
+        self.wheel.remove(message_id)
+        self.decided += 1
+        self.latency += self.clock.time() - prompt.started
+        try:
+            await prompt.message.delete()
+        except discord.HTTPException:
+            pass
+        if not prompt.future.done():
+            prompt.future.set_result(emoji == YES)
+        return True
+
+    async def expire(self):
+        "Reject prompts whose timeout passed and delete their messages, one request per channel"
+        expired = [self.pending.pop(message_id) for message_id in self.wheel.advance(
+            int(self.clock.time() / self.tick)) if message_id in self.pending]
+        if expired == []:
+            return 0
+
+        channels = {}
+        for prompt in expired:
+            if not prompt.future.done():
+                prompt.future.set_result(False)
+            channels.setdefault(prompt.message.channel, []).append(
+                prompt.message)
+        self.timed_out += len(expired)
+
+        for channel, messages in channels.items():
+            try:
+                if len(messages) > 1 and hasattr(channel, "delete_messages"):
+                    await channel.delete_messages(messages)
+                else:
+                    await messages[0].delete()
+            except discord.HTTPException:
+                # Bulk delete needs manage messages permission, fall back to one by one
+                for message in messages:
+                    try:
+                        await message.delete()
+                    except discord.HTTPException:
+                        pass
+        logging.debug(f"{len(expired)} confirmations timed out")
+        return len(expired)
+
+    def stats(self):
+        "Counters for config-stats"
+        return {
+            "pending": len(self.pending),
+            "decided": self.decided,
+            "timed_out": self.timed_out,
+            "average_latency": self.latency / self.decided if self.decided != 0 else 0
+        }
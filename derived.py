@@ -0,0 +1,93 @@
+import logging
+
+# Values of player which depend only on equipment, talents, roles and role incomes
+# Computed once and kept until one of them changes, instead of on every work, income, buy and manpower
+
+
+class DerivedStats():
+    "Effective income, discounts and manpower boost of player"
+    __slots__ = ("role_income", "multiplier", "boost", "stewardship",
+                 "income", "discounts", "bartering", "trading", "warlord")
+
+    def discount(self, upgrade: str):
+        "Part of upgrade cost which player does not pay (0.05 is 5%)"
+        return self.discounts.get(upgrade, self.bartering)
+
+    def manpower(self, manpower: int):
+        "Manpower boosted by warlord talent"
+        return int(manpower + manpower * self.warlord)
+
+
+def derive(player, role_income, config):
+    "Derived stats of player with role_income (sum of incomes of roles of player), rates are read from config"
+    stats = DerivedStats()
+    stats.role_income = role_income
+    stats.multiplier = 1
+    stats.boost = 0
+    discounts = {}
+    for item in player.equiped.values():
+        stats.multiplier = stats.multiplier * (item.income_percent / 100)
+        stats.boost += item.income
+        if item.discount != None:
+            discounts[item.discount] = discounts.get(
+                item.discount, 0) + item.discount_percent
+
+    stats.stewardship = round(
+        player.stats.stewardship*role_income*config['stewardship_rate'], 5)
+    stats.income = (role_income*stats.multiplier) + \
+        stats.boost+stats.stewardship
+
+    stats.bartering = round(player.stats.bartering*config['bartering_rate'], 5)
+    stats.discounts = {upgrade: round((min(discount, 100) * 0.01) + (player.stats.bartering*config['bartering_rate']), 5)
+                       for upgrade, discount in discounts.items()}
+    stats.trading = player.stats.trading*config['trading_rate']
+    stats.warlord = player.stats.warlord*config['warlord_rate']
+    return stats
+
+
+class StatsCache():
+    """Derived stats by player, entry is dropped when something it was computed from changes
+    Players holding a role are tracked, so change of role income drops only their entries"""
+    RATES = ["stewardship_rate", "bartering_rate",
+             "trading_rate", "warlord_rate"]
+
+    def __init__(self, config):
+        self.config = config
+        self.stats = {}
+        self.roles = {}
+        self.holders = {}
+
+    def get(self, player: int):
+        stats = self.stats.get(player)
+        if stats == None:
+            stats = self.stats[player] = self.compute(player)
+        return stats
+
+    def compute(self, player: int):
+        member = self.config.directory.member(player)
+        roles = [role.id for role in member.roles] if member != None else []
+        income = self.config["income"]
+        self.roles[player] = roles
+        for role in roles:
+            self.holders.setdefault(role, set()).add(player)
+        logging.debug(f"Computing derived stats of {player}")
+        return derive(self.config.player(player), sum(income.get(role, 0) for role in roles), self.config)
+
+    def invalidate(self, player: int):
+        "Equipment, talents or roles of player changed"
+        self.stats.pop(player, None)
+        for role in self.roles.pop(player, []):
+            holders = self.holders.get(role)
+            if holders != None:
+                holders.discard(player)
+
+    def invalidate_role(self, role: int):
+        "Income of role changed"
+        for player in list(self.holders.get(role, ())):
+            self.invalidate(player)
+
+    def clear(self):
+        "Rates or whole config changed"
+        self.stats = {}
+        self.roles = {}
+        self.holders = {}
@@ -0,0 +1,133 @@
+import heapq
+
+
+def trigrams(name: str):
+    "Trigrams of lowercased name padded with spaces, so short names and word starts count too"
+    padded = f"  {name.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex():
+    """Names by trigram, lookup touches only names sharing rare trigrams with query
+    Similarity is Dice coefficient of trigram sets"""
+
+    def __init__(self, names=()):
+        self.postings = {}
+        self.grams = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.grams)
+
+    def __contains__(self, name: str):
+        return name in self.grams
+
+    def add(self, name: str):
+        if name in self.grams:
+            return
+        grams = self.grams[name] = trigrams(name)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(name)
+
+    def remove(self, name: str):
+        for gram in self.grams.pop(name, ()):
+            names = self.postings[gram]
+            names.discard(name)
+            if not names:
+                del self.postings[gram]
+
+    def search(self, query: str, limit: int = 3, cutoff: float = 0.3):
+        """Up to limit names most similar to query, best first
+        Postings are read from the rarest, reading stops when names not seen yet cannot beat the found ones"""
+        grams = trigrams(query)
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        seen = set()
+        best = []
+        for read, names in enumerate(postings):
+            # Name not seen yet shares at most the unread trigrams with query
+            unread = len(grams) - read
+            bound = 2 * unread / (len(grams) + unread)
+            if bound < cutoff or (len(best) == limit and bound <= best[0][0]):
+                break
+            names = names - seen if seen else names
+            seen.update(names)
+            for name in names:
+                score = 2 * len(grams & self.grams[name]) / \
+                    (len(grams) + len(self.grams[name]))
+                if score < cutoff:
+                    continue
+                if len(best) < limit:
+                    heapq.heappush(best, (score, name))
+                elif score > best[0][0]:
+                    heapq.heapreplace(best, (score, name))
+        best.sort(key=lambda item: (-item[0], item[1]))
+        return [name for _, name in best]
+
+
+class NameIndexes():
+    """Trigram indexes of names commands take: catalogs (upgrade, loot-table, missions)
+    and slots of players (inventory, equiped, player_shop)
+    Built on first lookup, kept current by change records, dropped when source is replaced"""
+    CATALOGS = ["upgrade", "loot-table", "missions"]
+    SLOTS = ["inventory", "equiped", "player_shop"]
+
+    def __init__(self, config):
+        self.config = config
+        self.indexes = {}
+
+    def index(self, owner, slot: str = None):
+        "Index of catalog (owner is config key) or slot of player (owner is player id)"
+        key = owner if slot == None else (owner, slot)
+        index = self.indexes.get(key)
+        if index == None:
+            names = self.config[owner] if slot == None else getattr(
+                self.config.player(owner), slot)
+            index = self.indexes[key] = TrigramIndex(names.keys())
+        return index
+
+    def match(self, name: str, owner, slot: str = None, limit: int = 3):
+        "Closest names to name, name itself if it exists"
+        index = self.index(owner, slot)
+        if name in index:
+            return [name]
+        return index.search(name, limit)
+
+    def _add(self, key, name: str):
+        if key in self.indexes:
+            self.indexes[key].add(name)
+
+    def _remove(self, key, name: str):
+        if key in self.indexes:
+            self.indexes[key].remove(name)
+
+    def update(self, record):
+        "Apply change record to built indexes"
+        kind = record[0]
+        if kind == "move":
+            _, player, name, source, target = record
+            self._remove((player, source), name)
+            self._add((player, target), name)
+        elif kind == "give":
+            _, source, target, name, *rename = record
+            self._remove((source, "inventory"), name)
+            self._add((target, "inventory"), rename[0] if rename else name)
+        elif kind == "list":
+            _, player, name, price = record
+            if price == None:
+                self._remove((player, "player_shop"), name)
+            else:
+                self._add((player, "player_shop"), name)
+        elif kind == "player":
+            self.drop(record[1])
+
+    def drop(self, owner):
+        "Forget indexes of catalog or player, they are built again on next lookup"
+        if owner in self.CATALOGS:
+            self.indexes.pop(owner, None)
+        else:
+            for slot in self.SLOTS:
+                self.indexes.pop((owner, slot), None)
+
+    def clear(self):
+        self.indexes = {}
@@ -0,0 +1,75 @@
+import re
+
+MENTION = re.compile(r"<@([!&]?)([0-9]+)>")
+
+
+class Directory():
+    """Members and roles of the guild by id, kept current from gateway events
+    Display names are remembered after member leaves, so departed players can still be shown"""
+
+    def __init__(self, names: dict = None):
+        self.members = {}
+        self.roles = {}
+        self.names = names if names != None else {}
+
+    def load(self, guild):
+        "Replace members and roles with current state of guild, returns True if some display name changed"
+        self.members = {member.id: member for member in guild.members}
+        self.roles = {role.id: role for role in guild.roles}
+        changed = False
+        for member in self.members.values():
+            changed = self.rename(member) or changed
+        return changed
+
+    def rename(self, member):
+        "Remember display name of member, returns True if it changed"
+        if self.names.get(member.id) == member.display_name:
+            return False
+        self.names[member.id] = member.display_name
+        return True
+
+    def add_member(self, member):
+        self.members[member.id] = member
+        return self.rename(member)
+
+    def remove_member(self, member):
+        self.members.pop(member.id, None)
+
+    def add_role(self, role):
+        self.roles[role.id] = role
+
+    def remove_role(self, role):
+        self.roles.pop(role.id, None)
+
+    def __contains__(self, member_id: int):
+        return member_id in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    def member(self, member_id: int):
+        return self.members.get(member_id)
+
+    def role(self, role_id: int):
+        return self.roles.get(role_id)
+
+    def name(self, member_id: int):
+        "Display name of member, also of one who already left, None if never seen"
+        member = self.members.get(member_id)
+        return member.display_name if member != None else self.names.get(member_id)
+
+    def mention(self, member_id: int):
+        "Mention of current member, remembered name of departed one"
+        if member_id in self.members:
+            return f"<@{member_id}>"
+        name = self.names.get(member_id)
+        return f"{name} (left)" if name != None else f"<@{member_id}>"
+
+    def resolve(self, text: str):
+        "Id of known member or role mentioned in text, None if text is not such mention"
+        match = MENTION.search(text)
+        if match == None:
+            return None
+        _id = int(match.group(2))
+        known = self.roles if match.group(1) == "&" else self.members
+        return _id if _id in known else None
@@ -0,0 +1,111 @@
+import random
+
+RARITIES = ["common", "uncommon", "rare", "epic", "legendary"]
+
+
+class AliasTable():
+    "Walker's alias method, samples index with probability proportional to its weight in O(1)"
+    __slots__ = ("probability", "alias")
+
+    def __init__(self, weights: list):
+        count = len(weights)
+        total = sum(weights)
+        self.probability = [1.0] * count
+        self.alias = list(range(count))
+        if total <= 0:
+            self.probability = []
+            return
+
+        scaled = [weight * count / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small != [] and large != []:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+
+    def sample(self, generator=random):
+        "Index of weight, None if all weights are zero"
+        if self.probability == []:
+            return None
+        i = int(generator.random() * len(self.probability))
+        return i if generator.random() < self.probability[i] else self.alias[i]
+
+
+def weights(rarities: dict):
+    "Weights of rarities in loot-table of expedition, in percent like the original weighted list"
+    return tuple(int(rarities.get(rarity, 0)*100) for rarity in RARITIES)
+
+
+class LootIndex():
+    """Compiled loot: alias table per expedition weights and names of loot-table items per rarity
+    Loot roll does not depend on size of loot-table"""
+
+    def __init__(self):
+        self.tables = {}
+        self.items = {}
+        self.positions = {}
+
+    def build(self, loot_table: dict, missions: dict):
+        self.items = {}
+        self.positions = {}
+        for name, item in loot_table.items():
+            self.add(name, item["rarity"])
+        for mission in missions.values():
+            self.table(mission["loot-table"])
+
+    def add(self, name: str, rarity: str):
+        if name in self.positions:
+            self.remove(name)
+        names = self.items.setdefault(rarity, [])
+        self.positions[name] = (rarity, len(names))
+        names.append(name)
+
+    def remove(self, name: str):
+        "Swap item with last of its rarity and pop it"
+        if not name in self.positions:
+            return
+        rarity, position = self.positions.pop(name)
+        names = self.items[rarity]
+        last = names.pop()
+        if last != name:
+            names[position] = last
+            self.positions[last] = (rarity, position)
+
+    def table(self, rarities: dict):
+        "Alias table of expedition loot weights, compiled on first use"
+        key = weights(rarities)
+        table = self.tables.get(key)
+        if table == None:
+            table = self.tables[key] = AliasTable(list(key))
+        return table
+
+    def roll(self, rarities: dict, generator=random):
+        "(rarity, item name) of loot, item is None if there is no item of rolled rarity"
+        index = self.table(rarities).sample(generator)
+        if index == None:
+            return None, None
+        names = self.items.get(RARITIES[index])
+        if not names:
+            return RARITIES[index], None
+        return RARITIES[index], names[int(generator.random() * len(names))]
+
+    def simulate(self, rarities: dict, rolls: int):
+        "Counts of (rarity, item name) over rolls, for checking drop rates"
+        generator = random.Random()
+        sample = self.table(rarities).sample
+        names = [self.items.get(rarity, []) for rarity in RARITIES]
+        counts = {}
+        for _ in range(rolls):
+            index = sample(generator)
+            if index == None:
+                drop = (None, None)
+            elif names[index] == []:
+                drop = (RARITIES[index], None)
+            else:
+                drop = (RARITIES[index], names[index][int(
+                    generator.random() * len(names[index]))])
+            counts[drop] = counts.get(drop, 0) + 1
+        return counts
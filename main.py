@@ -2,6 +2,8 @@ import argparse
 import ast
 import asyncio
 import datetime
+import functools
+import itertools
 import json
 import logging
 import os
@@ -12,12 +14,11 @@ import shlex
 import sys
 import time
 import traceback
-import difflib
 import codecs
+import concurrent.futures
 from typing import Union
 
 import discord
-import DiscordUtils
 import pytz
 from discord import NotFound, Status
 from discord.ext import commands, tasks
@@ -28,6 +29,30 @@ from discord.member import Member
 from discord.utils import get
 from pretty_help import PrettyHelp
 
+import activities
+import battle
+from auctions import AuctionHouse
+from backups import BackupEngine
+from clock import Clock
+from confirmations import ConfirmationRegistry
+from derived import StatsCache
+from fuzzy import NameIndexes
+from identity import Directory
+from loot import RARITIES, LootIndex, weights
+from market import Market
+from ranking import FIELDS as RANKED
+from ranking import Ranking
+from pagination import ReactionRouter
+from render import RenderCache
+from models import Player as PlayerModel
+from models import Players
+from scheduler import Scheduler
+from schema import migrate, new_player
+from storage import (STORAGES, apply_record, read_snapshot, refresh_upgrade,
+                     snapshot)
+from transactions import (PlayerLocks, TransactionError, charge, purchase,
+                          trade, transfer)
+
 
 # region Parser
 parser = argparse.ArgumentParser(
@@ -38,6 +63,8 @@ parser.add_argument("-f", "--file", default="bot.log",
                     type=str, help="Filename for logging")
 parser.add_argument("-m", "--mode", default="w",
                     choices=["w", "a"], help="Write or append to file")
+parser.add_argument("-s", "--storage", default="json",
+                    choices=list(STORAGES.keys()), help="Storage backend for configuration")
 parser.add_argument("--token", default=os.environ["TRINITY"], type=str,
                     help="Discord API token: https://discord.com/developers/applications")
 args = parser.parse_args()
@@ -154,15 +181,6 @@ class Value:
 
 
 # region Functions
-def jsonKeys2int(x):
-    if isinstance(x, dict):
-        try:
-            return {int(k): v for k, v in x.items()}
-        except:
-            pass
-    return x
-
-
 def insert_returns(body):
     # insert return stmt if the last expression is a expression statement
     if isinstance(body[-1], ast.Expr):
@@ -187,11 +205,15 @@ def sizeof_fmt(num, suffix='B'):
     return "%.1f%s%s" % (num, 'Yi', suffix)
 
 
+def prague_time(timestamp: float, format: str = r"%H:%M:%S, %d/%m/%Y"):
+    return datetime.datetime.fromtimestamp(timestamp, tz=pytz.timezone('Europe/Prague')).strftime(format)
+
+
 async def levelup_check(ctx: Context):
     logging.debug(f"Triggering levelup_check for {ctx.author.display_name}")
     player = ctx.author
-    xp = config["players"][player.id]["xp"]
-    level = config["players"][player.id]["level"]
+    xp = config.player(player.id).xp
+    level = config.player(player.id).level
 
     xp_for_level = config["xp_for_level"]
     for _ in range(level):
@@ -200,45 +222,42 @@ async def levelup_check(ctx: Context):
     xp_for_level = int(xp_for_level)
 
     if xp >= xp_for_level:
-        config["players"][player.id]["xp"] -= xp_for_level
-        config["players"][player.id]["level"] += 1
-        config["players"][player.id]["skillpoints"] += 1
+        config.add(player.id, "xp", -xp_for_level)
+        config.add(player.id, "level", 1)
+        config.add(player.id, "skillpoints", 1)
         embed = discord.Embed(
             colour=discord.Colour.from_rgb(255, 255, 0),
-            description=f'You are now level `{config["players"][player.id]["level"]}`'
+            description=f'You are now level `{config.player(player.id).level}`'
         )
         embed.set_author(name="Level up", icon_url=bot.user.avatar_url)
         await ctx.send(embed=embed)
         logging.debug(
-            f"{ctx.author.display_name} is now level {config['players'][player.id]['level']}")
+            f"{ctx.author.display_name} is now level {config.player(player.id).level}")
         await levelup_check(ctx)
 
 
-async def confirm(ctx: Context, message: str, timeout: int = 20, author: str = "Confirm"):
-    try:
-        embed = discord.Embed(
-            colour=discord.Colour.from_rgb(255, 255, 0),
-            description=message
-        )
-        embed.set_author(name=author, icon_url=bot.user.avatar_url)
-
-        msg = await ctx.send(embed=embed)
-        await msg.add_reaction("✅")
-        await msg.add_reaction("❌")
+async def closest(ctx: Context, name: str, owner, slot: str = None, where: str = "shop"):
+    """Name if it exists, closest match if author confirms it, name otherwise
+    owner and slot select index, see NameIndexes.index, items of player can be also given by id: #12"""
+    if slot in ["inventory", "equiped"] and re.fullmatch(r"#[0-9]+", name.strip()):
+        named = getattr(config.player(owner), slot).named(int(name.strip()[1:]))
+        return named if named != None else name
+    matches = config.fuzzy.match(name, owner, slot)
+    if matches == [] or matches[0] == name:
+        return name
+    if await confirm(ctx, f"Not found in {where} - closest match: {matches}"):
+        return matches[0]
+    return name
 
-        def check(reaction, user):
-            return user == ctx.message.author and str(reaction.emoji) in ['✅', '❌']
 
-        reaction, _ = await bot.wait_for('reaction_add', timeout=timeout, check=check)
-        if reaction.emoji == '❌':
-            await msg.delete()
-            return False
-        elif reaction.emoji == '✅':
-            await msg.delete()
-            return True
-    except asyncio.TimeoutError:
-        await msg.delete()
-        return False
+async def confirm(ctx: Context, message: str, timeout: int = 20, author: str = "Confirm"):
+    "Ask author to react with ✅ or ❌, False if nothing was chosen in timeout seconds"
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=message
+    )
+    embed.set_author(name=author, icon_url=bot.user.avatar_url)
+    return await confirmations.ask(ctx, embed, timeout)
 # endregion
 
 
@@ -249,35 +268,105 @@ class Configuration():
         logging.info(f"Loading config...")
         try:
             logging.info(
-                f"Loading: {self.CONFIG}")
-            self.config = json.load(
-                open(self.CONFIG, encoding="utf-8"), object_hook=jsonKeys2int)
+                f"Loading: {self.storage.path}")
+            self.config = self.storage.read()
             type(self.config.keys())
-        except:
-            logging.info(traceback.format_exc())
+        except FileNotFoundError:
             logging.info(
-                f"Config is unavailable or protected. Loading fallback...")
-            self.config = self.fallback
+                f"Config is unavailable. Loading fallback...")
+            self.config = snapshot(self.fallback)
             logging.info(f"Fallback loaded")
             try:
                 logging.info(
-                    f"Creating new config file: {self.CONFIG}")
-                self.save()
+                    f"Creating new config file: {self.storage.path}")
+                self.flush_sync(force=True)
             except:
                 logging.info(traceback.format_exc())
                 logging.info(
-                    f"Error writing config file, please check if you have permission to write in this location: {self.CONFIG}")
+                    f"Error writing config file, please check if you have permission to write in this location: {self.storage.path}")
+                return
+        except:
+            logging.error(traceback.format_exc())
+            corrupted = f"{self.storage.path}.corrupt-{int(time.time())}"
+            logging.error(
+                f"Config is corrupted, keeping it as {corrupted}")
+            try:
+                self.storage.close()
+                os.replace(self.storage.path, corrupted)
+            except:
+                logging.error(traceback.format_exc())
+                logging.error(
+                    f"Unable to move corrupted config, please check permissions: {self.storage.path}")
+                self.config = snapshot(self.fallback)
                 return
+            self.config = self.recover()
+            self.flush_sync(force=True)
+        self.clean()
+        if self.migrated > 0:
+            self.save()
         logging.info(f"Config loaded")
 
-    def __init__(self):
+    def recover(self):
+        "Load newest readable backup, or fallback if there is none"
+        for timestamp, _ in reversed(self.backups.points()):
+            try:
+                data = self.backups.restore(timestamp)
+                logging.warning(f"Config recovered from backup {timestamp}")
+                return data
+            except:
+                logging.error(traceback.format_exc())
+                logging.error(f"Backup {timestamp} is not readable")
+        logging.warning(f"No usable backup found. Loading fallback...")
+        return snapshot(self.fallback)
+
+    @property
+    def config(self):
+        return self._config
+
+    @config.setter
+    def config(self, data: dict):
+        "Bring data to current schema and convert players to models"
+        self.migrated = 0
+        if "players" in data:
+            self.migrated = migrate(data)
+            data["players"] = Players(data["players"], self.new_player)
+        self.ranking.build(data.get("players", {}))
+        self.loot.build(data.get("loot-table", {}), data.get("missions", {}))
+        self.directory.names = data.get("names", {})
+        self.stats.clear()
+        self.renders.clear()
+        self.fuzzy.clear()
+        self.market.build(data.get("players", {}))
+        self._config = data
+
+    def __init__(self, storage: str = "json", clock: Clock = None):
         if platform.system() == "Windows":
             self.CONFIG = os.environ["userprofile"] + \
                 "\\.economy"  # Rename this
         else:
             # Rename this ... alternative for linux or Unix based systems
             self.CONFIG = os.path.expanduser("~")+r"/.economy"
+        self.storage = STORAGES[storage](
+            self.CONFIG + STORAGES[storage].extension)
+        self.loot = LootIndex()
+        self.ranking = Ranking()
+        self.directory = Directory()
+        self.stats = StatsCache(self)
+        self.renders = RenderCache()
+        self.fuzzy = NameIndexes(self)
+        self.market = Market()
         self.config = {}
+        self.full = False
+        self.dirty_players = set()
+        self.dirty_keys = set()
+        self.records = []
+        self.saves_requested = 0
+        self.saves_performed = 0
+        self.writer = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="config-writer")
+        self.clock = clock if clock != None else Clock()
+        self.backups = BackupEngine("./backups", self.clock)
+        self.locks = PlayerLocks()
         self.fallback = {
             "income": {},
             "prefix": "-",
@@ -290,6 +379,12 @@ class Configuration():
             "default_role": "",
             "backup_time": 43200,
             "backups": 5,
+            "backups_hourly": 24,
+            "backups_daily": 7,
+            "backups_weekly": 4,
+            "backup_chain": 24,
+            "save_interval": 30,
+            "journal_size": 1048576,
             "work_range": 0,
             "join_dm": "",
             "default_balance": 0,
@@ -299,6 +394,13 @@ class Configuration():
             "allow_attack_income": True,
             "max_player_items": 30,
             "block_asyncs": False,
+            "odds_trials": 200000,
+            "exact_odds_states": 250000,
+            "jobs": {},
+            "names": {},
+            "auctions": {},
+            "item_id": 0,
+            "generations": {},
             "diplomacy_rate": 0.025,
             "warlord_rate": 0.025,
             "intrique_rate": 0.025,
@@ -308,18 +410,274 @@ class Configuration():
             "learning_rate": 0.25,
         }
 
-    def save(self):
+    @property
+    def dirty(self):
+        return self.full or bool(self.dirty_players) or bool(self.dirty_keys) or bool(self.records)
+
+    def clean(self):
+        self.full = False
+        self.dirty_players = set()
+        self.dirty_keys = set()
+        self.records = []
+
+    def write_through(self):
+        "Flush right away if write-behind is disabled"
+        if self.config.get("save_interval", self.fallback["save_interval"]) <= 0:
+            loop = asyncio.get_event_loop()
+            if loop.is_running():
+                loop.create_task(self.flush())
+            else:
+                self.flush_sync()
+
+    def save(self, *targets):
+        """Mark config as dirty, flusher writes it at most once per save_interval
+        Targets are player ids (int) or top level keys (str), without targets everything is written"""
+        self.saves_requested += 1
+        if targets == ():
+            self.full = True
+            self.stats.clear()
+            self.renders.clear()
+            self.fuzzy.clear()
+            # Players may have been edited anywhere in place (set, execute, eval)
+            self.ranking.build(self.config.get("players", {}))
+            self.market.build(self.config.get("players", {}))
+        for target in targets:
+            self.fuzzy.drop(target)
+            if isinstance(target, str):
+                self.dirty_keys.add(target)
+                self.renders.bump(target)
+                if target in StatsCache.RATES + ["income"]:
+                    self.stats.clear()
+            else:
+                self.dirty_players.add(target)
+                # Player was changed in place, equipment or talents may differ
+                self.stats.invalidate(target)
+                self.renders.bump("ranking", ("upgrades", target))
+                self.market.reindex(
+                    target, self.config.get("players", {}).get(target))
+        self.write_through()
+
+    def record(self, *record):
+        "Apply change to config and remember it, so journal can store just the change"
+        apply_record(self.config, record)
+        self.rerank(record)
+        self.restat(record)
+        self.rerender(record)
+        self.fuzzy.update(record)
+        self.market.update(record, self.config["players"])
+        self.records.append(record)
+        self.saves_requested += 1
+        self.write_through()
+
+    def rerank(self, record):
+        "Move player of change record in ranking"
+        kind = record[0]
+        if kind in ["add", "assign"] and record[2] in RANKED:
+            self.ranking.update(
+                record[1], self.config["players"].get(record[1]), [record[2]])
+        elif kind == "player":
+            self.ranking.update(record[1], record[2])
+
+    def restat(self, record):
+        "Drop derived stats computed from what change record changed"
+        kind = record[0]
+        if kind == "move" and "equiped" in record[3:5] or kind == "player":
+            self.stats.invalidate(record[1])
+        elif kind == "income":
+            self.stats.invalidate_role(record[1])
+
+    def rerender(self, record):
+        "Bump render topics of views showing what change record changed"
+        kind = record[0]
+        if kind in ["add", "assign"] and record[2] in RANKED:
+            self.renders.bump("ranking")
+        elif kind == "upgrade":
+            self.renders.bump(("upgrades", record[1]))
+        elif kind == "player":
+            self.renders.bump("ranking", ("upgrades", record[1]))
+        elif kind == "income":
+            self.renders.bump("income")
+        elif kind == "entry":
+            self.renders.bump(record[1])
+
+    def default_player(self):
+        "Record of player who did not change anything yet"
+        return new_player(self["default_balance"])
+
+    def upgrades(self, record: dict, item: str):
+        "Owned count and limit (None is unlimited) of upgrade, resolved against shop catalog"
+        if record["generation"].get(item, 0) != self["generations"].get(item, 0):
+            return 0, self["maxupgrade"].get(item)
+        return record["upgrade"].get(item, 0), record["maxupgrade"].get(item, self["maxupgrade"].get(item))
+
+    def reset_upgrade(self, item: str):
+        """Start counts and limits of upgrade again from 0 and catalog limit, call when item is added or removed
+        Only catalog generation of item changes, entries of players from older generation are ignored by upgrades
+        and dropped when player buys the item again"""
+        generations = self["generations"]
+        generations[item] = generations.get(item, 0) + 1
+        self.save("generations")
+
+    def refresh_upgrade(self, player: int, item: str):
+        "Drop entries of upgrade from older generation before they are written directly (set)"
+        refresh_upgrade(self.config["players"][player],
+                        item, self["generations"].get(item, 0))
+
+    def player(self, player: int):
+        "Player record for reading, players without record get defaults and are not stored"
+        record = self.config["players"].get(player)
+        return record if record != None else PlayerModel.from_json(self.default_player())
+
+    def new_player(self, player: int):
+        "Store record of player, called on first change of virtual player"
+        logging.info(f"Creating record of player {player}")
+        self.record("player", player, self.default_player())
+
+    def add(self, player: int, field: str, delta):
+        if delta != 0:
+            self.record("add", player, field, delta)
+
+    def assign(self, player: int, field: str, value):
+        self.record("assign", player, field, value)
+
+    def upgrade(self, player: int, item: str, count: int):
+        self.record("upgrade", player, item, count,
+                    self["generations"].get(item, 0))
+
+    def move_item(self, player: int, name: str, source: str, target: str):
+        self.record("move", player, name, source, target)
+
+    def give_item(self, source: int, target: int, name: str):
+        "Move item from inventory of source to inventory of target player, returns its name there (copy name if it is taken)"
+        record = self.config["players"][target]
+        rename = record.inventory.free_name(name, record.equiped)
+        self.record("give", source, target, name, rename)
+        return rename
+
+    def item_id(self):
+        "Id for new item, ids are never reused"
+        self.config["item_id"] = self["item_id"] + 1
+        self.save("item_id")
+        return self.config["item_id"]
+
+    def list_item(self, player: int, name: str, price=None):
+        "List item in player shop, price None removes listing"
+        self.record("list", player, name, price)
+
+    def add_income(self, role: int, delta):
+        self.record("income", role, delta)
+
+    def put(self, key: str, entry: int, value):
+        "Replace one job or auction (value None removes it), only the entry is written instead of whole key"
+        self.record("entry", key, entry, value)
+
+    def changes(self, force: bool = False):
+        "Snapshot unsaved changes as (write function, *arguments) and mark config as clean"
+        # Storage that can neither append records nor write part of config writes whole config
+        journal = hasattr(self.storage, "append")
+        compact = journal and self.storage.size >= self.config.get(
+            "journal_size", self.fallback["journal_size"])
+        if force or self.full or compact or not (journal or hasattr(self.storage, "write_partial")):
+            job = (self.storage.write, snapshot(self.config))
+        elif journal:
+            # Entries are live objects, so like players they are copied once per flush
+            entries = {record[1:3] for record in self.records if record[0] == "entry"}
+            records = [record for record in self.records if record[0] != "entry"] + [
+                ("player", player, snapshot(self.config["players"].get(player))) for player in self.dirty_players] + [
+                ("key", key, snapshot(self.config[key])) for key in self.dirty_keys if key in self.config] + [
+                ("entry", key, entry, snapshot(self.config[key].get(entry))) for key, entry in entries if not key in self.dirty_keys]
+            job = (self.storage.append, records)
+        else:
+            players = set(self.dirty_players)
+            keys = set(self.dirty_keys)
+            entries = set()
+            parts = set()
+            for record in self.records:
+                kind = record[0]
+                if kind == "income":
+                    keys.add("income")
+                elif kind == "entry":
+                    entries.add(record[1:3])
+                elif kind in ["add", "assign"]:
+                    parts.add((record[1], "field", record[2]))
+                elif kind == "upgrade":
+                    parts.add((record[1], "upgrade", record[2]))
+                elif kind == "move":
+                    parts.update([(record[1], record[3], record[2]),
+                                  (record[1], record[4], record[2])])
+                elif kind == "give":
+                    parts.update([(record[1], "inventory", record[3]),
+                                  (record[2], "inventory", record[4] if len(record) > 4 else record[3])])
+                elif kind == "list":
+                    parts.add((record[1], "player_shop", record[2]))
+                else:
+                    players.add(record[1])
+            values = {}
+            for part in parts:
+                if not part[0] in players:
+                    try:
+                        values[part] = self.part(*part)
+                    except KeyError:
+                        players.add(part[0])
+            job = (self.storage.write_partial, {player: snapshot(self.config["players"].get(player)) for player in players}, {
+                   key: snapshot(self.config[key]) for key in keys if key in self.config}, {
+                   (key, entry): snapshot(self.config[key].get(entry)) for key, entry in entries if not key in keys}, {
+                   part: value for part, value in values.items() if not part[0] in players})
+        self.clean()
+        return job
+
+    def part(self, player: int, section: str, name: str):
+        """Current value of one part of player changed by records, written by storage as one row
+        field: value of field, upgrade: {"count", "max", "generation"} present for item or None,
+        inventory, equiped: item or None, player_shop: price or None
+        KeyError if player or field is gone and player has to be written whole"""
+        record = self.config["players"].get(player)
+        if record == None:
+            raise KeyError(player)
+        if section == "field":
+            return snapshot(record[name])
+        if section == "upgrade":
+            value = {key: snapshot(values[name]) for key, values in [
+                ("count", record.upgrade), ("max", record.maxupgrade), ("generation", record.generation)] if name in values}
+            return value if value != {} else None
+        if section == "player_shop":
+            return record.player_shop.get(name)
+        return snapshot(record[section].get(name))
+
+    async def flush(self, force: bool = False):
+        "Write config to disk in writer thread if there are unsaved changes"
+        if not self.dirty and not force:
+            return False
+        job = self.changes(force)
+        try:
+            await asyncio.get_event_loop().run_in_executor(self.writer, *job)
+            self.saves_performed += 1
+            logging.debug("Config saved")
+            return True
+        except:
+            self.full = True
+            logging.info(traceback.format_exc())
+            logging.info(f"Unable to save data to {self.storage.path}")
+            return False
+
+    def flush_sync(self, force: bool = False):
+        "Blocking version of flush, for use outside of the event loop"
+        if not self.dirty and not force:
+            return False
+        job = self.changes(force)
         try:
-            with open(self.CONFIG, "w", encoding="utf-8") as f:
-                json.dump(self.config, f, indent=4,
-                          sort_keys=True, ensure_ascii=False)
+            job[0](*job[1:])
+            self.saves_performed += 1
             logging.debug("Config saved")
+            return True
         except:
+            self.full = True
             logging.info(traceback.format_exc())
-            logging.info(f"Unable to save data to {self.CONFIG}")
+            logging.info(f"Unable to save data to {self.storage.path}")
+            return False
 
     def json_str(self):
-        return json.dumps(self.config)
+        return json.dumps(snapshot(self.config))
 
     def __repr__(self):
         return self.config
@@ -332,20 +690,45 @@ class Configuration():
             logging.info(
                 f"{name} not found in config, trying to get from fallback")
             self.config[name] = self.fallback[name]
-            self.save()
+            self.save(name)
             return self.fallback[name]
 
     def __setitem__(self, key: str, val):
         logging.debug(f"Setting {key} to {val}")
+        if key == "players":
+            val = Players(val, self.new_player)
         self.config[key] = val
+        if key == "players":
+            self.full = True
+            self.ranking.build(val)
+            self.stats.clear()
+            self.renders.clear()
+            self.fuzzy.clear()
+            self.market.build(val)
+        else:
+            self.dirty_keys.add(key)
+            self.renders.bump(key)
+            self.fuzzy.drop(key)
+        if key == "names":
+            self.directory.names = val
+        if key in StatsCache.RATES + ["income"]:
+            self.stats.clear()
+        if key in ["loot-table", "missions"]:
+            self.loot.build(self.config.get("loot-table", {}),
+                            self.config.get("missions", {}))
 
     def __delitem__(self, key: str):
         logging.debug(f"Deleting {key} from config")
         self.config.pop(key)
+        self.full = True
+        self.renders.bump(key)
+        self.fuzzy.drop(key)
 
 
 # region Initialize
-config = Configuration()
+# Replace with clock.SimulatedClock to fast-forward time driven features
+clock = Clock()
+config = Configuration(args.storage, clock)
 config.load()
 
 paused = False
@@ -353,204 +736,111 @@ paused = False
 bot = commands.Bot(command_prefix=commands.when_mentioned_or(config["prefix"]), help_command=PrettyHelp(
     color=discord.Colour.from_rgb(255, 255, 0), show_index=True, sort_commands=True, dm_help=None), intents=intents)
 
-members = list(config["players"].keys())
-roles = list(config["income"].keys())
+# Members and roles by id, kept current by events below
+directory = config.directory
 
 btime = config["backup_time"]
-asyncs_on_hold = []
 
 
-@tasks.loop(seconds=btime)
-async def backup():
-    logging.debug("Starting backup")
-    if not os.path.exists("./backups"):
-        os.mkdir("./backups")
-
-    files = os.listdir("./backups")
-    logging.debug(f"Backup files: {files}")
-
-    if not files == []:
-        files = [int(x) for x in files]
-        files.sort(reverse=True)
-        if len(files) >= config["backups"]:
-            logging.info(f"Deleting {files[-1]}")
-            os.remove("./backups/"+str(files[-1]))
-            try:
-                logging.info("Saving backup")
-                with open("./backups/"+str(int(time.time())), "w") as f:
-                    json.dump(config.config, f, indent=4)
-            except:
-                logging.info(traceback.format_exc())
-                logging.info(f"Unable to save data to {config.CONFIG}")
+async def send_job(job: dict, messages: list):
+    "Send results of settled job to channel where it was started"
+    channel = bot.get_channel(job["channel"])
+    if channel == None:
+        channel = await bot.fetch_channel(job["channel"])
+    for message in messages:
+        if isinstance(message, discord.Embed):
+            await channel.send(embed=message)
         else:
-            try:
-                logging.info("Saving backup")
-                with open("./backups/"+str(int(time.time())), "w") as f:
-                    json.dump(config.config, f, indent=4)
-            except:
-                logging.info(traceback.format_exc())
-                logging.info(f"Unable to save data to {config.CONFIG}")
-    else:
-        try:
-            logging.info("Saving backup")
-            with open("./backups/"+str(int(time.time())), "w") as f:
-                json.dump(config.config, f, indent=4)
-        except:
-            logging.info(traceback.format_exc())
-            logging.info(f"Unable to save data to {config.CONFIG}")
-
-backup.start()
-# endregion
+            await channel.send(message)
 
+scheduler = Scheduler(config, send_job, clock)
+paginators = ReactionRouter(clock)
+confirmations = ConfirmationRegistry(clock)
+auctions = AuctionHouse(config, clock)
+auctions.load()
 
-# region Events
-@bot.event
-async def on_ready():
-    logging.info(
-        f'Initialized:{bot.user} - {bot.user.id}')
 
+@tasks.loop(seconds=btime)
+async def backup():
+    logging.debug("Starting backup")
+    retention = {
+        "latest": config["backups"],
+        "hourly": config["backups_hourly"],
+        "daily": config["backups_daily"],
+        "weekly": config["backups_weekly"]
+    }
     try:
-        config["loot-table"]
+        logging.info("Saving backup")
+        info = await asyncio.get_event_loop().run_in_executor(
+            None, config.backups.create, snapshot(config.config), retention, config["backup_chain"])
+        logging.info(
+            f"Backup {info['timestamp']} saved: {info['kind']}, {sizeof_fmt(info['size'])} in {info['duration']:.3f}s")
     except:
-        config["loot-table"] = {}
-        logging.info(f"Config: loot-table => config")
+        logging.info(traceback.format_exc())
+        logging.info(f"Unable to save backup of {config.storage.path}")
 
-    for member in bot.guilds[0].members:
-        if not member.id in config["players"]:
-            members.append(member.id)
-            logging.info(
-                f"Added {member.display_name} as {member.id}")
-            logging.debug(
-                f"Initializing config files for {member.display_name}")
-            config["players"][member.id] = {}
-            config["players"][member.id]["balance"] = config["default_balance"]
-            config["players"][member.id]["last-work"] = 0
-            config["players"][member.id]["xp"] = 0
-            config["players"][member.id]["level"] = 1
-            config["players"][member.id]["manpower"] = 0
-            config["players"][member.id]["upgrade"] = {}
-            config["players"][member.id]["maxupgrade"] = {}
-            config["players"][member.id]["player_shop"] = {}
-            config["players"][member.id]["stats"] = {
-                "diplomacy": 0,
-                "warlord": 0,
-                "intrique": 0,
-                "stewardship": 0,
-                "trading": 0,
-                "bartering": 0,
-                "learning": 0
-            }
-            logging.debug(
-                f"Config files for {member.display_name} initialized")
+backup.start()
 
-            for item in list(config["upgrade"].keys()):
-                logging.info(
-                    f"Added {item} to {member.display_name}")
-                config["players"][member.id]["upgrade"][item] = 0
-                config["players"][member.id]["maxupgrade"][item] = config["maxupgrade"][item]
 
-        try:
-            config["players"][member.id]["balance"]
-        except:
-            config["players"][member.id]["balance"] = config["default_balance"]
-            logging.info(f"Config: balance => {member.name}({member.id})")
+last_flush = clock.time()
 
-        try:
-            config["missions"]
-        except:
-            config["missions"] = {}
-            logging.info(f"Config: missions => config")
 
-        try:
-            config["players"][member.id]["last-work"]
-        except:
-            config["players"][member.id]["last-work"] = 0
-            logging.info(f"Config: last-work => {member.name}({member.id})")
+@tasks.loop(seconds=1)
+async def flusher():
+    # save_interval is read on every tick, so change by set or config-load applies right away
+    global last_flush
+    if clock.time() - last_flush >= config["save_interval"]:
+        last_flush = clock.time()
+        await config.flush()
 
-        try:
-            config["players"][member.id]["manpower"]
-        except:
-            config["players"][member.id]["manpower"] = 0
-            logging.info(f"Config: manpower => {member.name}({member.id})")
+flusher.start()
 
-        try:
-            config["players"][member.id]["xp"]
-        except:
-            config["players"][member.id]["xp"] = 0
-            logging.info(f"Config: xp => {member.name}({member.id})")
 
-        try:
-            config["players"][member.id]["skillpoints"]
-        except:
-            config["players"][member.id]["skillpoints"] = 0
-            logging.info(
-                f"Config: skillpoints => {member.name}({member.id})")
+@tasks.loop(seconds=5)
+async def paginator_sweeper():
+    await paginators.sweep()
 
-        try:
-            config["players"][member.id]["level"]
-        except:
-            config["players"][member.id]["level"] = 1
-            logging.info(f"Config: level => {member.name}({member.id})")
+paginator_sweeper.start()
 
-        try:
-            config["players"][member.id]["upgrade"]
-        except:
-            config["players"][member.id]["upgrade"] = {}
-            logging.info(f"Config: upgrade => {member.name}({member.id})")
 
-        try:
-            config["players"][member.id]["maxupgrade"]
-        except:
-            config["players"][member.id]["maxupgrade"] = {}
-            logging.info(
-                f"Config: maxupgrade => {member.name}({member.id})")
+@tasks.loop(seconds=1)
+async def confirmation_expirer():
+    await confirmations.expire()
 
-        try:
-            config["players"][member.id]["player_shop"]
-        except:
-            config["players"][member.id]["player_shop"] = {}
-            logging.info(
-                f"Config: player_shop => {member.name}({member.id})")
+confirmation_expirer.start()
+# endregion
 
-        try:
-            config["players"][member.id]["inventory"]
-        except:
-            config["players"][member.id]["inventory"] = {}
-            logging.info(f"Config: inventory => {member.name}({member.id})")
 
-        try:
-            config["players"][member.id]["equiped"]
-        except:
-            config["players"][member.id]["equiped"] = {}
-            logging.info(f"Config: equiped => {member.name}({member.id})")
+# region Events
+@bot.event
+async def on_ready():
+    logging.info(
+        f'Initialized:{bot.user} - {bot.user.id}')
 
-        try:
-            config["players"][member.id]["stats"]
-        except:
-            config["players"][member.id]["stats"] = {
-                "diplomacy": 0,
-                "warlord": 0,
-                "intrique": 0,
-                "stewardship": 0,
-                "trading": 0,
-                "bartering": 0,
-                "learning": 0
-            }
-            logging.info(f"Config: stats => {member.name}({member.id})")
+    # Players are created on their first change, until then they use defaults
+    added = []
+    if directory.load(bot.guilds[0]):
+        added.append("names")
+    config.renders.bump("members", "roles")
 
-    for role in bot.guilds[0].roles:
-        if not (role.id in roles):
+    for role in directory.roles.values():
+        if not (role.id in config["income"]):
             logging.info(f"{role} added to config")
             config["income"][role.id] = 0
+            added.append("income")
 
-    config.save()
-    logging.info(f"Members: {members}")
+    if added != []:
+        config.save(*added)
+    logging.info(f"Members: {len(directory)}")
     logging.info(
         f"Roles: {list(config['income'].keys())}")
     logging.info(
         f"Upgrades: {list(config['upgrade'].keys())}")
     print(f"\n{'-'*100}\n")
 
+    # Overdue expeditions and attacks are settled right away
+    scheduler.start()
+
     await bot.change_presence(activity=discord.Game(name=f"Try: {config['prefix']}help"), status=Status.online)
 
 
@@ -566,18 +856,29 @@ async def on_message(message):
             await message.channel.send("❌ Paused")
 
 
+@bot.event
+async def on_raw_reaction_add(payload):
+    if not await paginators.dispatch(payload.message_id, payload.user_id, str(payload.emoji)):
+        await confirmations.dispatch(payload.message_id, payload.user_id, str(payload.emoji))
+
+
 @bot.event
 async def on_guild_role_create(role):
+    directory.add_role(role)
+    config.renders.bump("roles")
     config["income"][role.id] = 0
     logging.info(f"New role added: {role.name}")
-    config.save()
+    config.save("income")
 
 
 @bot.event
 async def on_guild_role_delete(role):
-    del config["income"][role.id]
+    directory.remove_role(role)
+    config.renders.bump("roles")
+    config.stats.invalidate_role(role.id)
+    config["income"].pop(role.id, None)
     logging.info(f"Role removed: {role.name}")
-    config.save()
+    config.save("income")
 
 
 @bot.event
@@ -603,37 +904,9 @@ async def on_command_error(ctx, error):
 
 @bot.event
 async def on_member_join(member: discord.Member):
-    if not member.id in config.config["players"]:
-        members.append(member.id)
-        logging.info(
-            f"Added {member.display_name} as {member.id}")
-        config["players"][member.id] = {}
-        config["players"][member.id]["balance"] = config["default_balance"]
-        config["players"][member.id]["last-work"] = 0
-        config["players"][member.id]["manpower"] = 0
-        config["players"][member.id]["skillpoints"] = 0
-        config["players"][member.id]["level"] = 1
-        config["players"][member.id]["xp"] = 0
-        config["players"][member.id]["upgrade"] = {}
-        config["players"][member.id]["maxupgrade"] = {}
-        config["players"][member.id]["player_shop"] = {}
-        config["players"][member.id]["inventory"] = {}
-        config["players"][member.id]["equiped"] = {}
-        config["players"][member.id]["stats"] = {
-            "diplomacy": 0,
-            "warlord": 0,
-            "intrique": 0,
-            "stewardship": 0,
-            "trading": 0,
-            "bartering": 0,
-            "learning": 0
-        }
-
-        for item in config["upgrade"].keys():
-            logging.info(
-                f"Added {item} to {member.display_name}")
-            config.config["players"][member.id]["upgrade"][item] = 0
-            config.config["players"][member.id]["maxupgrade"][item] = config["maxupgrade"][item]
+    if directory.add_member(member):
+        config.save("names")
+    config.renders.bump("members")
     logging.info(
         f"{member.display_name} ■ {member.id} joined")
 
@@ -642,56 +915,436 @@ async def on_member_join(member: discord.Member):
         await channel.send(config["join_dm"])
         logging.info(f"Welcome message sent to {member}")
 
-    config.save()
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    directory.remove_member(member)
+    config.renders.bump("members")
+    config.stats.invalidate(member.id)
+    logging.info(
+        f"{member.display_name} ■ {member.id} left")
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if directory.add_member(after):
+        config.save("names")
+    if before.roles != after.roles:
+        config.stats.invalidate(after.id)
+# endregion
+
+
+# region Scheduled jobs
+@scheduler.handler("expedition")
+def settle_expedition(job: dict):
+    player = job["player"]
+    result = activities.settle_expedition(config, job)
+    messages = ["Mission started"]
+
+    if result["full"]:
+        embed = discord.Embed(
+            colour=discord.Colour.from_rgb(255, 255, 0),
+            description=f"Maximum item limit reached"
+        )
+        embed.set_author(name="Expedition", icon_url=bot.user.avatar_url)
+        messages.append(embed)
+    elif result["success"] and result["item"] == None:
+        embed = discord.Embed(
+            colour=discord.Colour.from_rgb(255, 255, 0),
+            description=f"No item found"
+        )
+        embed.set_author(name="Expedition", icon_url=bot.user.avatar_url)
+        messages.append(embed)
+    elif result["item"] != None:
+        name = result["item"]
+        item = config["loot-table"][name]
+        embed = discord.Embed(
+            title=name, description=item["description"] if item["description"] != None else "", color=rarity.__dict__[item["rarity"]])
+        embed.set_author(
+            name="Item found", icon_url=bot.user.avatar_url)
+        embed.add_field(
+            name="Type", value=item["type"], inline=True)
+        embed.add_field(
+            name="Income", value=item["income"], inline=True) if item["income"] != 0 else None
+        embed.add_field(
+            name="Income %", value=item["income_percent"], inline=True) if item["income_percent"] != 0 else None
+        embed.add_field(
+            name="Discount", value=item["discount"], inline=True) if item["discount"] != 0 else None
+        embed.add_field(
+            name="Discount %", value=item["discount_percent"], inline=True) if item["discount_percent"] != 0 else None
+        embed.add_field(
+            name="Rarity", value=item["rarity"], inline=True)
+        messages.append(embed)
+
+    msg = "✅ Successs" if result["success"] else "❌ Failed"
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=f"<@{player}>´s mission from {prague_time(job['created'], r'%H:%M:%S')}\n\n{msg}".replace(
+            ",", " ")
+    )
+    embed.set_author(name="Expedition", icon_url=bot.user.avatar_url)
+    messages.append(embed)
+
+    if job["args"]["mention"]:
+        messages.append(f"<@{player}>")
+    return messages
+
+
+@scheduler.handler("attack")
+def settle_attack(job: dict):
+    player = job["player"]
+    pstart, estart = job["args"]["player_manpower"], job["args"]["enemy_manpower"]
+    result = activities.settle_attack(config, job)
+    player_manpower, enemy_manpower = result["player_manpower"], result["enemy_manpower"]
+    messages = ["Battle started"]
+
+    if result["income_too_high"]:
+        messages.append("Income too high, ask admin to add it")
+
+    msg = {
+        "out of rolls": "❌ Out of rolls",
+        "won": "✅ You won",
+        "lost": "❌ You lost",
+        "tie": "❓ Tie ❓"
+    }[result["result"]]
+
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=f"<@{player}>´s attack from {prague_time(job['created'], r'%H:%M:%S')}\n\n{msg}\n\n`Before battle:`\n    Your army: {pstart:,}\n    Enemy army: {estart:,}\n\n`After battle:`\n    Your army: {player_manpower:,}\n    Enemy army: {enemy_manpower:,}\n\n`Casualties:`\n    Your army: {pstart-player_manpower:,}\n    Enemy army: {estart-enemy_manpower}".replace(
+            ",", " ")
+    )
+    embed.set_author(name="Attack", icon_url=bot.user.avatar_url)
+    messages.append(embed)
+
+    if job["args"]["mention"]:
+        messages.append(f"<@{player}>")
+    return messages
+
+
+@scheduler.handler("auction")
+def settle_auction(job: dict):
+    result = auctions.settle(job["args"]["auction"])
+    if result["winner"] == None:
+        msg = f"No bids, `{result['item']}` was returned to {directory.mention(result['seller'])}"
+    else:
+        msg = f"{directory.mention(result['winner'])} won `{result['item']}` for {result['price']:,}{config['currency_symbol']}\nBids: {result['bids']}".replace(
+            ",", " ")
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=f"Auction `{job['args']['auction']}` of {directory.mention(result['seller'])} closed\n\n{msg}"
+    )
+    embed.set_author(name="Auction", icon_url=bot.user.avatar_url)
+    return [embed]
+# endregion
+
+
+# region Views
+# Pages are rendered through config.renders, topics list what the page is rendered from
+PAGE = 30
+
+
+def pages_of(count: int, size: int = PAGE):
+    return max((count + size - 1) // size, 1)
+
+
+def leaderboard_page(field: str, page: int, pages: int):
+    suffix = config['currency_symbol'] if field == "balance" else ""
+    msg = ""
+    for index, (player, value) in enumerate(config.ranking.top(field, page * PAGE, PAGE), start=page * PAGE + 1):
+        # Players who left the server keep their record and are shown by remembered name
+        amount = f"{value:,}".replace(",", " ")
+        msg += f"{index}. {directory.mention(player)} `{amount}{suffix}`\n"
+
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=msg
+    )
+    embed.set_author(name="Leaderboard" if field == "balance" else f"Leaderboard: {field}",
+                     icon_url=bot.user.avatar_url)
+    embed.set_footer(text=f"Page {page + 1}/{pages}")
+    return embed
+
+
+async def view_leaderboard(field: str, page: int):
+    "(embed, number of pages) of leaderboard page, page is counted from 0"
+    pages = pages_of(len(config.ranking))
+    page = min(max(page, 0), pages - 1)
+    embed = await config.renders.get(("leaderboard", field, page, pages), ["ranking", "names", "members"], leaderboard_page, field, page, pages)
+    return embed, pages
+
+
+def income_page(order: list, page: int):
+    msg = ""
+    for index, (_id, income) in enumerate(order[page * PAGE:(page + 1) * PAGE], start=1):
+        role = directory.role(_id)
+        role = role.mention if role != None else f"<@&{_id}>"
+        msg += f"{index}. {role} `{income:,}{config['currency_symbol']}`\n".replace(
+            ",", " ")
+
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=msg
+    )
+    embed.set_author(name="Income Leaderboard",
+                     icon_url=bot.user.avatar_url)
+    return embed
+
+
+async def view_income(page: int):
+    "(embed, number of pages) of income leaderboard page"
+    order = await config.renders.get(("income-order",), ["income"], lambda: sorted(
+        config["income"].items(), key=lambda item: item[1], reverse=True))
+    pages = pages_of(len(order))
+    embed = await config.renders.get(("income", page), ["income"], income_page, order, page)
+    return embed, pages
+
+
+def shop_page(player_id: int, order: list, page: int):
+    player = config.player(player_id)
+    msg = ""
+    for item in order[page * PAGE:(page + 1) * PAGE]:
+        if "manpower" in config["upgrade"][item]:
+            if config["upgrade"][item]["manpower"] != 0:
+                manpower = f'`Manpower:` {config["upgrade"][item]["manpower"]}'
+            else:
+                manpower = ""
+        else:
+            manpower = ""
+        owned, limit = config.upgrades(player, item)
+        stock = f'{owned}/{limit}' if limit != None else f'{owned}/Not limited'
+        msg += f'`{item}` {stock} `Cost:` {config["upgrade"][item]["cost"]:,}{config["currency_symbol"]} {manpower}\n'.replace(
+            ",", " ")
+
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=msg
+    )
+    embed.set_author(name="Shop", icon_url=bot.user.avatar_url)
+    return embed
+
+
+async def view_shop(player_id: int, page: int):
+    "(embed, number of pages) of shop page with stock of player"
+    order = await config.renders.get(("shop-order",), ["upgrade"], lambda: sorted(config["upgrade"].keys(), key=str.lower))
+    pages = pages_of(len(order))
+    embed = await config.renders.get(("shop", player_id, page), ["upgrade", "maxupgrade", "generations", ("upgrades", player_id)], shop_page, player_id, order, page)
+    return embed, pages
+
+
+def expedition_page(name: str):
+    mission = config["missions"][name]
+    embed = discord.Embed(
+        title=name, description=mission["description"], color=discord.Colour.from_rgb(255, 255, 0))
+    embed.set_author(name="Missions", icon_url=bot.user.avatar_url)
+    embed.add_field(
+        name="Cost", value=mission["cost"], inline=True)
+    embed.add_field(name="Manpower",
+                    value=mission["manpower"], inline=True)
+    embed.add_field(
+        name="Level", value=mission["level"], inline=True)
+    embed.add_field(name="Chance", value=str(
+        mission["chance"]) + "%", inline=True)
+    embed.add_field(name="Time to complete", value=str(
+        mission["hours"]) + "h", inline=True)
+    embed.add_field(name="Xp", value=mission["xp"], inline=True)
+    for rarity in RARITIES:
+        embed.add_field(name=rarity.capitalize(), value=str(
+            mission["loot-table"][rarity]*100) + "%", inline=False)
+    return embed
+
+
+async def view_expeditions(page: int):
+    "(embed, number of pages) of expedition page, embed is None if there are no expeditions"
+    order = await config.renders.get(("expeditions-order",), ["missions"], lambda: list(config["missions"].keys()))
+    if order == []:
+        return None, 0
+    page = min(page, len(order) - 1)
+    embed = await config.renders.get(("expeditions", order[page]), ["missions"], expedition_page, order[page])
+    return embed, len(order)
+
+
+def list_page(name: str, lines: list, page: int):
+    "Page of numbered lines"
+    msg = ""
+    for index, line in enumerate(lines[page * PAGE:(page + 1) * PAGE], start=page * PAGE + 1):
+        msg += f"{index}. {line}\n"
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=msg
+    )
+    embed.set_author(name=name, icon_url=bot.user.avatar_url)
+    return embed
+
+
+async def view_members(page: int):
+    "(embed, number of pages) of members page"
+    lines = await config.renders.get(("members-order",), ["members"], lambda: [
+        f"{user.mention} `{user.id}`" for user in directory.members.values()])
+    pages = pages_of(len(lines))
+    page = min(page, pages - 1)
+    return await config.renders.get(("members", page), ["members"], list_page, "Members", lines, page), pages
+
+
+async def view_roles(page: int):
+    "(embed, number of pages) of roles page"
+    lines = await config.renders.get(("roles-order",), ["roles"], lambda: [
+        role.mention for role in directory.roles.values()])
+    pages = pages_of(len(lines))
+    page = min(page, pages - 1)
+    return await config.renders.get(("roles", page), ["roles"], list_page, "Roles", lines, page), pages
+
+
+def nth(items: dict, page: int):
+    "(name, item) at position page of dict, last one if page is out of range"
+    return next(itertools.islice(items.items(), min(page, len(items) - 1), None))
+
+
+async def view_items(player_id: int, slot: str, page: int):
+    "(embed, number of pages) of item in inventory or equiped slot of player, embed is None if slot is empty"
+    items = getattr(config.player(player_id), slot)
+    if len(items) == 0:
+        return None, 0
+    name, item = nth(items, page)
+    embed = discord.Embed(
+        title=name, description=item.description if item.description != None else "", color=rarity.__dict__[item.rarity])
+    embed.set_author(
+        name="Inventory" + f" ({min(page, len(items) - 1) + 1}/{len(items)})", icon_url=bot.user.avatar_url)
+    embed.add_field(name="Type", value=item.type, inline=True)
+    embed.add_field(name="ID", value=f"#{item.id}",
+                    inline=True) if item.get("id") != None else None
+    embed.add_field(
+        name="Income", value=item.income, inline=True) if item.income != 0 else None
+    embed.add_field(
+        name="Income %", value=item.income_percent, inline=True) if item.income_percent != 0 else None
+    embed.add_field(
+        name="Discount", value=item.discount, inline=True) if item.discount != 0 else None
+    embed.add_field(
+        name="Discount %", value=item.discount_percent, inline=True) if item.discount_percent != 0 else None
+    embed.add_field(
+        name="Rarity", value=item.rarity, inline=True)
+    return embed, len(items)
+
+
+async def view_player_shop(player_id: int, page: int):
+    "(embed, number of pages) of item listed in player shop"
+    player = config.player(player_id)
+    if len(player.player_shop) == 0:
+        embed = discord.Embed(title="Empty")
+        embed.set_author(
+            name="Player shop" + f" (1/0)", icon_url=bot.user.avatar_url)
+        return embed, 1
+    name, price = nth(player.player_shop, page)
+    item = player.inventory[name]
+    embed = discord.Embed(
+        title=name, description=item.description, color=rarity.__dict__[item.rarity])
+    embed.set_author(
+        name="Player shop" + f" ({min(page, len(player.player_shop) - 1) + 1}/{len(player.player_shop)})", icon_url=bot.user.avatar_url)
+    embed.add_field(
+        name="Price", value=price, inline=False)
+    embed.add_field(
+        name="Rarity", value=item.rarity, inline=True)
+    embed.add_field(
+        name="Income", value=item.income, inline=True) if item.income != 0 else None
+    embed.add_field(
+        name="Income %", value=item.income_percent, inline=True) if item.income_percent != 0 else None
+    embed.add_field(
+        name="Discount", value=item.discount, inline=True) if item.discount != 0 else None
+    embed.add_field(
+        name="Discount %", value=item.discount_percent, inline=True) if item.discount_percent != 0 else None
+    return embed, len(player.player_shop)
+
+
+def market_page(title: str, listings: list, page: int, pages: int):
+    msg = ""
+    for listing in listings:
+        details = " ".join(value for value in [
+                           listing.rarity, listing.type] if value != None)
+        msg += f"`{listing.id}` {listing.name} `{listing.price:,}{config['currency_symbol']}` {details} {directory.mention(listing.seller)}\n".replace(
+            ",", " ")
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=msg if msg != "" else "No listings found"
+    )
+    embed.set_author(name=title, icon_url=bot.user.avatar_url)
+    embed.set_footer(text=f"Page {page + 1}/{pages}")
+    return embed
+
+
+async def view_market(title: str, query: dict, page: int):
+    "(embed, number of pages) of market search, query holds arguments of Market.search"
+    listings, total = config.market.search(
+        **query, start=page * PAGE, count=PAGE)
+    pages = pages_of(total)
+    if page >= pages:
+        # Listings were sold while paging
+        page = pages - 1
+        listings, total = config.market.search(
+            **query, start=page * PAGE, count=PAGE)
+    return market_page(title, listings, page, pages), pages
+
+
+async def view_auctions(page: int):
+    "(embed, number of pages) of open auctions, bids are sealed so only their count is shown"
+    order = auctions.pending()
+    pages = pages_of(len(order))
+    page = min(max(page, 0), pages - 1)
+    msg = ""
+    for auction_id, auction in order[page * PAGE:(page + 1) * PAGE]:
+        msg += f"`{auction_id}` {auction['item']} `{auction['record']['rarity']}` min `{auction['minimum']:,}{config['currency_symbol']}` closes {prague_time(auction['due'], r'%H:%M:%S %d/%m/%Y')} bids: {len(auction['bids'])} {directory.mention(auction['seller'])}\n".replace(
+            ",", " ")
+    embed = discord.Embed(
+        colour=discord.Colour.from_rgb(255, 255, 0),
+        description=msg if msg != "" else "No open auctions"
+    )
+    embed.set_author(name="Auctions", icon_url=bot.user.avatar_url)
+    embed.set_footer(text=f"Page {page + 1}/{pages}")
+    return embed, pages
 # endregion
 
 
 class Money(commands.Cog):
     """Whatya dooooing, make money !!!"""
 
-    @commands.command(name="leaderboard", help="Show da leaderboard: l, lb, leaderboard", aliases=["lb", "l"])
-    async def leaderboard(self, ctx: Context):
+    @commands.command(name="leaderboard", help="Show da leaderboard: [l|lb|leaderboard] [balance|level|xp|manpower] [page=1]", aliases=["lb", "l"])
+    async def leaderboard(self, ctx: Context, field: str = "balance", page: int = 1):
         logging.debug("Displaying leaderboard")
         try:
-            players = {}
-            for player in config["players"]:
-                players[player] = config["players"][player]["balance"]
-            _sorted = {k: v for k, v in sorted(
-                players.items(), key=lambda item: item[1], reverse=True)}
+            if not field in RANKED:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ Leaderboard can be sorted by: {', '.join(RANKED)}"
+                )
+                embed.set_author(name="Leaderboard",
+                                 icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            await paginators.start(ctx, functools.partial(view_leaderboard, field), page - 1)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @commands.command(name="rank", help="Position of player in leaderboards: rank [user]")
+    async def rank(self, ctx: Context, user: discord.Member = None):
+        try:
+            if user == None:
+                user = ctx.author
 
-            e_list = []
+            record = config.player(user.id)
+            total = len(config.ranking) + \
+                (0 if user.id in config["players"] else 1)
             msg = ""
-            index = 1
-            for name in _sorted:
-                try:
-                    username = get(bot.guilds[0].members, id=name).mention
-                except:
-                    continue
-                msg += f"{index}. {username} `{_sorted[name]:,}{config['currency_symbol']}`\n".replace(
+            for field in RANKED:
+                position = config.ranking.rank(field, user.id, record[field])
+                msg += f"{field.capitalize()}: `#{position:,}` of {total:,} (`{record[field]:,}`)\n".replace(
                     ",", " ")
-                if index == 30:
-                    embed = discord.Embed(
-                        colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=msg
-                    )
-                    embed.set_author(name="Leaderboard",
-                                     icon_url=bot.user.avatar_url)
-                    e_list.append(embed)
-                    msg = ""
-                    index = 1
-                else:
-                    index += 1
 
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
-                description=msg
+                description=f"<@{user.id}>\n\n" + msg
             )
-            embed.set_author(name="Leaderboard", icon_url=bot.user.avatar_url)
-            e_list.append(embed)
-
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
+            embed.set_author(name="Rank", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -700,12 +1353,10 @@ class Money(commands.Cog):
     async def user_work(self, ctx: Context):
         logging.debug(f"{ctx.author.display_name} executing work")
         try:
-            if time.time() >= config["players"][ctx.author.id]["last-work"] + config["deltatime"]:
-                income = 0
-                for role in ctx.author.roles:
-                    if config.config["income"][role.id] != 0:
-                        income += config.config["income"][role.id]
-                if income <= 0:
+            player = config.player(ctx.author.id)
+            if clock.time() >= player.last_work + config["deltatime"]:
+                stats = config.stats.get(ctx.author.id)
+                if stats.role_income <= 0:
                     embed = discord.Embed(
                         colour=discord.Colour.from_rgb(255, 255, 0),
                         description=f"❌ You do not have income set, please ask admin to do so"
@@ -713,51 +1364,28 @@ class Money(commands.Cog):
                     embed.set_author(name="Work", icon_url=bot.user.avatar_url)
                     await ctx.send(embed=embed)
                 else:
-                    income_multiplier = 1
-                    for item in config["players"][ctx.author.id]["equiped"]:
-                        item = config["players"][ctx.author.id]["equiped"][item]
-                        income_multiplier = income_multiplier * \
-                            (item["income_percent"] / 100)
-
-                    income_boost = 0
-                    for item in config["players"][ctx.author.id]["equiped"]:
-                        item = config["players"][ctx.author.id]["equiped"][item]
-                        income_boost += item["income"]
-
-                    income = (income*income_multiplier)+income_boost+(
-                        round(config['players'][ctx.author.id]['stats']['stewardship']*income*config['stewardship_rate'], 5))
-
-                    rate = random.randrange(
-                        100-config["work_range"]*100, 100+config["work_range"]*100) / 100 if config["work_range"] != 0 else 1
-                    if config["players"][ctx.author.id]["last-work"] != 0:
-                        timedelta = (
-                            time.time() - config["players"][ctx.author.id]["last-work"]) / config["deltatime"]
-                        config["players"][ctx.author.id]["balance"] += int(
-                            income * timedelta * rate)
-                        config["players"][ctx.author.id]["last-work"] = time.time()
-                    else:
-                        timedelta = 1
-                        config["players"][ctx.author.id]["balance"] += income
-                        config["players"][ctx.author.id]["last-work"] = time.time()
+                    result = activities.work(
+                        config, ctx.author.id, stats, clock.time())
+                    income, timedelta, rate = result["income"], result["timedelta"], result["rate"]
+                    income_boost, income_multiplier = result["boost"], result["multiplier"]
 
                     logging.info(
                         f"{ctx.author.display_name} ■ {ctx.author.id} is working [timedelta={timedelta}, rate={rate}]")
                     embed = discord.Embed(
                         colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=f"✅ <@{ctx.author.id}> worked and got `{int(timedelta*income*rate):,} {config['currency_symbol']}`\nNext available at {datetime.datetime.fromtimestamp(int(config['players'][ctx.author.id]['last-work'] + config['deltatime']),tz=pytz.timezone('Europe/Prague')).time()}\nIncome boosted: `{income_boost:,}{config['currency_symbol']}`\nIncome multiplier `{income_multiplier}`\nStewardship bonus: `{config['players'][ctx.author.id]['stats']['stewardship']*config['stewardship_rate']}%`".replace(",", " ")
+                        description=f"✅ <@{ctx.author.id}> worked and got `{int(timedelta*income*rate):,} {config['currency_symbol']}`\nNext available at {datetime.datetime.fromtimestamp(int(config['players'][ctx.author.id].last_work + config['deltatime']),tz=pytz.timezone('Europe/Prague')).time()}\nIncome boosted: `{income_boost:,}{config['currency_symbol']}`\nIncome multiplier `{income_multiplier}`\nStewardship bonus: `{config['players'][ctx.author.id].stats.stewardship*config['stewardship_rate']}%`".replace(",", " ")
                     )
                     embed.set_author(name="Work", icon_url=bot.user.avatar_url)
                     await ctx.send(embed=embed)
                     logging.debug(
-                        f"{ctx.author.display_name} ■ {ctx.author.id} is working [timedelta={timedelta}, rate={rate}], symbol={config['currency_symbol']}, next={datetime.datetime.fromtimestamp(int(config['players'][ctx.author.id]['last-work'] + config['deltatime']),tz=pytz.timezone('Europe/Prague')).time()}, boost={income_boost}, multiplier={income_multiplier}, stewardship={config['players'][ctx.author.id]['stats']['stewardship']*config['stewardship_rate']}%")
+                        f"{ctx.author.display_name} ■ {ctx.author.id} is working [timedelta={timedelta}, rate={rate}], symbol={config['currency_symbol']}, next={datetime.datetime.fromtimestamp(int(config['players'][ctx.author.id].last_work + config['deltatime']),tz=pytz.timezone('Europe/Prague')).time()}, boost={income_boost}, multiplier={income_multiplier}, stewardship={config['players'][ctx.author.id].stats.stewardship*config['stewardship_rate']}%")
             else:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
-                    description=f"❌ You can work at {datetime.datetime.fromtimestamp(int(config['players'][ctx.author.id]['last-work']+config['deltatime']),tz=pytz.timezone('Europe/Prague')).time()}"
+                    description=f"❌ You can work at {datetime.datetime.fromtimestamp(int(player.last_work+config['deltatime']),tz=pytz.timezone('Europe/Prague')).time()}"
                 )
                 embed.set_author(name="Work", icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
-            config.save()
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -767,8 +1395,8 @@ class Money(commands.Cog):
     async def reset_money(self, ctx: Context, member: discord.Member):
         logging.debug(f"Resetting balance of {member.display_name}")
         try:
-            if member.id in members:
-                config["players"][member.id]["balance"] = 0
+            if member.id in directory:
+                config.assign(member.id, "balance", 0)
                 logging.info(f"Resetting {member}'s balance")
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
@@ -790,15 +1418,13 @@ class Money(commands.Cog):
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
 
-        config.save()
-
     @commands.command(name="remove-money", help="Remove money from target: remove-money <user: discord.Member> <value: integer>", pass_context=True)
     @commands.has_permissions(administrator=True)
     async def remove_money(self, ctx: Context, member: discord.Member, balance: int):
         logging.debug(f"Removing {balance} from {member.display_name}")
         try:
-            if member.id in members:
-                config["players"][member.id]["balance"] -= abs(int(balance))
+            if member.id in directory:
+                config.add(member.id, "balance", -abs(int(balance)))
                 logging.info(
                     f"Removing {balance:,}{config['currency_symbol']} from {member}".replace(",", " "))
                 embed = discord.Embed(
@@ -817,7 +1443,6 @@ class Money(commands.Cog):
                                  icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
                 logging.info("Member not found")
-            config.save()
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -828,9 +1453,8 @@ class Money(commands.Cog):
         try:
             if message[0] == "everyone":
                 money = message[1]
-                for _member in config["players"]:
-                    config["players"][_member]["balance"] += int(money)
-                config.save()
+                for _member in directory.members.keys() | config["players"].keys():
+                    config.add(_member, "balance", int(money))
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"Adding {int(money):,}{config['currency_symbol']} to @everyone".replace(
@@ -842,17 +1466,14 @@ class Money(commands.Cog):
                 return
 
             pattern = re.compile(r'[0-9]+')
-            _users = bot.guilds[0].members
             _id = int(re.findall(pattern, message[0])[0])
-            for _user in _users:
-                if _user.id == _id:
-                    member = _user.id
+            member = _id
             balance = float(message[1])
 
             logging.debug(f"Adding {balance} to {member}")
 
-            if member in members:
-                config["players"][member]["balance"] += abs(int(balance))
+            if member in directory:
+                config.add(member, "balance", abs(int(balance)))
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"Adding {balance:,}{config['currency_symbol']} to <@{_id}>".replace(
@@ -875,51 +1496,31 @@ class Money(commands.Cog):
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
 
-        config.save()
-
     @commands.command(name="buy", help="Spend money to make more money bruh: buy <type: string> <value: integer>")
     async def buy_upgrade(self, ctx: Context, type: str, value: int = 1):
         logging.debug(f"{ctx.author.display_name} is buying {type} * {value}")
         try:
-            if type in config["upgrade"].keys():
-                pass
-            else:
-                _placeholder = difflib.get_close_matches(
-                    type, config["upgrade"].keys())
-                if await confirm(ctx, f"Not found in shop - closest match: {_placeholder}"):
-                    type = _placeholder[0] if _placeholder != [] else type
+            type = await closest(ctx, type, "upgrade")
 
             if type in config["upgrade"].keys():
+                player = config.player(ctx.author.id)
                 if config["upgrade"][type]["require"] != None:
                     required = config["upgrade"][type]["require"]
-                    player_own_required = True if config["players"][
-                        ctx.author.id]["upgrade"][required] > 0 else False
+                    player_own_required = True if config.upgrades(
+                        player, required)[0] > 0 else False
                 else:
                     required = None
 
                 if required == None or player_own_required:
-                    try:
-                        call = config["players"][ctx.author.id]["upgrade"][type] + \
-                            int(value) <= config["players"][ctx.author.id]["maxupgrade"][type]
-                    except:
-                        call = True
+                    owned, limit = config.upgrades(player, type)
+                    call = limit == None or owned + int(value) <= limit
                     if config["upgrade"][type] == None or call:
-                        discount = 0
-                        for item in config["players"][ctx.author.id]["equiped"]:
-                            item = config["players"][ctx.author.id]["equiped"][item]
-                            if item["discount"] != None:
-                                if type == item["discount"]:
-                                    discount += item["discount_percent"]
-
-                        if discount > 100:
-                            discount = 100
-
-                        discount = round(
-                            (discount * 0.01) + (config['players'][ctx.author.id]['stats']['bartering']*config['bartering_rate']), 5)
+                        discount = config.stats.get(
+                            ctx.author.id).discount(type)
 
                         cost = (config["upgrade"][type]["cost"] -
                                 config["upgrade"][type]["cost"] * discount) * int(value)
-                        if config.config["players"][ctx.author.id]["balance"] >= cost:
+                        if player.balance >= cost:
                             role_list = []
                             for role in ctx.author.roles:
                                 if not role.name in config["disabled_roles"] or not "spokojenost" in role.name.lower():
@@ -955,23 +1556,30 @@ class Money(commands.Cog):
                                 embed.set_author(
                                     name="Buy", icon_url=bot.user.avatar_url)
                                 await ctx.send(embed=embed)
-                                config.save()
                             else:
-                                if config["upgrade"][type]["income"] != 0:
-                                    config["income"][role_list[0]
-                                                     ] += config["upgrade"][type]["income"] * int(value)
-
-                                config["players"][ctx.author.id]["upgrade"][type] += int(
-                                    value)
+                                try:
+                                    async with config.locks(ctx.author.id):
+                                        purchase(config, ctx.author.id, type, int(value), cost, int(value) * (
+                                            config["upgrade"][type]["manpower"] if "manpower" in config["upgrade"][type] else 0))
+                                except TransactionError as e:
+                                    embed = discord.Embed(
+                                        colour=discord.Colour.from_rgb(
+                                            255, 255, 0),
+                                        description=f"❌ {e}"
+                                    )
+                                    embed.set_author(
+                                        name="Buy", icon_url=bot.user.avatar_url)
+                                    await ctx.send(embed=embed)
+                                    return
 
-                                config["players"][ctx.author.id]["balance"] -= cost
-                                config.config["players"][ctx.author.id]["manpower"] += int(value) * (
-                                    config["upgrade"][type]["manpower"] if "manpower" in config["upgrade"][type] else 0)
+                                if config["upgrade"][type]["income"] != 0:
+                                    config.add_income(
+                                        role_list[0], config["upgrade"][type]["income"] * int(value))
                                 if config["upgrade"][type]["income"] != 0:
                                     embed = discord.Embed(
                                         colour=discord.Colour.from_rgb(
                                             255, 255, 0),
-                                        description=f"✅ Bought {value}x {type} for {cost:,}{config['currency_symbol']} and your income is now {config.config['income'][role_list[0]]:,}{config['currency_symbol']}\nDiscount: `{discount*100}%`\nBartering discount included in discount: `{config['players'][ctx.author.id]['stats']['bartering']*config['bartering_rate']*100}%`".replace(
+                                        description=f"✅ Bought {value}x {type} for {cost:,}{config['currency_symbol']} and your income is now {config.config['income'][role_list[0]]:,}{config['currency_symbol']}\nDiscount: `{discount*100}%`\nBartering discount included in discount: `{config.stats.get(ctx.author.id).bartering*100}%`".replace(
                                             ",", " ")
                                     )
                                     embed.set_author(
@@ -981,13 +1589,12 @@ class Money(commands.Cog):
                                     embed = discord.Embed(
                                         colour=discord.Colour.from_rgb(
                                             255, 255, 0),
-                                        description=f"✅ Bought {value}x {type} for `{cost:,}{config['currency_symbol']}`\nDiscount: `{discount*100}%`\nBartering discount included in discount: `{config['players'][ctx.author.id]['stats']['bartering']*config['bartering_rate']*100}%`".replace(
+                                        description=f"✅ Bought {value}x {type} for `{cost:,}{config['currency_symbol']}`\nDiscount: `{discount*100}%`\nBartering discount included in discount: `{config.stats.get(ctx.author.id).bartering*100}%`".replace(
                                             ",", " ")
                                     )
                                     embed.set_author(
                                         name="Buy", icon_url=bot.user.avatar_url)
                                     await ctx.send(embed=embed)
-                                config.save()
                         else:
                             embed = discord.Embed(
                                 colour=discord.Colour.from_rgb(255, 255, 0),
@@ -1036,39 +1643,38 @@ class Money(commands.Cog):
                 embed.set_author(name="Pay", icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
             else:
-                if config["players"][ctx.author.id]["balance"] >= balance:
-                    if member.id in members:
-                        config["players"][ctx.author.id]["balance"] -= int(
-                            balance)
-                        config.config["players"][member.id]["balance"] += int(
-                            balance)
-                        logging.info(f"Paid {balance} to {member}")
-                        embed = discord.Embed(
-                            colour=discord.Colour.from_rgb(255, 255, 0),
-                            description=f"✅ Paid {balance:,}{config['currency_symbol']} to <@{member.id}>".replace(
-                                ",", " ")
-                        )
-                        embed.set_author(
-                            name="Pay", icon_url=bot.user.avatar_url)
-                        await ctx.send(embed=embed)
-                    else:
+                if member.id in directory:
+                    try:
+                        async with config.locks(ctx.author.id, member.id):
+                            transfer(config, ctx.author.id,
+                                     member.id, int(balance))
+                    except TransactionError:
                         embed = discord.Embed(
                             colour=discord.Colour.from_rgb(255, 255, 0),
-                            description="❌ Member not found"
+                            description="❌ You don't have enough money"
                         )
                         embed.set_author(
                             name="Pay", icon_url=bot.user.avatar_url)
                         await ctx.send(embed=embed)
-                        logging.info("Member not found")
+                        return
+                    logging.info(f"Paid {balance} to {member}")
+                    embed = discord.Embed(
+                        colour=discord.Colour.from_rgb(255, 255, 0),
+                        description=f"✅ Paid {balance:,}{config['currency_symbol']} to <@{member.id}>".replace(
+                            ",", " ")
+                    )
+                    embed.set_author(
+                        name="Pay", icon_url=bot.user.avatar_url)
+                    await ctx.send(embed=embed)
                 else:
                     embed = discord.Embed(
                         colour=discord.Colour.from_rgb(255, 255, 0),
-                        description="❌ You don't have enough money"
+                        description="❌ Member not found"
                     )
-                    embed.set_author(name="Pay", icon_url=bot.user.avatar_url)
+                    embed.set_author(
+                        name="Pay", icon_url=bot.user.avatar_url)
                     await ctx.send(embed=embed)
-
-            config.save()
+                    logging.info("Member not found")
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -1079,7 +1685,7 @@ class Money(commands.Cog):
         try:
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
-                description=f"<@{ctx.author.id}> has {config['players'][ctx.author.id]['balance']:,}{config['currency_symbol']}".replace(
+                description=f"<@{ctx.author.id}> has {config.player(ctx.author.id).balance:,}{config['currency_symbol']}".replace(
                     ",", " ")
             )
             embed.set_author(name="Balance", icon_url=bot.user.avatar_url)
@@ -1091,50 +1697,7 @@ class Money(commands.Cog):
     @commands.command(name="shop", help="Show shop")
     async def shop(self, ctx: Context):
         try:
-            e_list = []
-            index = 1
-            msg = ""
-            _sorted_keys = list(config["upgrade"].keys())
-            _sorted_keys.sort(key=str.lower)
-
-            _sorted = {}
-
-            for item in _sorted_keys:
-                _sorted[item] = config["upgrade"][item]
-
-            for item in _sorted:
-                if "manpower" in config["upgrade"][item]:
-                    if config["upgrade"][item]["manpower"] != 0:
-                        manpower = f'`Manpower:` {config["upgrade"][item]["manpower"]}'
-                    else:
-                        manpower = ""
-                else:
-                    manpower = ""
-                stock = f'{config["players"][ctx.author.id]["upgrade"][item]}/{config["players"][ctx.author.id]["maxupgrade"][item]}' if config[
-                    "players"][ctx.author.id]["maxupgrade"][item] != None else f'{config["players"][ctx.author.id]["upgrade"][item]}/Not limited'
-                msg += f'`{item}` {stock} `Cost:` {config["upgrade"][item]["cost"]:,}{config["currency_symbol"]} {manpower}\n'.replace(
-                    ",", " ")
-                if index == 30:
-                    embed = discord.Embed(
-                        colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=msg
-                    )
-                    embed.set_author(name="Shop", icon_url=bot.user.avatar_url)
-                    e_list.append(embed)
-                    msg = ""
-                    index = 1
-                else:
-                    index += 1
-            embed = discord.Embed(
-                colour=discord.Colour.from_rgb(255, 255, 0),
-                description=msg
-            )
-            embed.set_author(name="Shop", icon_url=bot.user.avatar_url)
-            e_list.append(embed)
-
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
+            await paginators.start(ctx, functools.partial(view_shop, ctx.author.id))
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -1164,38 +1727,9 @@ class Income(commands.Cog):
     async def income(self, ctx: Context):
         logging.debug(f"Displaying income of {ctx.author.display_name}")
         try:
-            income = 0
-            for role in ctx.author.roles:
-                try:
-                    if config["income"][role.id] != 0:
-                        income += config.config["income"][role.id]
-                    else:
-                        logging.debug(f"Excluding: {role.name}")
-                except:
-                    embed = discord.Embed(
-                        colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=f"ERROR: {role.name} not found in config"
-                    )
-                    embed.set_author(
-                        name="Income", icon_url=bot.user.avatar_url)
-                    await ctx.send(embed=embed)
-
-            income_multiplier = 1
-            for item in config["players"][ctx.author.id]["equiped"]:
-                item = config["players"][ctx.author.id]["equiped"][item]
-                income_multiplier = income_multiplier * \
-                    (item["income_percent"] / 100)
-
-            income_boost = 0
-            for item in config["players"][ctx.author.id]["equiped"]:
-                item = config["players"][ctx.author.id]["equiped"][item]
-                income_boost += item["income"]
-
-            stewardship_bonus = round(
-                config['players'][ctx.author.id]['stats']['stewardship']*income*config['stewardship_rate'], 5)
-
-            income = (income*income_multiplier)+income_boost+(
-                stewardship_bonus)
+            stats = config.stats.get(ctx.author.id)
+            income, income_boost, income_multiplier = stats.income, stats.boost, stats.multiplier
+            stewardship_bonus = stats.stewardship
 
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
@@ -1214,7 +1748,7 @@ class Income(commands.Cog):
         logging.debug(f"Adding {value} to income of {role}")
         try:
             if value > 0:
-                config.config["income"][role.id] += value
+                config.add_income(role.id, value)
 
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
@@ -1231,8 +1765,6 @@ class Income(commands.Cog):
                 )
                 embed.set_author(name="Income", icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
-
-            config.save()
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -1243,7 +1775,7 @@ class Income(commands.Cog):
         logging.debug(f"Removing {value} from income of {role}")
         try:
             if value > 0:
-                config.config["income"][role.id] -= value
+                config.add_income(role.id, -value)
 
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
@@ -1267,46 +1799,10 @@ class Income(commands.Cog):
     async def income_lb(self, ctx: Context):
         logging.debug("Displaying income leaderboard")
         try:
-            roles = config["income"]
-            _sorted = {k: v for k, v in sorted(
-                roles.items(), key=lambda item: item[1], reverse=True)}
-
-            e_list = []
-            msg = ""
-            index = 1
-            for _id in _sorted:
-                try:
-                    role = get(bot.guilds[0].roles, id=_id).mention
-                except:
-                    pass
-                msg += f"{index}. {role} `{_sorted[_id]:,}{config['currency_symbol']}`\n".replace(
-                    ",", " ")
-                if index == 30:
-                    embed = discord.Embed(
-                        colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=msg
-                    )
-                    embed.set_author(name="Income Leaderboard",
-                                     icon_url=bot.user.avatar_url)
-                    e_list.append(embed)
-                    msg = ""
-                    index = 1
-                else:
-                    index += 1
-
-            embed = discord.Embed(
-                colour=discord.Colour.from_rgb(255, 255, 0),
-                description=msg
-            )
-            embed.set_author(name="Leaderboard", icon_url=bot.user.avatar_url)
-            e_list.append(embed)
-
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
-        except:
-            print(traceback.format_exc())
-            await ctx.send(traceback.format_exc())
+            await paginators.start(ctx, view_income)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
 
 
 class Config(commands.Cog):
@@ -1316,7 +1812,7 @@ class Config(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def config_save(self, ctx: Context):
         try:
-            config.save()
+            await config.flush(force=True)
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
                 description="✅ Config saved"
@@ -1333,6 +1829,8 @@ class Config(commands.Cog):
         try:
             config.load()
             config.save()
+            scheduler.load()
+            auctions.load()
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
                 description="✅ Config loaded"
@@ -1350,37 +1848,11 @@ class Config(commands.Cog):
         try:
             message = list(message)
             for i in range(len(message)):
-                if re.findall(re.compile(r"[<][@][!][0-9]+[>]"), message[i]) != []:
-                    pattern = re.compile(r'[0-9]+')
-                    _users = bot.guilds[0].members
-                    _id = int(re.findall(pattern, message[i])[0])
-                    for _user in _users:
-                        if _user.id == _id:
-                            logging.info(
-                                f"{message[i]} was replaced by {_user.id}")
-                            message[i] = _user.id
-                    break
-
-                if re.findall(re.compile(r"[<][@][0-9]+[>]"), message[i]) != []:
-                    pattern = re.compile(r'[0-9]+')
-                    _users = bot.guilds[0].members
-                    _id = int(re.findall(pattern, message[i])[0])
-                    for _user in _users:
-                        if _user.id == _id:
-                            logging.info(
-                                f"{message[i]} was replaced by {_user.id}")
-                            message[i] = _user.id
-                    break
-
-                if re.findall(re.compile(r"[<][@][&][0-9]+[>]"), message[i]) != []:
-                    pattern = re.compile(r'[0-9]+')
-                    _roles = bot.guilds[0].roles
-                    _id = int(re.findall(pattern, message[i])[0])
-                    for _role in _roles:
-                        if _role.id == _id:
-                            logging.info(
-                                f"{message[i]} was replaced by {_role.id}")
-                            message[i] = _role.id
+                _id = directory.resolve(message[i])
+                if _id != None:
+                    logging.info(
+                        f"{message[i]} was replaced by {_id}")
+                    message[i] = _id
                     break
 
             msg = ""
@@ -1427,7 +1899,6 @@ class Config(commands.Cog):
                         break
                     else:
                         current = current[word]
-            config.save()
 
         except:
             print(traceback.format_exc())
@@ -1441,38 +1912,16 @@ class Config(commands.Cog):
         try:
             message = list(message)
             for i in range(len(message)):
-                if re.findall(re.compile(r"[<][@][!][0-9]+[>]"), message[i]) != []:
-                    pattern = re.compile(r'[0-9]+')
-                    _users = bot.guilds[0].members
-                    _id = int(re.findall(pattern, message[i])[0])
-                    for _user in _users:
-                        if _user.id == _id:
-                            logging.info(
-                                f"{message[i]} was replaced by {_user.id}")
-                            message[i] = _user.id
-                    break
-
-                if re.findall(re.compile(r"[<][@][0-9]+[>]"), message[i]) != []:
-                    pattern = re.compile(r'[0-9]+')
-                    _users = bot.guilds[0].members
-                    _id = int(re.findall(pattern, message[i])[0])
-                    for _user in _users:
-                        if _user.id == _id:
-                            logging.info(
-                                f"{message[i]} was replaced by {_user.id}")
-                            message[i] = _user.id
+                _id = directory.resolve(message[i])
+                if _id != None:
+                    logging.info(
+                        f"{message[i]} was replaced by {_id}")
+                    message[i] = _id
                     break
 
-                if re.findall(re.compile(r"[<][@][&][0-9]+[>]"), message[i]) != []:
-                    pattern = re.compile(r'[0-9]+')
-                    _roles = bot.guilds[0].roles
-                    _id = int(re.findall(pattern, message[i])[0])
-                    for _role in _roles:
-                        if _role.id == _id:
-                            logging.info(
-                                f"{message[i]} was replaced by {_role.id}")
-                            message[i] = _role.id
-                    break
+            # Count or limit of upgrade set directly belongs to current catalog generation of item
+            if len(message) > 4 and message[0] == "players" and isinstance(message[1], int) and message[2] in ["upgrade", "maxupgrade"] and message[4] in ["=", ">", "<"]:
+                config.refresh_upgrade(message[1], message[3])
 
             current = config.config
             mode = None
@@ -1549,22 +1998,106 @@ class Config(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def config_stats(self, ctx: Context):
         logging.debug("Displaying config stats")
-        size = os.path.getsize(config.CONFIG)
+        size = os.path.getsize(config.storage.path)
+        lines = sum(1 for line in open(config.storage.path, encoding='utf-8')
+                    ) if config.storage.name == "json" else "-"
+        renders = config.renders.stats()
+        prompts = confirmations.stats()
         embed = discord.Embed(
             colour=discord.Colour.from_rgb(255, 255, 0),
-            description=f"Size: {sizeof_fmt(size)}\nPath: {config.CONFIG}\nLines: {sum(1 for line in open(config.CONFIG, encoding='utf-8'))}"
+            description=f"Size: {sizeof_fmt(size)}\nPath: {config.storage.path}\nStorage: {config.storage.name}\nLines: {lines}\nSaves requested: {config.saves_requested}\nSaves performed: {config.saves_performed}\nUnsaved changes: {config.dirty}\nRender cache: {renders['hits']} hits, {renders['shared']} shared, {renders['misses']} misses ({renders['hit_rate']*100:.1f}%), {renders['entries']} pages\nRender time: {renders['render_time']:.3f}s ({renders['average_render']*1000:.2f}ms per page)\nConfirmations: {prompts['pending']} pending, {prompts['decided']} decided (average {prompts['average_latency']:.1f}s), {prompts['timed_out']} timed out"
         )
         embed.set_author(name="Config-stats", icon_url=bot.user.avatar_url)
         await ctx.send(embed=embed)
 
+    @commands.command(name="config-flush", help="Write pending changes to disk: config-flush", pass_context=True)
+    @commands.has_permissions(administrator=True)
+    async def config_flush(self, ctx: Context):
+        try:
+            pending = config.dirty
+            await config.flush()
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"{'✅ Config flushed' if pending else '✅ Nothing to flush'}\nSaves requested: `{config.saves_requested}`\nSaves performed: `{config.saves_performed}`\nSave interval: `{config['save_interval']}s`"
+            )
+            embed.set_author(name="Config", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @commands.command(name="config-migrate", help="Import JSON config file into current storage: config-migrate [path]", pass_context=True)
+    @commands.has_permissions(administrator=True)
+    async def config_migrate(self, ctx: Context, path: str = None):
+        try:
+            path = config.CONFIG if path == None else path
+            if not await confirm(ctx, f"Replace {config.storage.name} storage with content of {path} ?"):
+                return
+
+            data = await asyncio.get_event_loop().run_in_executor(config.writer, read_snapshot, path)
+            config.config = data
+            scheduler.load()
+            auctions.load()
+            config.save()
+            await config.flush()
+            logging.info(
+                f"Imported {path} to {config.storage.name} storage: {config.storage.path}")
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"✅ Imported {len(data['players'])} players from `{path}` to {config.storage.name} storage"
+            )
+            embed.set_author(name="Config", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
     @commands.command(name="next-backup", help="Outputs time of next backup: next-backup", pass_context=True)
     @commands.has_permissions(administrator=True)
     async def next_backup(self, ctx: Context):
         logging.debug("Sending next backup time")
         message = backup.next_iteration.astimezone(
             pytz.timezone('Europe/Prague')).strftime(r"%H:%M:%S, %d/%m/%Y")
+        last = config.backups.last
+        if last != None:
+            message += f"\nLast backup: {last['timestamp']} ({last['kind']}), {sizeof_fmt(last['size'])} in {last['duration']:.3f}s"
         await ctx.send(message)
 
+    @commands.command(name="backup-restore", help="Restore config from backup: backup-restore <timestamp>", pass_context=True)
+    @commands.has_permissions(administrator=True)
+    async def backup_restore(self, ctx: Context, timestamp: int):
+        try:
+            points = [t for t, _ in config.backups.points()]
+            if not timestamp in points:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ Backup {timestamp} not found\nAvailable: " +
+                    ", ".join(f"`{t}`" for t in reversed(points[-10:]))
+                )
+                embed.set_author(name="Backup", icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            if not await confirm(ctx, f"Replace config with backup {timestamp} ?"):
+                return
+
+            data = await asyncio.get_event_loop().run_in_executor(None, config.backups.restore, timestamp)
+            config.config = data
+            scheduler.load()
+            auctions.load()
+            config.save()
+            await config.flush()
+            logging.info(f"Config restored from backup {timestamp}")
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"✅ Config restored from backup {timestamp}"
+            )
+            embed.set_author(name="Backup", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
 
 class Development(commands.Cog):
     """Only for developers, who know how to operate this bot"""
@@ -1591,20 +2124,8 @@ class Development(commands.Cog):
             embed.set_author(name="Reload", icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
 
-            for member in bot.guilds[0].members:
-                if not member.id in members:
-                    members.append(member.id)
-                    config.config["players"][member.id] = {}
-                    config.config["players"][member.id]["balance"] = 0
-                    config.config["players"][member.id]["last-work"] = 0
-                    config.config["players"][member.id]["upgrade"] = {}
-                    config.config["players"][member.id]["maxupgrade"] = {}
-
-                    for item in list(config.fallback["upgrade"].keys()):
-                        logging.info(
-                            f"Added {item} to {member.display_name}")
-                        config.config["players"][member.id]["upgrade"][item] = 0
-                        config.config["players"][member.id]["maxupgrade"][item] = config["maxupgrade"][item]
+            directory.load(bot.guilds[0])
+            config.renders.bump("members", "names", "roles")
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
                 description="✅ Members reloaded"
@@ -1619,8 +2140,8 @@ class Development(commands.Cog):
             embed.set_author(name="Reload", icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
 
-            for role in bot.guilds[0].roles:
-                if not (role.id in roles):
+            for role in directory.roles.values():
+                if not (role.id in config["income"]):
                     logging.info(f"{role} added to config")
                     config.config["income"][role.id] = 0
 
@@ -1709,11 +2230,28 @@ class Development(commands.Cog):
         channel = await member.create_dm()
         await channel.send(content)
 
-    @commands.command(name="asyncs-on-hold", help="Number of async events on hold: asyncs-on-hold", pass_context=True)
+    @commands.command(name="asyncs-on-hold", help="Expeditions and attacks on hold: asyncs-on-hold [user]", pass_context=True)
     @commands.has_permissions(administrator=True)
-    async def asyncs_on_hold_(self, ctx: Context):
+    async def asyncs_on_hold_(self, ctx: Context, user: discord.Member = None):
         logging.debug("Sending queued async commands")
-        await ctx.send(asyncs_on_hold)
+        try:
+            jobs = scheduler.pending(user.id if user != None else None)
+            now = clock.time()
+            lines = [f"`{job_id}` {job['kind']} of <@{job['player']}>: {prague_time(job['due'])} (in {max(job['due'] - now, 0) / 3600:.2f}h)"
+                     for job_id, job in jobs[:20]]
+            if len(jobs) > 20:
+                lines.append(f"... and {len(jobs) - 20} more")
+
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"{len(jobs)} on hold\n\n" + "\n".join(lines)
+            )
+            embed.set_author(name="Asyncs on hold",
+                             icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
 
 
 class Settings(commands.Cog):
@@ -1736,6 +2274,7 @@ class Settings(commands.Cog):
         logging.info("Shutting down...")
 
         await bot.change_presence(activity=discord.Game(name=f"Shutting down..."), status=Status.offline)
+        await config.flush()
         sys.exit()
 
     @commands.command(name="pause", help="Show the bot, whos da boss: shutdown", pass_context=True)
@@ -1796,16 +2335,11 @@ class Settings(commands.Cog):
         except SystemExit:
             return
 
-        for member in config.config["players"]:
-            config["players"][member]["maxupgrade"] = {
-                **config["players"][member]["maxupgrade"], **{fargs.name: fargs.maxupgrade}}
-            config["players"][member]["upgrade"] = {
-                **config["players"][member]["upgrade"], **{fargs.name: 0}}
-
-        config["upgrade"] = {**config["upgrade"], **{fargs.name: {
-            "cost": fargs.cost, "income": fargs.income, "manpower": fargs.manpower, "require": fargs.require}}}
-        config["maxupgrade"] = {**config["maxupgrade"],
-                                **{fargs.name: fargs.maxupgrade}}
+        # Players resolve upgrades against catalog, counts of item of the same name bought before start again from 0
+        config.reset_upgrade(fargs.name)
+        config["upgrade"][fargs.name] = {
+            "cost": fargs.cost, "income": fargs.income, "manpower": fargs.manpower, "require": fargs.require}
+        config["maxupgrade"][fargs.name] = fargs.maxupgrade
 
         embed = discord.Embed(title=fargs.name, color=0xffff00)
         embed.set_author(name="Succesfully added to inventory",
@@ -1819,7 +2353,7 @@ class Settings(commands.Cog):
                         inline=True) if fargs.manpower != 0 or fargs.manpower != None else None
         await ctx.send(embed=embed)
 
-        config.save()
+        config.save("upgrade", "maxupgrade")
 
     @commands.command(name="remove-item", pass_context=True, help="Remove item from database: remove-item <name: str>")
     @commands.has_permissions(administrator=True)
@@ -1837,16 +2371,15 @@ class Settings(commands.Cog):
                 await ctx.send(embed=embed)
                 return
 
+            item = await closest(ctx, item, "upgrade")
             confirmed = await confirm(ctx, f"Remove {item} ?")
             if not confirmed:
                 return
 
-            for member in config.config["players"]:
-                config["players"][member]["maxupgrade"].pop(item)
-                config["players"][member]["upgrade"].pop(item)
-
             config["upgrade"].pop(item)
             config["maxupgrade"].pop(item)
+            config.reset_upgrade(item)
+            config.save("upgrade", "maxupgrade")
 
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
@@ -1868,7 +2401,7 @@ class Settings(commands.Cog):
                 return
 
             config.config["prefix"] = prefix
-            config.save()
+            config.save("prefix")
             bot.command_prefix = prefix
             logging.info(f"Prefix changed to {config['prefix']}")
             embed = discord.Embed(
@@ -1888,14 +2421,14 @@ class Settings(commands.Cog):
     async def deltatime(self, ctx: Context, value: int = config["deltatime"]):
         try:
             config["deltatime"] = int(value)
-            config.save()
+            config.save("deltatime")
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
                 description=f"✅ Deltatime changed to {int(value)} seconds"
             )
             embed.set_author(name="Config", icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
-            config.save()
+            config.save("deltatime")
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -1918,7 +2451,7 @@ class Settings(commands.Cog):
             embed.set_author(name="Join dm", icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
 
-            config.save()
+            config.save("join_dm")
         except:
             print(traceback.format_exc())
             ctx.send(traceback.format_exc())
@@ -1930,34 +2463,7 @@ class Essentials(commands.Cog):
     @commands.command(name="members", help="Show all members: members")
     async def members(self, ctx: Context):
         try:
-            e_list = []
-            msg = ""
-            index = 1
-            for user in bot.guilds[0].members:
-                msg += f"{index}. {user.mention} `{user.id}`\n"
-                if index == 30:
-                    embed = discord.Embed(
-                        colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=msg
-                    )
-                    embed.set_author(
-                        name="Members", icon_url=bot.user.avatar_url)
-                    e_list.append(embed)
-                    msg = ""
-                    index = 1
-                else:
-                    index += 1
-
-            embed = discord.Embed(
-                colour=discord.Colour.from_rgb(255, 255, 0),
-                description=msg
-            )
-            embed.set_author(name="Members", icon_url=bot.user.avatar_url)
-            e_list.append(embed)
-
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
+            await paginators.start(ctx, view_members)
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -1965,34 +2471,7 @@ class Essentials(commands.Cog):
     @commands.command(name="roles", help="Show all roles: roles")
     async def roles(self, ctx: Context):
         try:
-            e_list = []
-            msg = ""
-            index = 1
-            for role in bot.guilds[0].roles:
-                msg += f"{index}. {role.mention}\n"
-                if index == 30:
-                    embed = discord.Embed(
-                        colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=msg
-                    )
-                    embed.set_author(
-                        name="Roles", icon_url=bot.user.avatar_url)
-                    e_list.append(embed)
-                    msg = ""
-                    index = 1
-                else:
-                    index += 1
-
-            embed = discord.Embed(
-                colour=discord.Colour.from_rgb(255, 255, 0),
-                description=msg
-            )
-            embed.set_author(name="Roles", icon_url=bot.user.avatar_url)
-            e_list.append(embed)
-
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
+            await paginators.start(ctx, view_roles)
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -2016,8 +2495,7 @@ class Essentials(commands.Cog):
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
                 description="✅ " +
-                datetime.datetime.now(tz=pytz.timezone(
-                    'Europe/Prague')).strftime(r"%H:%M:%S, %d/%m/%Y")
+                clock.now().strftime(r"%H:%M:%S, %d/%m/%Y")
             )
             embed.set_author(name="Time", icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
@@ -2079,38 +2557,211 @@ class PlayerShop(commands.Cog):
             if user == None:
                 user = ctx.author
 
-            e_list = []
-            index = 1
-            last = len(config["players"][user.id]["player_shop"])
-            for name in config["players"][user.id]["player_shop"]:
-                item = config["players"][user.id]["inventory"][name]
+            await paginators.start(ctx, functools.partial(view_player_shop, user.id))
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @commands.group(name="market", invoke_without_command=True, help="Listings of all player shops: market <search|cheapest|buy>")
+    async def market(self, ctx: Context):
+        try:
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"{len(config.market)} items listed\n`market search`, `market cheapest <item>`, `market buy <listing-id>`"
+            )
+            embed.set_author(name="Market", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @market.command(name="search", help="Search listings: market search [--rarity RARITY] [--type TYPE] [--min MIN] [--max MAX] [--desc] [name]")
+    async def market_search(self, ctx: Context, *querry):
+        fparser = argparse.ArgumentParser()
+        fparser.add_argument("name", type=str, nargs="*")
+        fparser.add_argument("--rarity", choices=[
+                             "common", "uncommon", "rare", "epic", "legendary", "event"], type=str)
+        fparser.add_argument(
+            "--type", choices=["helmet", "weapon", "armor", "leggins", "boots", "artefact"])
+        fparser.add_argument("--min", type=int, default=None)
+        fparser.add_argument("--max", type=int, default=None)
+        fparser.add_argument("--desc", action="store_true")
+
+        querry = shlex.split(" ".join(querry))
+
+        try:
+            fargs = fparser.parse_args(querry)
+        except SystemExit:
+            return
+
+        try:
+            name = None
+            title = "Market"
+            if fargs.name != []:
+                name = config.market.resolve(" ".join(fargs.name))
+                if name == None:
+                    embed = discord.Embed(
+                        colour=discord.Colour.from_rgb(255, 255, 0),
+                        description=f"❌ {' '.join(fargs.name)} is not listed"
+                    )
+                    embed.set_author(
+                        name="Market", icon_url=bot.user.avatar_url)
+                    await ctx.send(embed=embed)
+                    return
+                title = f"Market: {name}"
+
+            query = {"name": name, "rarity": fargs.rarity, "type": fargs.type,
+                     "low": fargs.min, "high": fargs.max, "descending": fargs.desc}
+            await paginators.start(ctx, functools.partial(view_market, title, query))
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @market.command(name="cheapest", help="Cheapest listings of item: market cheapest <item: str>")
+    async def market_cheapest(self, ctx: Context, *, item: str):
+        try:
+            name = config.market.resolve(item)
+            if name == None:
                 embed = discord.Embed(
-                    title=name, description=item["description"], color=rarity.__dict__[item["rarity"]])
-                embed.set_author(
-                    name="Player shop" + f" ({index}/{last})", icon_url=bot.user.avatar_url)
-                embed.add_field(
-                    name="Price", value=config["players"][user.id]["player_shop"][name], inline=False)
-                embed.add_field(
-                    name="Rarity", value=item["rarity"], inline=True)
-                embed.add_field(
-                    name="Income", value=item["income"], inline=True) if item["income"] != 0 else None
-                embed.add_field(
-                    name="Income %", value=item["income_percent"], inline=True) if item["income_percent"] != 0 else None
-                embed.add_field(
-                    name="Discount", value=item["discount"], inline=True) if item["discount"] != 0 else None
-                embed.add_field(
-                    name="Discount %", value=item["discount_percent"], inline=True) if item["discount_percent"] != 0 else None
-                e_list.append(embed)
-                index += 1
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ {item} is not listed"
+                )
+                embed.set_author(name="Market", icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
 
-            if e_list == []:
-                embed = discord.Embed(title="Empty")
-                embed.set_author(
-                    name="Player shop" + f" ({index}/{last})", icon_url=bot.user.avatar_url)
-                e_list.append(embed)
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
+            await ctx.send(embed=market_page(f"Cheapest: {name}", config.market.cheapest(name), 0, 1))
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @market.command(name="buy", help="Buy listed item: market buy <listing-id: str>")
+    async def market_buy(self, ctx: Context, listing_id: str):
+        try:
+            listing = config.market.listing(listing_id)
+            if listing == None:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description="❌ Listing not found"
+                )
+                embed.set_author(name="Market buy",
+                                 icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            if listing.seller == ctx.author.id:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description="❌ Can't buy item from yourself"
+                )
+                embed.set_author(name="Market buy",
+                                 icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            # Listing may change until locks are held, trade checks price again under them
+            seller, item, cost = listing.seller, listing.name, listing.price
+            try:
+                async with config.locks(ctx.author.id, seller):
+                    name = trade(config, ctx.author.id, seller, item, cost, cost - (
+                        cost * config.stats.get(ctx.author.id).trading))
+            except TransactionError as e:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ {e}"
+                )
+                embed.set_author(name="Market buy",
+                                 icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"✅ Bought {item} from {directory.mention(seller)} for {cost:,}{config['currency_symbol']} and item was added to your inventory as `{name}`\nTrading discount: `{config.stats.get(ctx.author.id).trading*100}%`".replace(
+                    ",", " ")
+            )
+            embed.set_author(name="Market buy", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @commands.command(name="auction-start", help="Auction legendary or event item: auction-start <item: str> <minimum: int> <hours: float>")
+    async def auction_start(self, ctx: Context, *, message):
+        try:
+            querry = shlex.split(message)
+
+            try:
+                item = " ".join(querry[:-2])
+                minimum = int(querry[-2])
+                hours = float(querry[-1])
+            except (IndexError, ValueError):
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ Bad arguments"
+                )
+                embed.set_author(name="Auction", icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            item = await closest(ctx, item, ctx.author.id, "inventory", "inventory")
+
+            try:
+                async with config.locks(ctx.author.id):
+                    auction_id, auction = auctions.open(
+                        ctx.author.id, item, minimum, hours * 3600)
+                    scheduler.schedule("auction", ctx.author.id, ctx.channel.id,
+                                       hours * 3600, auction=auction_id)
+            except TransactionError as e:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ {e}"
+                )
+                embed.set_author(name="Auction", icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"✅ Auction `{auction_id}` of `{item}` started\nMinimum bid: {minimum:,}{config['currency_symbol']}\nCloses: {prague_time(auction['due'], r'%H:%M:%S %d/%m/%Y')}\n\nBid with `{config['prefix']}bid {auction_id} <amount>`".replace(
+                    ",", " ")
+            )
+            embed.set_author(name="Auction", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @commands.command(name="bid", help="Place sealed bid, money is held until auction closes: bid <auction-id: int> <amount: int>")
+    async def bid(self, ctx: Context, auction_id: int, amount: int):
+        try:
+            try:
+                async with config.locks(ctx.author.id):
+                    previous = auctions.bid(auction_id, ctx.author.id, amount)
+            except TransactionError as e:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ {e}"
+                )
+                embed.set_author(name="Bid", icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"✅ Your bid on auction `{auction_id}` is {amount:,}{config['currency_symbol']}\nHeld in escrow: {amount - previous:,}{config['currency_symbol']}".replace(
+                    ",", " ")
+            )
+            embed.set_author(name="Bid", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @commands.command(name="auctions", help="Show open auctions: auctions")
+    async def auctions_(self, ctx: Context):
+        try:
+            await paginators.start(ctx, view_auctions)
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -2132,13 +2783,9 @@ class PlayerShop(commands.Cog):
                 embed.set_author(name="Sell", icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
 
-            if not item in config["players"][ctx.author.id]["inventory"]:
-                _placeholder = difflib.get_close_matches(
-                    item, config["players"][ctx.author.id]["inventory"].keys())
-                if await confirm(ctx, f"Not found in shop - closest match: {_placeholder}"):
-                    item = _placeholder[0] if _placeholder != [] else item
+            item = await closest(ctx, item, ctx.author.id, "inventory", "inventory")
 
-            if not item in config["players"][ctx.author.id]["inventory"]:
+            if not item in config.player(ctx.author.id).inventory:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"{item} not found in your inventory"
@@ -2147,8 +2794,7 @@ class PlayerShop(commands.Cog):
                 await ctx.send(embed=embed)
                 return
 
-            config["players"][ctx.author.id]["player_shop"] = {
-                **config["players"][ctx.author.id]["player_shop"], **{item: price}}
+            config.list_item(ctx.author.id, item, price)
 
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2160,8 +2806,6 @@ class PlayerShop(commands.Cog):
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
 
-        config.save()
-
     @commands.command(name="player-buy", help="Sell items: player-buy <user: discord.Member> <item: str>")
     async def player_buy(self, ctx: Context, user: discord.Member, *, item: str):
         try:
@@ -2175,14 +2819,10 @@ class PlayerShop(commands.Cog):
                 await ctx.send(embed=embed)
                 return
 
-            if not item in config["players"][user.id]["player_shop"]:
-                _placeholder = difflib.get_close_matches(
-                    item, config["players"][user.id]["player_shop"].keys())
-                if await confirm(ctx, f"Not found in shop - closest match: {_placeholder}"):
-                    item = _placeholder[0] if _placeholder != [] else item
+            item = await closest(ctx, item, user.id, "player_shop")
 
             try:
-                cost = config["players"][user.id]["player_shop"][item]
+                cost = config.player(user.id).player_shop[item]
             except KeyError:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2193,47 +2833,38 @@ class PlayerShop(commands.Cog):
                 await ctx.send(embed=embed)
                 return
 
-            if config["players"][ctx.author.id]["balance"] >= cost - (cost * config['players'][ctx.author.id]['stats']['trading']*config['trading_rate']):
-                config["players"][ctx.author.id]["inventory"][item] = config["players"][user.id]["inventory"][item]
-                config["players"][ctx.author.id]["balance"] -= cost - \
-                    (cost * config['players'][ctx.author.id]
-                     ['stats']['trading']*config['trading_rate'])
-                config["players"][user.id]["balance"] += cost
-                del config["players"][user.id]["player_shop"][item]
-                del config["players"][user.id]["inventory"][item]
-
-                embed = discord.Embed(
-                    colour=discord.Colour.from_rgb(255, 255, 0),
-                    description=f"✅ Bought {item} for {cost:,}{config['currency_symbol']} and item was added to your inventory\nTrading discount: `{config['players'][ctx.author.id]['stats']['trading']*config['trading_rate']*100}%`".replace(
-                        ",", " ")
-                )
-                embed.set_author(name="Buy", icon_url=bot.user.avatar_url)
-                await ctx.send(embed=embed)
-            else:
+            try:
+                async with config.locks(ctx.author.id, user.id):
+                    name = trade(config, ctx.author.id, user.id, item, cost, cost - (
+                        cost * config.stats.get(ctx.author.id).trading))
+            except TransactionError as e:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
-                    description="❌ Not enought money"
+                    description=f"❌ {e}"
                 )
                 embed.set_author(name="Player buy",
                                  icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
+                return
+
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"✅ Bought {item} for {cost:,}{config['currency_symbol']} and item was added to your inventory as `{name}`\nTrading discount: `{config.stats.get(ctx.author.id).trading*100}%`".replace(
+                    ",", " ")
+            )
+            embed.set_author(name="Buy", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
 
-        config.save()
-
     @commands.command(name="player-retrieve", help="Cancel shop listing of item: player-retrieve  <item: str>")
     async def player_retrieve(self, ctx: Context, *, item: str):
         try:
-            if not item in config["players"][ctx.author.id]["player_shop"]:
-                _placeholder = difflib.get_close_matches(
-                    item, config["players"][ctx.author.id]["player_shop"].keys())
-                if await confirm(ctx, f"Not found in shop - closest match: {_placeholder}"):
-                    item = _placeholder[0] if _placeholder != [] else item
+            item = await closest(ctx, item, ctx.author.id, "player_shop")
 
             try:
-                config["players"][ctx.author.id]["player_shop"][item]
+                config.player(ctx.author.id).player_shop[item]
             except KeyError:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2244,7 +2875,7 @@ class PlayerShop(commands.Cog):
                 await ctx.send(embed=embed)
                 return
 
-            del config["players"][ctx.author.id]["player_shop"][item]
+            config.list_item(ctx.author.id, item, None)
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
                 description="✅ Item removed from shop"
@@ -2264,30 +2895,7 @@ class Inventory(commands.Cog):
     @commands.command(name="inventory", help="Shows your 'realy usefull' items in your inventory: inventory", aliases=["inv", "backpack", "loot"])
     async def inventory(self, ctx: Context):
         try:
-            e_list = []
-            index = 1
-            last = len(config["players"][ctx.author.id]["inventory"])
-            for name in config["players"][ctx.author.id]["inventory"]:
-                item = config["players"][ctx.author.id]["inventory"][name]
-                embed = discord.Embed(
-                    title=name, description=item["description"] if item["description"] != None else "", color=rarity.__dict__[item["rarity"]])
-                embed.set_author(
-                    name="Inventory" + f" ({index}/{last})", icon_url=bot.user.avatar_url)
-                embed.add_field(name="Type", value=item["type"], inline=True)
-                embed.add_field(
-                    name="Income", value=item["income"], inline=True) if item["income"] != 0 else None
-                embed.add_field(
-                    name="Income %", value=item["income_percent"], inline=True) if item["income_percent"] != 0 else None
-                embed.add_field(
-                    name="Discount", value=item["discount"], inline=True) if item["discount"] != 0 else None
-                embed.add_field(
-                    name="Discount %", value=item["discount_percent"], inline=True) if item["discount_percent"] != 0 else None
-                embed.add_field(
-                    name="Rarity", value=item["rarity"], inline=True)
-                e_list.append(embed)
-                index += 1
-
-            if e_list == []:
+            if len(config.player(ctx.author.id).inventory) == 0:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"❌ Nothing in inventory"
@@ -2297,9 +2905,7 @@ class Inventory(commands.Cog):
                 await ctx.send(embed=embed)
                 return
 
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
+            await paginators.start(ctx, functools.partial(view_items, ctx.author.id, "inventory"))
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -2307,30 +2913,7 @@ class Inventory(commands.Cog):
     @commands.command(name="equiped", help="Shows your equiped items: equiped")
     async def equiped(self, ctx: Context):
         try:
-            e_list = []
-            index = 1
-            last = len(config["players"][ctx.author.id]["equiped"])
-            for name in config["players"][ctx.author.id]["equiped"]:
-                item = config["players"][ctx.author.id]["equiped"][name]
-                embed = discord.Embed(
-                    title=name, description=item["description"], color=rarity.__dict__[item["rarity"]])
-                embed.set_author(
-                    name="Inventory" + f" ({index}/{last})", icon_url=bot.user.avatar_url)
-                embed.add_field(name="Type", value=item["type"], inline=True)
-                embed.add_field(
-                    name="Income", value=item["income"], inline=True) if item["income"] != 0 else None
-                embed.add_field(
-                    name="Income %", value=item["income_percent"], inline=True) if item["income_percent"] != 0 else None
-                embed.add_field(
-                    name="Discount", value=item["discount"], inline=True) if item["discount"] != 0 else None
-                embed.add_field(
-                    name="Discount %", value=item["discount_percent"], inline=True) if item["discount_percent"] != 0 else None
-                embed.add_field(
-                    name="Rarity", value=item["rarity"], inline=True)
-                e_list.append(embed)
-                index += 1
-
-            if e_list == []:
+            if len(config.player(ctx.author.id).equiped) == 0:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"❌ Nothing in inventory"
@@ -2340,9 +2923,7 @@ class Inventory(commands.Cog):
                 await ctx.send(embed=embed)
                 return
 
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
+            await paginators.start(ctx, functools.partial(view_items, ctx.author.id, "equiped"))
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -2350,13 +2931,10 @@ class Inventory(commands.Cog):
     @commands.command(name="equip", help="Equip item: equip <*item: str>")
     async def equip(self, ctx: Context, *, item: str):
         try:
+            item = await closest(ctx, item, ctx.author.id, "inventory", "inventory")
             try:
-                types = []
-                for equiped in config["players"][ctx.author.id]["equiped"]:
-                    equiped = config["players"][ctx.author.id]["equiped"][equiped]
-                    types.append(equiped["type"])
-
-                if config["players"][ctx.author.id]["inventory"][item]["type"] in types:
+                player = config.player(ctx.author.id)
+                if player.equiped.of_type(player.inventory[item].type) != []:
                     embed = discord.Embed(
                         colour=discord.Colour.from_rgb(255, 255, 0),
                         description=f"❌ Slot already occupied"
@@ -2366,15 +2944,13 @@ class Inventory(commands.Cog):
                     await ctx.send(embed=embed)
                     return
 
-                config["players"][ctx.author.id]["equiped"][item] = config["players"][ctx.author.id]["inventory"][item]
-                del config["players"][ctx.author.id]["inventory"][item]
+                config.move_item(ctx.author.id, item, "inventory", "equiped")
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"✅ {item} equiped"
                 )
                 embed.set_author(name="Equip", icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
-                config.save()
             except KeyError:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2389,16 +2965,15 @@ class Inventory(commands.Cog):
     @commands.command(name="unequip", help="Unequip item: unequip <*item: str>")
     async def unequip(self, ctx: Context, *, item: str):
         try:
+            item = await closest(ctx, item, ctx.author.id, "equiped", "equiped items")
             try:
-                config["players"][ctx.author.id]["inventory"][item] = config["players"][ctx.author.id]["equiped"][item]
-                del config["players"][ctx.author.id]["equiped"][item]
+                config.move_item(ctx.author.id, item, "equiped", "inventory")
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"✅ {item} unequiped"
                 )
                 embed.set_author(name="Unequip", icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
-                config.save()
             except KeyError:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2413,21 +2988,28 @@ class Inventory(commands.Cog):
     @commands.command(name="recycle", help="Recycle item: recycle <*item: str>")
     async def recycle(self, ctx: Context, *, item: str):
         try:
-            if item in config["players"][ctx.author.id]["inventory"]:
+            item = await closest(ctx, item, ctx.author.id, "inventory", "inventory")
+            if item in config.player(ctx.author.id).inventory:
                 confirmed = await confirm(ctx, f"Item found: Recycle {item} ?")
                 if not confirmed:
                     return
 
-                del config["players"][ctx.author.id]["inventory"][item]
+                # Item may have been sold or moved while confirmation was pending, so it is checked again under lock
+                async with config.locks(ctx.author.id):
+                    recycled = item in config.player(ctx.author.id).inventory
+                    if recycled:
+                        if item in config.player(ctx.author.id).player_shop:
+                            config.list_item(ctx.author.id, item, None)
+                        del config["players"][ctx.author.id].inventory[item]
+                        config.save(ctx.author.id)
 
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
-                    description=f"✅ Recycled"
+                    description=f"✅ Recycled" if recycled else f"❌ {item} not found"
                 )
                 embed.set_author(
                     name="Recycle", icon_url=bot.user.avatar_url)
                 await ctx.send(embed=embed)
-                config.save()
             else:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2440,14 +3022,43 @@ class Inventory(commands.Cog):
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
 
-    @commands.command(name="recycle-all", help="Recycle item: recycle-all <rarity: str>")
+    @commands.command(name="recycle-all", help="Recycle all items of rarity in your inventory: recycle-all <rarity: str>")
     async def recycle_all(self, ctx: Context, rarity: str = "common"):
         try:
-            items = [item for item in config["players"]
-                     [ctx.author.id]["inventory"] if config["players"]
-                     [ctx.author.id]["inventory"][item]["rarity"] == rarity]
+            items = config.player(ctx.author.id).inventory.of_rarity(rarity)
+            if items == []:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ No {rarity} items in your inventory"
+                )
+                embed.set_author(
+                    name="Recycle", icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            listed = ", ".join(f"`{item}`" for item in items[:20]) + \
+                (f" and {len(items) - 20} more" if len(items) > 20 else "")
+            if not await confirm(ctx, f"Recycle {len(items)} {rarity} items: {listed} ?"):
+                return
 
-            await ctx.send(items)
+            # Items are read again under lock and removed without awaiting, so the batch lands in one save
+            async with config.locks(ctx.author.id):
+                items = config.player(ctx.author.id).inventory.of_rarity(rarity)
+                if items != []:
+                    player = config["players"][ctx.author.id]
+                    for item in items:
+                        if item in player.player_shop:
+                            config.list_item(ctx.author.id, item, None)
+                        del player.inventory[item]
+                    config.save(ctx.author.id)
+
+            embed = discord.Embed(
+                colour=discord.Colour.from_rgb(255, 255, 0),
+                description=f"✅ Recycled {len(items)} items"
+            )
+            embed.set_author(
+                name="Recycle", icon_url=bot.user.avatar_url)
+            await ctx.send(embed=embed)
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -2475,6 +3086,7 @@ class Inventory(commands.Cog):
             return
 
         if user == "loot-table":
+            config.loot.add(fargs.name, fargs.rarity)
             config["loot-table"][fargs.name] = {
                 "description": fargs.description,
                 "type": fargs.type,
@@ -2486,7 +3098,9 @@ class Inventory(commands.Cog):
                 "equiped": False
             }
         else:
-            config["players"][user.id]["inventory"][fargs.name] = {
+            record = config["players"][user.id]
+            fargs.name = record.inventory.add(fargs.name, {
+                "id": config.item_id(),
                 "description": fargs.description,
                 "type": fargs.type,
                 "rarity": fargs.rarity,
@@ -2495,7 +3109,7 @@ class Inventory(commands.Cog):
                 "discount": fargs.discount,
                 "discount_percent": fargs.discount_percent,
                 "equiped": False
-            }
+            }, record.equiped)
 
         embed = discord.Embed(
             title=fargs.name, description=fargs.description, color=rarity.__dict__[fargs.rarity])
@@ -2511,13 +3125,19 @@ class Inventory(commands.Cog):
         embed.add_field(name="Rarity", value=fargs.rarity, inline=True)
         await ctx.send(embed=embed)
 
-        config.save()
+        config.save("loot-table" if user == "loot-table" else user.id)
 
     @commands.command(name="remove-player-item", help="Remove item from players inventory: remove-player-item <user: Union[str, discord.Member]> <item: str>")
     @commands.has_permissions(administrator=True)
     async def remove_player_item(self, ctx: Context, user: Union[str, discord.Member], *, item: str):
+        if user == "loot-table":
+            item = await closest(ctx, item, "loot-table", where="loot-table")
+        elif isinstance(user, discord.Member):
+            item = await closest(ctx, item, user.id, "inventory", "inventory")
+
         if user == "loot-table":
             del config["loot-table"][item]
+            config.loot.remove(item)
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
                 description=f"✅ Removed {item} from loot-table"
@@ -2525,8 +3145,10 @@ class Inventory(commands.Cog):
             embed.set_author(name="Remove player item",
                              icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
-        elif item in config["players"][user.id]["inventory"]:
-            del config["players"][user.id]["inventory"][item]
+        elif item in config.player(user.id).inventory:
+            if item in config.player(user.id).player_shop:
+                config.list_item(user.id, item, None)
+            del config["players"][user.id].inventory[item]
 
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2543,7 +3165,7 @@ class Inventory(commands.Cog):
             embed.set_author(name="Remove player item",
                              icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
-        config.save()
+        config.save("loot-table" if user == "loot-table" else user.id)
 
 
 class Player(commands.Cog):
@@ -2551,7 +3173,7 @@ class Player(commands.Cog):
     @commands.command(name="talents", help="Show list of skills: talents", aliases=["stats"])
     async def stats(self, ctx: Context):
         try:
-            player = config["players"][ctx.author.id]["stats"]
+            player = config.player(ctx.author.id).stats
 
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2573,14 +3195,14 @@ class Player(commands.Cog):
     async def level(self, ctx: Context):
         try:
             await levelup_check(ctx)
-            level = config["players"][ctx.author.id]["level"]
+            level = config.player(ctx.author.id).level
 
             xp_for_level = config["xp_for_level"]
             for _ in range(level):
                 xp_for_level *= config["level_multiplier"]
 
             xp_for_level = int(xp_for_level)
-            xp = config["players"][ctx.author.id]["xp"]
+            xp = config.player(ctx.author.id).xp
 
             if xp == 0:
                 progress = 0
@@ -2600,20 +3222,20 @@ class Player(commands.Cog):
     @commands.command(name="levelup", help="Spend skillpoints for talents: levelup <skill> [value=1]")
     async def skill_add(self, ctx: Context, skill: str, value: int = 1):
         try:
-            if skill.lower() in config["players"][ctx.author.id]["stats"]:
-                if config["players"][ctx.author.id]["skillpoints"] >= value:
-                    config["players"][ctx.author.id]["stats"][skill.lower()
+            if skill.lower() in config.player(ctx.author.id).stats:
+                if config.player(ctx.author.id).skillpoints >= value:
+                    config["players"][ctx.author.id].stats[skill.lower()
                                                               ] += value
-                    config["players"][ctx.author.id]["skillpoints"] -= value
+                    config["players"][ctx.author.id].skillpoints -= value
 
                     embed = discord.Embed(
                         colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=f'Skill point used: {skill} = {config["players"][ctx.author.id]["stats"][skill.lower()]}'
+                        description=f'Skill point used: {skill} = {config.player(ctx.author.id).stats[skill.lower()]}'
                     )
                     embed.set_author(name="Add skill",
                                      icon_url=bot.user.avatar_url)
                     await ctx.send(embed=embed)
-                    config.save()
+                    config.save(ctx.author.id)
                 else:
                     embed = discord.Embed(
                         colour=discord.Colour.from_rgb(255, 255, 0),
@@ -2639,7 +3261,7 @@ class Player(commands.Cog):
         try:
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
-                description=f'Your skillpoints: {config["players"][ctx.author.id]["skillpoints"]}'
+                description=f'Your skillpoints: {config.player(ctx.author.id).skillpoints}'
             )
             embed.set_author(name="Skillpoints", icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
@@ -2694,6 +3316,8 @@ class Expeditions(commands.Cog):
                 }
             }
 
+            config.loot.table(config["missions"][fargs.name]["loot-table"])
+
             embed = discord.Embed(title=fargs.name, description=fargs.description,
                                   color=discord.Colour.from_rgb(255, 255, 0))
             embed.set_author(name="Succesfully added to missions",
@@ -2722,7 +3346,50 @@ class Expeditions(commands.Cog):
                 fargs.legendary*100) + "%", inline=False)
             await ctx.send(embed=embed)
 
-            config.save()
+            config.save("missions")
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
+    @commands.command(name="loot-sim", help="Simulate loot drops of expedition: loot-sim <expedition: str> [rolls=100000]")
+    @commands.has_permissions(administrator=True)
+    async def loot_sim(self, ctx: Context, expedition_name: str, rolls: int = 100000):
+        try:
+            if not expedition_name in config["missions"]:
+                embed = discord.Embed(
+                    colour=discord.Colour.from_rgb(255, 255, 0),
+                    description=f"❌ Expedition not found"
+                )
+                embed.set_author(name="Loot simulation",
+                                 icon_url=bot.user.avatar_url)
+                await ctx.send(embed=embed)
+                return
+
+            rarities = config["missions"][expedition_name]["loot-table"]
+            rolls = min(max(rolls, 1), 10000000)
+            start = time.perf_counter()
+            counts = await asyncio.get_event_loop().run_in_executor(None, config.loot.simulate, rarities, rolls)
+            elapsed = time.perf_counter() - start
+
+            expected = weights(rarities)
+            lines = []
+            for rarity, weight in zip(RARITIES, expected):
+                dropped = sum(count for (_rarity, _), count in counts.items()
+                              if _rarity == rarity)
+                lines.append(
+                    f"{rarity}: `{dropped / rolls * 100:.2f}%` (expected `{weight / max(sum(expected), 1) * 100:.2f}%`)")
+            empty = sum(count for (_, item), count in counts.items()
+                        if item == None)
+            lines.append(
+                f"\nNo item: `{empty / rolls * 100:.2f}%`\nDifferent items: `{len([key for key in counts if key[1] != None])}`")
+
+            embed = discord.Embed(
+                title=expedition_name, description="\n".join(lines), color=discord.Colour.from_rgb(255, 255, 0))
+            embed.set_author(name="Loot simulation",
+                             icon_url=bot.user.avatar_url)
+            embed.set_footer(
+                text=f"{rolls:,} rolls in {elapsed:.3f}s ({rolls / elapsed:,.0f}/s)".replace(",", " "))
+            await ctx.send(embed=embed)
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -2731,8 +3398,10 @@ class Expeditions(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def remove_mission(self, ctx: Context, mission: str):
         try:
+            mission = await closest(ctx, mission, "missions", where="expeditions")
             try:
                 del config["missions"][mission]
+                config.save("missions")
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"✅ Expedition removed"
@@ -2756,38 +3425,7 @@ class Expeditions(commands.Cog):
     @commands.command(name="expeditions", help="List of expeditions: expeditions")
     async def missions(self, ctx: Context):
         try:
-            e_list = []
-            index = 1
-            for _mission in config["missions"]:
-                mission = config["missions"][_mission]
-                embed = discord.Embed(
-                    title=_mission, description=mission["description"], color=discord.Colour.from_rgb(255, 255, 0))
-                embed.set_author(name="Missions", icon_url=bot.user.avatar_url)
-                embed.add_field(
-                    name="Cost", value=mission["cost"], inline=True)
-                embed.add_field(name="Manpower",
-                                value=mission["manpower"], inline=True)
-                embed.add_field(
-                    name="Level", value=mission["level"], inline=True)
-                embed.add_field(name="Chance", value=str(
-                    mission["chance"]) + "%", inline=True)
-                embed.add_field(name="Time to complete", value=str(
-                    mission["hours"]) + "h", inline=True)
-                embed.add_field(name="Xp", value=mission["xp"], inline=True)
-                embed.add_field(name="Common", value=str(
-                    mission["loot-table"]["common"]*100) + "%", inline=False)
-                embed.add_field(name="Uncommon", value=str(
-                    mission["loot-table"]["uncommon"]*100) + "%", inline=False)
-                embed.add_field(name="Rare", value=str(
-                    mission["loot-table"]["rare"]*100) + "%", inline=False)
-                embed.add_field(name="Epic", value=str(
-                    mission["loot-table"]["epic"]*100) + "%", inline=False)
-                embed.add_field(name="Legendary", value=str(
-                    mission["loot-table"]["legendary"]*100) + "%", inline=False)
-                e_list.append(embed)
-                index += 1
-
-            if e_list == []:
+            if config["missions"] == {}:
                 embed = discord.Embed(
                     colour=discord.Colour.from_rgb(255, 255, 0),
                     description=f"❌ No expeditions yet"
@@ -2797,9 +3435,7 @@ class Expeditions(commands.Cog):
                 await ctx.send(embed=embed)
                 return
 
-            paginator = DiscordUtils.Pagination.AutoEmbedPaginator(ctx)
-            paginator.remove_reactions = True
-            await paginator.run(e_list)
+            await paginators.start(ctx, view_expeditions)
         except:
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
@@ -2807,16 +3443,16 @@ class Expeditions(commands.Cog):
     @commands.command(name="expedition", help="Start an expedition: expedition <name: str>", aliases=["expedition-start"])
     async def mission_start(self, ctx: Context, expedition_name: str, mention: bool = True):
         global time
-        global asyncs_on_hold
 
         if config["block_asyncs"]:
             await ctx.send("Function blocked by 'hold-asyncs'")
             return
 
         user = ctx.author
+        expedition_name = await closest(ctx, expedition_name, "missions", where="expeditions")
         expedition = config["missions"][expedition_name]
 
-        if not config["players"][user.id]["level"] >= expedition["level"]:
+        if not config.player(user.id).level >= expedition["level"]:
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
                 description=f"❌ Your level is too low"
@@ -2825,42 +3461,27 @@ class Expeditions(commands.Cog):
             await ctx.send(embed=embed)
             return
 
-        if not config["players"][user.id]["balance"] >= expedition["cost"]:
-            embed = discord.Embed(
-                colour=discord.Colour.from_rgb(255, 255, 0),
-                description=f"❌ Not enought money"
-            )
-            embed.set_author(name="Expedition", icon_url=bot.user.avatar_url)
-            await ctx.send(embed=embed)
-            return
-
-        if not config["players"][user.id]["manpower"] >= expedition["manpower"]:
+        try:
+            async with config.locks(user.id):
+                charge(config, user.id,
+                       balance=expedition["cost"], manpower=expedition["manpower"])
+                _, job = scheduler.schedule("expedition", user.id, ctx.channel.id, expedition["hours"] * 3600, name=expedition_name, mention=mention, **{
+                    key: expedition[key] for key in ["manpower", "chance", "xp", "loot-table"]})
+        except TransactionError as e:
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
-                description=f"❌ Not enought manpower"
+                description=f"❌ {e}"
             )
             embed.set_author(name="Expedition", icon_url=bot.user.avatar_url)
             await ctx.send(embed=embed)
             return
 
-        config["players"][user.id]["balance"] -= expedition["cost"]
-        config["players"][user.id]["manpower"] -= expedition["manpower"]
-
-        random.seed(time.time())
-
-        _time = datetime.datetime.now(tz=pytz.timezone(
-            'Europe/Prague')).strftime(r'%H:%M:%S')
-        a_time = (datetime.datetime.now(tz=pytz.timezone('Europe/Prague')) +
-                  datetime.timedelta(hours=expedition["hours"])).strftime(r'%H:%M:%S')
-        asyncs_on_hold.append(a_time)
-        seconds = expedition["hours"] * 3600
-
         embed = discord.Embed(title=expedition_name, description=expedition["description"]
                               if expedition["description"] != None else "", color=discord.Colour.from_rgb(255, 255, 0))
         embed.set_author(name="Succesfully added to queue",
                          icon_url=bot.user.avatar_url)
-        embed.add_field(name="Time", value=(datetime.datetime.now(tz=pytz.timezone(
-            'Europe/Prague')) + datetime.timedelta(hours=expedition["hours"])).strftime(r'%H:%M:%S'), inline=False)
+        embed.add_field(name="Time", value=prague_time(
+            job["due"], r'%H:%M:%S'), inline=False)
         embed.add_field(name="Manpower on hold",
                         value=expedition["manpower"], inline=False)
         embed.add_field(name="Required level",
@@ -2870,105 +3491,6 @@ class Expeditions(commands.Cog):
         embed.add_field(name="XP", value=expedition["xp"], inline=False)
         await ctx.send(embed=embed)
 
-        await asyncio.sleep(delay=seconds)
-        await ctx.send("Mission started")
-
-        if random.randint(0, 100) < expedition["chance"]:
-            msg = "✅ Successs"
-            config["players"][user.id]["xp"] += expedition["xp"] + expedition["xp"] * \
-                config["players"][ctx.author.id]["stats"]["learning"] * \
-                config["learning_rate"]
-
-            if len(config["players"][ctx.author.id]["inventory"]) < config["max_player_items"]:
-
-                rarities = expedition["loot-table"]
-                items = config["loot-table"]
-
-                weighted_list = ['common'] * int(rarities["common"]*100) + ['uncommon'] * int(rarities["uncommon"]*100) + \
-                    ['rare'] * int(rarities["rare"]*100) + ['epic'] * \
-                    int(rarities["epic"]*100) + \
-                    ['legendary'] * int(rarities["legendary"]*100)
-
-                logging.debug(weighted_list)
-
-                selected_rarity = random.choice(weighted_list)
-
-                item_list = []
-
-                for item in items:
-                    if items[item]["rarity"] == selected_rarity:
-                        item_list.append(item)
-
-                if item_list != []:
-                    chosen_item = random.choice(item_list)
-                else:
-                    chosen_item = None
-
-                if chosen_item == None:
-                    embed = discord.Embed(
-                        colour=discord.Colour.from_rgb(255, 255, 0),
-                        description=f"No item found"
-                    )
-                    embed.set_author(name="Expedition",
-                                     icon_url=bot.user.avatar_url)
-                    await ctx.send(embed=embed)
-                else:
-                    name = chosen_item
-                    item = config["loot-table"][chosen_item]
-                    embed = discord.Embed(
-                        title=name, description=item["description"] if item["description"] != None else "", color=rarity.__dict__[item["rarity"]])
-                    embed.set_author(
-                        name="Item found", icon_url=bot.user.avatar_url)
-                    embed.add_field(
-                        name="Type", value=item["type"], inline=True)
-                    embed.add_field(
-                        name="Income", value=item["income"], inline=True) if item["income"] != 0 else None
-                    embed.add_field(
-                        name="Income %", value=item["income_percent"], inline=True) if item["income_percent"] != 0 else None
-                    embed.add_field(
-                        name="Discount", value=item["discount"], inline=True) if item["discount"] != 0 else None
-                    embed.add_field(
-                        name="Discount %", value=item["discount_percent"], inline=True) if item["discount_percent"] != 0 else None
-                    embed.add_field(
-                        name="Rarity", value=item["rarity"], inline=True)
-                    await ctx.send(embed=embed)
-
-                    index = 1
-                    extname = name
-                    while name in config["players"][ctx.author.id]["inventory"]:
-                        name = extname + f" ({index})"
-                        index += 1
-                        logging.debug(
-                            f"Item found in inventory! Trying suffix ({index})")
-                    config["players"][ctx.author.id]["inventory"][name] = item
-            else:
-                embed = discord.Embed(
-                    colour=discord.Colour.from_rgb(255, 255, 0),
-                    description=f"Maximum item limit reached"
-                )
-                embed.set_author(name="Expedition",
-                                 icon_url=bot.user.avatar_url)
-                await ctx.send(embed=embed)
-
-        else:
-            msg = "❌ Failed"
-
-        embed = discord.Embed(
-            colour=discord.Colour.from_rgb(255, 255, 0),
-            description=f"<@{user.id}>´s mission from {_time}\n\n{msg}".replace(
-                ",", " ")
-        )
-        embed.set_author(name="Expedition", icon_url=bot.user.avatar_url)
-        await ctx.send(embed=embed)
-
-        if mention:
-            await ctx.send(ctx.author.mention)
-
-        config["players"][user.id]["manpower"] += expedition["manpower"]
-
-        asyncs_on_hold.remove(a_time)
-        config.save()
-
 
 class Battle(commands.Cog):
     "Combat system"
@@ -2979,12 +3501,12 @@ class Battle(commands.Cog):
             if user == None:
                 user = ctx.author
 
-            manpower = int(config['players'][user.id]['manpower'] + (config['players'][user.id]
-                                                                     ['manpower']*config['players'][ctx.author.id]['stats']['warlord']*config['warlord_rate']))
+            stats = config.stats.get(user.id)
+            manpower = stats.manpower(config.player(user.id).manpower)
 
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
-                description=f"Manpower of <@{user.id}> is {manpower:,}\nWarlord boost: `{config['players'][ctx.author.id]['stats']['warlord']*config['warlord_rate']*100}%`".replace(
+                description=f"Manpower of <@{user.id}> is {manpower:,}\nWarlord boost: `{stats.warlord*100}%`".replace(
                     ",", " ")
             )
             embed.set_author(name="Manpower", icon_url=bot.user.avatar_url)
@@ -2993,24 +3515,40 @@ class Battle(commands.Cog):
             print(traceback.format_exc())
             await ctx.send(traceback.format_exc())
 
+    @commands.command(name="attack-odds", help="Estimate outcome of attack: attack-odds <player_manpower: int> <enemy_manpower: int> [player_support=0] [enemy_support=0]")
+    async def attack_odds(self, ctx: Context, player_manpower: int, enemy_manpower: int, player_support: int = 0, enemy_support: int = 0):
+        try:
+            # Simulation runs in worker thread, so it does not block other commands
+            result = await asyncio.get_event_loop().run_in_executor(None, battle.solve, player_manpower, enemy_manpower, player_support, enemy_support, config["exact_odds_states"], config["odds_trials"])
+            probabilities = result["probabilities"]
+
+            embed = discord.Embed(
+                title="Attack odds", description="Exact" if result["trials"] == None else f"{result['trials']:,} simulated battles".replace(",", " "), color=discord.Colour.from_rgb(255, 255, 0))
+            embed.set_author(name="Battle", icon_url=bot.user.avatar_url)
+            embed.add_field(
+                name="✅ Win", value=f"{probabilities['won']*100:.2f}%", inline=True)
+            embed.add_field(
+                name="❌ Loss", value=f"{probabilities['lost']*100:.2f}%", inline=True)
+            embed.add_field(
+                name="❓ Tie", value=f"{probabilities['tie']*100:.2f}%", inline=True)
+            embed.add_field(
+                name="❌ Out of rolls", value=f"{probabilities['out of rolls']*100:.2f}%", inline=True)
+            embed.add_field(name="Expected casualties",
+                            value=f"Your army: {result['player_casualties']:,.1f}\nEnemy army: {result['enemy_casualties']:,.1f}".replace(",", " "), inline=False)
+            await ctx.send(embed=embed)
+        except:
+            print(traceback.format_exc())
+            await ctx.send(traceback.format_exc())
+
     @commands.command(name="attack", help="Automatized battle system: attack <player_manpower: int> ")
     async def attack(self, ctx: Context, player_manpower: int, enemy_manpower: int, hours: float, player_support: int = 0, enemy_support: int = 0, mention: bool = True, skip_colonization: bool = False, income: int = 0, income_role: discord.Role = None):
         global time
-        global asyncs_on_hold
 
         if config["block_asyncs"]:
             await ctx.send("Function blocked by 'hold-asyncs'")
             return
 
-        random.seed(time.time())
-
-        _time = datetime.datetime.now(tz=pytz.timezone(
-            'Europe/Prague')).strftime(r'%H:%M:%S')
-        a_time = (datetime.datetime.now(tz=pytz.timezone('Europe/Prague')
-                                        ) + datetime.timedelta(hours=hours)).strftime(r'%H:%M:%S')
-        asyncs_on_hold.append(a_time)
         pstart, estart = player_manpower, enemy_manpower
-        seconds = hours * 3600
 
         if hours > config["maximum_attack_time"]:
             logging.debug(f"Reached max attack time limit")
@@ -3021,38 +3559,30 @@ class Battle(commands.Cog):
             await ctx.send(embed=embed)
             return
 
-        if config["players"][ctx.author.id]["manpower"] >= pstart:
-            config["players"][ctx.author.id]["manpower"] -= pstart
-        else:
-            logging.debug(f"Not enought forces")
+        try:
+            async with config.locks(ctx.author.id):
+                if skip_colonization == False:
+                    charge(config, ctx.author.id,
+                           manpower=pstart, balance=estart)
+                else:
+                    charge(config, ctx.author.id, manpower=pstart)
+                _, job = scheduler.schedule("attack", ctx.author.id, ctx.channel.id, hours * 3600, player_manpower=pstart, enemy_manpower=estart, player_support=player_support,
+                                            enemy_support=enemy_support, mention=mention, skip_colonization=skip_colonization, income=income, income_role=income_role.id if income_role != None else None)
+        except TransactionError as e:
+            logging.debug(f"Attack not started: {e}")
             embed = discord.Embed(
                 colour=discord.Colour.from_rgb(255, 255, 0),
-                description=f"❌ Not enought manpower"
+                description=f"❌ {e} for colonization" if e.field == "balance" else f"❌ {e}"
             )
             await ctx.send(embed=embed)
             return
 
-        if skip_colonization == False:
-            if config["players"][ctx.author.id]["balance"] < estart:
-                logging.debug(f"Not enought money for colonization")
-                embed = discord.Embed(
-                    colour=discord.Colour.from_rgb(255, 255, 0),
-                    description=f"❌ Not enought money for colonization"
-                )
-                await ctx.send(embed=embed)
-                config["players"][ctx.author.id]["manpower"] += pstart
-                return
-            else:
-                config["players"][ctx.author.id]["balance"] -= estart
-
-        config.save()
-
         embed = discord.Embed(
             title="Attack", description=f"<@{ctx.author.id}>", color=discord.Colour.from_rgb(255, 255, 0))
         embed.set_author(name="Succesfully added to queue",
                          icon_url=bot.user.avatar_url)
-        embed.add_field(name="Time", value=(datetime.datetime.now(tz=pytz.timezone(
-            'Europe/Prague')) + datetime.timedelta(hours=hours)).strftime(r'%H:%M:%S'), inline=False)
+        embed.add_field(name="Time", value=prague_time(
+            job["due"], r'%H:%M:%S'), inline=False)
         embed.add_field(name="Your manpower",
                         value=player_manpower, inline=False)
         embed.add_field(name="Enemy manpower",
@@ -3066,81 +3596,6 @@ class Battle(commands.Cog):
         embed.add_field(name="Income", value=income, inline=False)
         await ctx.send(embed=embed)
 
-        await asyncio.sleep(delay=seconds)
-        await ctx.send("Battle started")
-
-        if player_support > 0:
-            player_support_roll = random.randint(0, player_support)
-            enemy_manpower -= player_support_roll
-
-        enemy_manpower = max(enemy_manpower, 0)
-
-        if enemy_support > 0:
-            enemy_support_roll = random.randint(0, enemy_support)
-            player_manpower -= enemy_support_roll
-
-        player_manpower = max(player_manpower, 0)
-
-        iteration = 1
-
-        while iteration <= 3:
-            if enemy_manpower > 0 and player_manpower > 0:
-                print(
-                    f"Rolling: {player_manpower} | {enemy_manpower}: roll - {iteration}")
-                e_before_roll = enemy_manpower
-                player_roll = random.randint(0, player_manpower)
-                enemy_manpower -= player_roll
-                enemy_manpower = max(enemy_manpower, 0)
-
-                if enemy_manpower > 0:
-                    enemy_roll = random.randint(0, enemy_manpower)
-                    player_manpower -= enemy_roll
-                if enemy_manpower == 0:
-                    enemy_roll = random.randint(0, e_before_roll)
-                    player_manpower -= enemy_roll
-
-                player_manpower = max(player_manpower, 0)
-
-            iteration += 1
-
-        if iteration == 4 and player_manpower > 0 and enemy_manpower > 0:
-            msg = "❌ Out of rolls"
-            if skip_colonization == False:
-                config["players"][ctx.author.id]["balance"] += estart
-        elif player_manpower > 0 and enemy_manpower == 0:
-            msg = "✅ You won"
-
-            if config["allow_attack_income"]:
-                if income_role != None:
-                    if income >= 200000:
-                        ctx.send("Income too high, ask admin to add it")
-                    else:
-                        config["income"][income_role.id] += income
-        elif player_manpower == 0 and enemy_manpower > 0:
-            msg = "❌ You lost"
-            if skip_colonization == False:
-                config["players"][ctx.author.id]["balance"] += estart
-        else:
-            msg = "❓ Tie ❓"
-            if skip_colonization == False:
-                config["players"][ctx.author.id]["balance"] += estart
-
-        config["players"][ctx.author.id]["manpower"] += player_manpower
-
-        embed = discord.Embed(
-            colour=discord.Colour.from_rgb(255, 255, 0),
-            description=f"<@{ctx.author.id}>´s attack from {_time}\n\n{msg}\n\n`Before battle:`\n    Your army: {pstart:,}\n    Enemy army: {estart:,}\n\n`After battle:`\n    Your army: {player_manpower:,}\n    Enemy army: {enemy_manpower:,}\n\n`Casualties:`\n    Your army: {pstart-player_manpower:,}\n    Enemy army: {estart-enemy_manpower}".replace(
-                ",", " ")
-        )
-        embed.set_author(name="Attack", icon_url=bot.user.avatar_url)
-        await ctx.send(embed=embed)
-
-        if mention:
-            await ctx.send(ctx.author.mention)
-
-        asyncs_on_hold.remove(a_time)
-        config.save()
-
 
 if __name__ == "__main__":
     bot.add_cog(Money())
@@ -3156,3 +3611,4 @@ if __name__ == "__main__":
     bot.add_cog(Battle())
 
     bot.run(args.token)
+    config.flush_sync()
@@ -0,0 +1,177 @@
+import re
+import zlib
+
+from fuzzy import TrigramIndex
+from ranking import SortedKeys
+
+SUFFIX = re.compile(r" \([0-9]+\)$")
+
+
+def base_name(name: str):
+    "Item name without duplicate suffix, lowercased: 'Iron sword (2)' is 'iron sword'"
+    return SUFFIX.sub("", name).lower()
+
+
+def listing_id(seller: int, name: str):
+    "Short id of listing, the same for the same seller and item after restart"
+    value = zlib.crc32(f"{seller}:{name}".encode())
+    digits = ""
+    while value > 0 or digits == "":
+        value, digit = divmod(value, 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+    return digits
+
+
+class Listing():
+    "Item listed in player shop"
+    __slots__ = ("id", "seller", "name", "price", "rarity", "type")
+
+    def __init__(self, id: str, seller: int, name: str, price, rarity: str, type: str):
+        self.id = id
+        self.seller = seller
+        self.name = name
+        self.price = price
+        self.rarity = rarity
+        self.type = type
+
+
+class Market():
+    """All player shop listings, ordered by price in indexes by item name, rarity, type and rarity with type
+    Kept current by change records, so search and cheapest do not scan players"""
+
+    def __init__(self):
+        self.build({})
+
+    def build(self, players: dict):
+        self.listings = {}
+        self.ids = {}
+        self.sellers = {}
+        self.orders = {}
+        self.names = TrigramIndex()
+        for seller, player in players.items():
+            self.reindex(seller, player)
+
+    def __len__(self):
+        return len(self.listings)
+
+    def keys(self, listing: Listing):
+        "Indexes listing is in"
+        keys = ["all", ("name", base_name(listing.name))]
+        if listing.rarity != None:
+            keys.append(("rarity", listing.rarity))
+        if listing.type != None:
+            keys.append(("type", listing.type))
+        if listing.rarity != None and listing.type != None:
+            keys.append(("rarity-type", listing.rarity, listing.type))
+        return keys
+
+    def add(self, seller: int, name: str, price, item):
+        "List item of seller, item is its record in inventory"
+        self.remove(seller, name)
+        _id = listing_id(seller, name)
+        while _id in self.listings:
+            _id += "x"
+        listing = Listing(_id, seller, name, price,
+                          item.get("rarity"), item.get("type"))
+        self.listings[_id] = listing
+        self.ids[(seller, name)] = _id
+        self.sellers.setdefault(seller, set()).add(_id)
+        for key in self.keys(listing):
+            self.orders.setdefault(key, SortedKeys()).add((price, _id))
+        self.names.add(base_name(name))
+        return listing
+
+    def remove(self, seller: int, name: str):
+        _id = self.ids.pop((seller, name), None)
+        if _id == None:
+            return
+        listing = self.listings.pop(_id)
+        self.sellers[seller].discard(_id)
+        for key in self.keys(listing):
+            order = self.orders[key]
+            order.remove((listing.price, _id))
+            if len(order) == 0:
+                del self.orders[key]
+                if key[0] == "name":
+                    self.names.remove(key[1])
+
+    def reindex(self, seller: int, player):
+        """Replace listings of seller with current player shop (player None removes them)
+        Shop entries of items no longer in inventory can't be bought, so they are not listed"""
+        for _id in list(self.sellers.get(seller, ())):
+            self.remove(seller, self.listings[_id].name)
+        if player != None:
+            for name, price in player.player_shop.items():
+                item = player.inventory.get(name)
+                if item != None:
+                    self.add(seller, name, price, item)
+
+    def update(self, record, players: dict):
+        "Apply change record of config"
+        kind = record[0]
+        if kind == "list":
+            _, seller, name, price = record
+            item = players[seller].inventory.get(name)
+            if price == None or item == None:
+                self.remove(seller, name)
+            else:
+                self.add(seller, name, price, item)
+        elif kind == "move" and record[2] in players[record[1]].player_shop:
+            # Listed item moved between inventory and equiped slot
+            self.reindex(record[1], players[record[1]])
+        elif kind == "player":
+            self.reindex(record[1], players.get(record[1]))
+
+    def listing(self, _id: str):
+        return self.listings.get(_id.lower())
+
+    def resolve(self, name: str):
+        "Base name of listed items closest to name, None if nothing similar is listed"
+        name = base_name(name)
+        if name in self.names:
+            return name
+        matches = self.names.search(name, 1)
+        return matches[0] if matches != [] else None
+
+    def query(self, name: str = None, rarity: str = None, type: str = None):
+        "(index key, filter of listings not covered by index) for search"
+        if name != None:
+            return ("name", name), lambda listing: (rarity == None or listing.rarity == rarity) and (type == None or listing.type == type)
+        if rarity != None and type != None:
+            return ("rarity-type", rarity, type), None
+        if rarity != None:
+            return ("rarity", rarity), None
+        if type != None:
+            return ("type", type), None
+        return "all", None
+
+    def search(self, name: str = None, rarity: str = None, type: str = None, low=None, high=None, descending: bool = False, start: int = 0, count: int = 30):
+        """(listings from start, total number of matches) ordered by price
+        name is base name (see resolve), low and high are inclusive price limits"""
+        key, keep = self.query(name, rarity, type)
+        order = self.orders.get(key)
+        if order == None:
+            return [], 0
+        first = order.bisect((low, "")) if low != None else 0
+        last = order.bisect((high, "￿")) if high != None else len(order)
+        if last <= first:
+            return [], 0
+
+        if keep == None:
+            if descending:
+                keys = order.slice(max(last - start - count, first),
+                                   min(count, last - start - first))[::-1]
+            else:
+                keys = order.slice(first + start, min(count, last - first - start))
+            return [self.listings[_id] for _, _id in keys], last - first
+
+        # Name index holds listings of one item, the rest is filtered while reading it
+        matches = [self.listings[_id] for _, _id in order.slice(first, last - first)
+                   if keep(self.listings[_id])]
+        if descending:
+            matches.reverse()
+        return matches[start:start + count], len(matches)
+
+    def cheapest(self, name: str, count: int = 10):
+        "Cheapest listings of item with base name"
+        return self.search(name, count=count)[0]
@@ -0,0 +1,293 @@
+import re
+
+from schema import STATS
+from storage import snapshot
+
+
+class Missing():
+    "Marks key missing in JSON, so conversion stays lossless"
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING = Missing()
+
+
+class Model():
+    """Slot class with mapping access by JSON keys
+    KEYS maps JSON keys to attributes, unknown keys are kept in extra
+    Only values of keys in NESTED are passed through load, the rest is stored as is (work and buy write fields by key)"""
+    __slots__ = ("extra",)
+    KEYS = {}
+    NESTED = frozenset()
+
+    @classmethod
+    def from_json(cls, data: dict):
+        self = cls.__new__(cls)
+        for key, attr in cls.KEYS.items():
+            setattr(self, attr, cls.load(key, data[key])
+                    if key in data else MISSING)
+        extra = {key: value for key, value in data.items()
+                 if not key in cls.KEYS}
+        self.extra = extra if extra != {} else None
+        return self
+
+    @classmethod
+    def load(cls, key: str, value):
+        "Convert nested JSON value of key"
+        return value
+
+    def to_json(self):
+        data = {}
+        for key, attr in self.KEYS.items():
+            value = getattr(self, attr)
+            if value is not MISSING:
+                data[key] = snapshot(value)
+        if self.extra != None:
+            data.update(snapshot(self.extra))
+        return data
+
+    def __getitem__(self, key: str):
+        try:
+            value = getattr(self, self.KEYS[key])
+        except KeyError:
+            if self.extra == None:
+                raise
+            return self.extra[key]
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        try:
+            attr = self.KEYS[key]
+        except KeyError:
+            if self.extra == None:
+                self.extra = {}
+            self.extra[key] = value
+            return
+        setattr(self, attr, self.load(key, value)
+                if key in self.NESTED else value)
+
+    def __delitem__(self, key: str):
+        attr = self.KEYS.get(key)
+        if attr == None:
+            if self.extra == None:
+                raise KeyError(key)
+            del self.extra[key]
+        else:
+            if getattr(self, attr) is MISSING:
+                raise KeyError(key)
+            setattr(self, attr, MISSING)
+
+    def keys(self):
+        keys = [key for key, attr in self.KEYS.items() if getattr(self, attr)
+                is not MISSING]
+        return keys + list(self.extra) if self.extra != None else keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key: str):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def __eq__(self, other):
+        if isinstance(other, Model):
+            other = other.to_json()
+        return self.to_json() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_json()})"
+
+
+class Stats(Model):
+    "Talents of player"
+    __slots__ = tuple(STATS)
+    KEYS = {stat: stat for stat in STATS}
+
+
+class Item(Model):
+    "Item in inventory or equiped slot of player"
+    __slots__ = ("id", "description", "type", "rarity", "income",
+                 "income_percent", "discount", "discount_percent", "equiped")
+    KEYS = {key: key for key in __slots__}
+
+
+# Copies of item are named "Name (1)", "Name (2)", ...
+COPY = re.compile(r"^(.*) \(([0-9]+)\)$")
+
+
+class Items(dict):
+    """Items of player by name, JSON items are converted on insert
+    Indexes by id, rarity and type are built on first lookup and kept current on every change after,
+    so slot checks and lookups by rarity are O(1) or O(matches) and players nobody looks at pay nothing for them.
+    copies holds highest copy number of each name, so free name for new copy is found without probing"""
+    __slots__ = ("ids", "rarities", "types", "copies")
+
+    def __init__(self, data: dict = None):
+        super().__init__({} if data == None else {name: item if isinstance(item, Item) else Item.from_json(item)
+                          for name, item in data.items()})
+        self.ids = None
+
+    def _build(self):
+        if self.ids != None:
+            return
+        self.ids = {}
+        self.rarities = {}
+        self.types = {}
+        self.copies = {}
+        for name, item in self.items():
+            self._index(name, item)
+
+    def _index(self, name: str, item):
+        if item.get("id") != None:
+            self.ids[item.id] = name
+        self.rarities.setdefault(item.get("rarity"), {})[name] = None
+        self.types.setdefault(item.get("type"), {})[name] = None
+        match = COPY.match(name)
+        if match != None:
+            base, number = match.group(1), int(match.group(2))
+            self.copies[base] = max(self.copies.get(base, 0), number)
+
+    def _unindex(self, name: str, item):
+        if item.get("id") != None and self.ids.get(item.id) == name:
+            del self.ids[item.id]
+        for index, key in [(self.rarities, item.get("rarity")), (self.types, item.get("type"))]:
+            names = index[key]
+            del names[name]
+            if not names:
+                del index[key]
+
+    def __setitem__(self, name: str, item):
+        if not isinstance(item, Item):
+            item = Item.from_json(item)
+        if self.ids != None:
+            if name in self:
+                self._unindex(name, dict.__getitem__(self, name))
+            self._index(name, item)
+        super().__setitem__(name, item)
+
+    def __delitem__(self, name: str):
+        if self.ids != None:
+            self._unindex(name, dict.__getitem__(self, name))
+        super().__delitem__(name)
+
+    def pop(self, name: str, *default):
+        if not name in self:
+            return super().pop(name, *default)
+        item = dict.__getitem__(self, name)
+        del self[name]
+        return item
+
+    def popitem(self):
+        name = next(reversed(self))
+        return name, self.pop(name)
+
+    def setdefault(self, name: str, item=None):
+        if not name in self:
+            self[name] = item
+        return dict.__getitem__(self, name)
+
+    def update(self, *args, **kwargs):
+        for name, item in dict(*args, **kwargs).items():
+            self[name] = item
+
+    def clear(self):
+        super().clear()
+        self.ids = None
+
+    def free_name(self, name: str, *others):
+        "name, or next copy name if name is taken here or in others (other slots of the same player)"
+        slots = (self,) + others
+        if not any(name in slot for slot in slots):
+            return name
+        for slot in slots:
+            slot._build()
+        number = max(slot.copies.get(name, 0) for slot in slots) + 1
+        # Only names added by hand can be taken here
+        while any(f"{name} ({number})" in slot for slot in slots):
+            number += 1
+        return f"{name} ({number})"
+
+    def add(self, name: str, item, *others):
+        "Insert item under free name derived from name, returns the name"
+        name = self.free_name(name, *others)
+        self[name] = item
+        return name
+
+    def named(self, item_id: int):
+        "Name of item with id, None if there is none"
+        self._build()
+        return self.ids.get(item_id)
+
+    def of_rarity(self, rarity: str):
+        "Names of items with rarity"
+        self._build()
+        return list(self.rarities.get(rarity, ()))
+
+    def of_type(self, type: str):
+        "Names of items with type, in equiped slot it is item occupying the slot"
+        self._build()
+        return list(self.types.get(type, ()))
+
+
+class Player(Model):
+    "Player record, see schema.new_player for JSON layout"
+    __slots__ = ("balance", "last_work", "xp", "level", "manpower", "skillpoints",
+                 "upgrade", "maxupgrade", "generation", "player_shop", "inventory", "equiped", "stats")
+    KEYS = {"balance": "balance", "last-work": "last_work", "xp": "xp", "level": "level",
+            "manpower": "manpower", "skillpoints": "skillpoints", "upgrade": "upgrade",
+            "maxupgrade": "maxupgrade", "generation": "generation", "player_shop": "player_shop", "inventory": "inventory",
+            "equiped": "equiped", "stats": "stats"}
+    NESTED = frozenset(["stats", "inventory", "equiped"])
+
+    @classmethod
+    def load(cls, key: str, value):
+        if key == "stats" and not isinstance(value, Stats):
+            return Stats.from_json(value)
+        if key in ["inventory", "equiped"] and not isinstance(value, Items):
+            return Items(value)
+        return value
+
+
+class Players(dict):
+    "Players by id, JSON records are converted on insert and missing player is created on first access"
+
+    def __init__(self, data: dict, materialize):
+        super().__init__({player: record if isinstance(record, Player) else Player.from_json(record)
+                          for player, record in data.items()})
+        self.materialize = materialize
+
+    def __setitem__(self, player: int, record):
+        if not isinstance(record, Player):
+            record = Player.from_json(record)
+        super().__setitem__(player, record)
+
+    def __missing__(self, player):
+        if not isinstance(player, int):
+            raise KeyError(player)
+        self.materialize(player)
+        return dict.__getitem__(self, player)
@@ -0,0 +1,109 @@
+import heapq
+import logging
+
+import discord
+
+# Same controls as DiscordUtils AutoEmbedPaginator: first, previous, close, next, last
+CONTROLS = ('⏮️', '⏪', '🔐', '⏩', '⏭️')
+
+
+class Paginator():
+    """Message showing one page, next page is rendered only when it is requested
+    provider(page) returns (embed, number of pages), pages are counted from 0"""
+    __slots__ = ("message", "author", "provider", "page", "pages", "expires")
+
+    def __init__(self, message, author: int, provider, pages: int, expires: float):
+        self.message = message
+        self.author = author
+        self.provider = provider
+        self.page = 0
+        self.pages = pages
+        self.expires = expires
+
+    def target(self, emoji: str):
+        "Page selected by control emoji, None closes paginator"
+        return {
+            CONTROLS[0]: 0,
+            CONTROLS[1]: max(self.page - 1, 0),
+            CONTROLS[2]: None,
+            CONTROLS[3]: min(self.page + 1, self.pages - 1),
+            CONTROLS[4]: self.pages - 1
+        }[emoji]
+
+
+class ReactionRouter():
+    """Open paginators by message id, reactions are dispatched from one event handler
+    Paginators expire after timeout without reaction, sweep evicts them in deadline order"""
+
+    def __init__(self, clock, timeout: int = 60):
+        self.clock = clock
+        self.timeout = timeout
+        self.open = {}
+        self.deadlines = []
+
+    async def start(self, ctx, provider, page: int = 0):
+        "Send page and open paginator when there is more than one page"
+        embed, pages = await provider(page)
+        message = await ctx.send(embed=embed)
+        if pages <= 1:
+            return message
+        for emoji in CONTROLS:
+            try:
+                await message.add_reaction(emoji)
+            except:
+                pass
+        paginator = Paginator(message, ctx.author.id, provider, pages,
+                              self.clock.time() + self.timeout)
+        paginator.page = min(max(page, 0), pages - 1)
+        self.open[message.id] = paginator
+        heapq.heappush(self.deadlines, (paginator.expires, message.id))
+        return message
+
+    async def dispatch(self, message_id: int, user_id: int, emoji: str):
+        "Turn page of paginator on message, returns False if reaction does not belong to any"
+        paginator = self.open.get(message_id)
+        if paginator == None or user_id != paginator.author or not emoji in CONTROLS:
+            return False
+
+        page = paginator.target(emoji)
+        if page == None:
+            await self.close(message_id)
+            return True
+
+        paginator.expires = self.clock.time() + self.timeout
+        heapq.heappush(self.deadlines, (paginator.expires, message_id))
+        try:
+            await paginator.message.remove_reaction(emoji, discord.Object(id=user_id))
+        except:
+            pass
+        if page != paginator.page:
+            paginator.page = page
+            embed, paginator.pages = await paginator.provider(page)
+            await paginator.message.edit(embed=embed)
+        return True
+
+    async def close(self, message_id: int):
+        "Forget paginator and remove control reactions of the bot"
+        paginator = self.open.pop(message_id, None)
+        if paginator == None:
+            return
+        for emoji in CONTROLS:
+            try:
+                await paginator.message.remove_reaction(emoji, paginator.message.author)
+            except:
+                pass
+
+    async def sweep(self):
+        "Close paginators whose timeout passed, entries of extended deadlines are skipped"
+        now = self.clock.time()
+        expired = []
+        while self.deadlines != [] and self.deadlines[0][0] <= now:
+            expires, message_id = heapq.heappop(self.deadlines)
+            paginator = self.open.get(message_id)
+            if paginator != None and paginator.expires == expires:
+                expired.append(message_id)
+        for message_id in expired:
+            await self.close(message_id)
+        if expired != []:
+            logging.debug(f"Closed {len(expired)} expired paginators")
+        return len(expired)
@@ -0,0 +1,141 @@
+import bisect
+
+FIELDS = ["balance", "level", "xp", "manpower"]
+
+
+class SortedKeys():
+    """Sorted list split to buckets, with Fenwick tree over bucket sizes
+    Insert, remove and lookup by position are O(log n + LOAD)"""
+    LOAD = 256
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self.buckets = [keys[i:i + self.LOAD]
+                        for i in range(0, len(keys), self.LOAD)]
+        self.reindex()
+
+    def reindex(self):
+        "Rebuild maxes and Fenwick tree after buckets were split or removed"
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.tree = [0] * (len(self.buckets) + 1)
+        for i, bucket in enumerate(self.buckets, start=1):
+            self.tree[i] += len(bucket)
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def _grow(self, bucket: int, delta: int):
+        i = bucket + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _before(self, bucket: int):
+        "Number of keys in buckets before bucket"
+        total = 0
+        i = bucket
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position: int):
+        "(bucket, offset) of key at position"
+        bucket = 0
+        step = 1 << (len(self.tree).bit_length() - 1)
+        while step > 0:
+            if bucket + step < len(self.tree) and self.tree[bucket + step] <= position:
+                bucket += step
+                position -= self.tree[bucket]
+            step >>= 1
+        return bucket, position
+
+    def __len__(self):
+        return self._before(len(self.buckets))
+
+    def add(self, key):
+        if self.buckets == []:
+            self.buckets = [[key]]
+            self.reindex()
+            return
+        i = min(bisect.bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[i]
+        bisect.insort(bucket, key)
+        self.maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self.LOAD:
+            self.buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self.reindex()
+        else:
+            self._grow(i, 1)
+
+    def remove(self, key):
+        i = bisect.bisect_left(self.maxes, key)
+        bucket = self.buckets[i]
+        del bucket[bisect.bisect_left(bucket, key)]
+        if bucket == []:
+            del self.buckets[i]
+            self.reindex()
+        else:
+            self.maxes[i] = bucket[-1]
+            self._grow(i, -1)
+
+    def bisect(self, key):
+        "Number of keys lower than key"
+        i = bisect.bisect_left(self.maxes, key)
+        if i == len(self.buckets):
+            return len(self)
+        return self._before(i) + bisect.bisect_left(self.buckets[i], key)
+
+    def slice(self, start: int, count: int):
+        "Up to count keys from position start"
+        keys = []
+        if start >= len(self) or count <= 0:
+            return keys
+        bucket, offset = self._locate(start)
+        while bucket < len(self.buckets) and len(keys) < count:
+            keys.extend(self.buckets[bucket][offset:offset + count - len(keys)])
+            bucket += 1
+            offset = 0
+        return keys
+
+
+class Ranking():
+    """Players ordered by balance, level, xp and manpower, highest first (ties by id)
+    Kept up to date from change records, so leaderboard and rank do not sort all players"""
+
+    def __init__(self):
+        self.orders = {field: SortedKeys() for field in FIELDS}
+        self.values = {field: {} for field in FIELDS}
+
+    def build(self, players: dict):
+        self.values = {field: {player: record[field] for player, record in players.items()
+                               if field in record} for field in FIELDS}
+        self.orders = {field: SortedKeys((-value, player) for player, value in self.values[field].items())
+                       for field in FIELDS}
+
+    def update(self, player: int, record, fields=FIELDS):
+        "Move player to current values of record (None removes player)"
+        for field in fields:
+            values = self.values[field]
+            new = record.get(field) if record != None else None
+            if player in values:
+                if values[player] == new:
+                    continue
+                self.orders[field].remove((-values.pop(player), player))
+            if new != None:
+                self.orders[field].add((-new, player))
+                values[player] = new
+
+    def __len__(self):
+        return len(self.values["balance"])
+
+    def top(self, field: str, start: int = 0, count: int = 10):
+        "List of (player, value) from position start (0 is the best)"
+        return [(player, -value) for value, player in self.orders[field].slice(start, count)]
+
+    def rank(self, field: str, player: int, value=None):
+        """Position of player (1 is the best)
+        Player without record is placed with value, behind stored players with the same value"""
+        if player in self.values[field]:
+            return self.orders[field].bisect((-self.values[field][player], player)) + 1
+        return self.orders[field].bisect((-value, float("inf"))) + 1
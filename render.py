@@ -0,0 +1,86 @@
+import asyncio
+import collections
+import inspect
+import logging
+import time
+
+
+class RenderCache():
+    """Rendered views by key, valid while versions of topics the view depends on do not change
+    Mutations bump topics, concurrent renders of the same key and versions share one computation"""
+
+    def __init__(self, limit: int = 1024):
+        self.limit = limit
+        self.versions = {}
+        self.entries = collections.OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.render_time = 0.0
+
+    def bump(self, *topics):
+        "Views depending on topics are rendered again on next use"
+        for topic in topics:
+            self.versions[topic] = self.versions.get(topic, 0) + 1
+
+    def clear(self):
+        "Drop every rendered view, used when whole config changes"
+        self.entries.clear()
+
+    def stamp(self, topics):
+        return tuple(self.versions.get(topic, 0) for topic in topics)
+
+    async def get(self, key, topics, render, *args):
+        "Cached result of render(*args) (plain or coroutine function) for key"
+        stamp = self.stamp(topics)
+        entry = self.entries.get(key)
+        if entry != None and entry[0] == stamp:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        flight = self.inflight.get((key, stamp))
+        if flight != None:
+            self.shared += 1
+            return await asyncio.shield(flight)
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self.inflight[(key, stamp)] = future
+        try:
+            start = time.perf_counter()
+            value = render(*args)
+            if inspect.isawaitable(value):
+                value = await value
+            self.render_time += time.perf_counter() - start
+            logging.debug(f"Rendered {key}")
+        except BaseException as e:
+            future.set_exception(e)
+            # Exception is raised to the caller, waiters get it from the future
+            future.exception()
+            raise
+        finally:
+            del self.inflight[(key, stamp)]
+
+        future.set_result(value)
+        # Result rendered from outdated state is returned, but not kept
+        if self.stamp(topics) == stamp:
+            self.entries[key] = (stamp, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.limit:
+                self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        "Counters for config-stats"
+        total = self.hits + self.misses + self.shared
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "hit_rate": (self.hits + self.shared) / total if total != 0 else 0,
+            "render_time": self.render_time,
+            "average_render": self.render_time / self.misses if self.misses != 0 else 0
+        }
@@ -0,0 +1,112 @@
+import asyncio
+import heapq
+import logging
+import traceback
+
+from clock import Clock
+
+
+class Scheduler():
+    """Durable timers for expeditions, attacks, ...
+    Pending jobs are small records in config["jobs"] (each change is written as one entry, not the whole key), due times are kept in a heap
+    and one dispatcher task settles them, so jobs survive restarts and overdue ones are settled on startup"""
+
+    def __init__(self, config, send, clock: Clock = None):
+        self.config = config
+        self.send = send
+        self.clock = clock if clock != None else Clock()
+        self.handlers = {}
+        self.heap = []
+        self.next_id = 1
+        self.wake = None
+        self.task = None
+
+    def handler(self, kind: str):
+        """Register settle function of job kind
+        Settle function is synchronous, gets job and returns messages (str or embed) for channel of job"""
+        def decorator(function):
+            self.handlers[kind] = function
+            return function
+        return decorator
+
+    def load(self):
+        "Rebuild heap from jobs in config, call after config is replaced"
+        jobs = self.config["jobs"]
+        self.heap = [(job["due"], job_id) for job_id, job in jobs.items()]
+        heapq.heapify(self.heap)
+        self.next_id = max(jobs, default=0) + 1
+        if self.wake != None:
+            self.wake.set()
+
+    def schedule(self, kind: str, player: int, channel: int, seconds: float, **args):
+        "Add job due in seconds, returns its record"
+        now = self.clock.time()
+        job = {
+            "kind": kind,
+            "player": player,
+            "channel": channel,
+            "created": now,
+            "due": now + seconds,
+            "args": args
+        }
+        job_id = self.next_id
+        self.next_id += 1
+        self.config.put("jobs", job_id, job)
+        heapq.heappush(self.heap, (job["due"], job_id))
+        if self.wake != None:
+            self.wake.set()
+        return job_id, job
+
+    def pending(self, player: int = None):
+        "Sorted list of (id, job), optionally only jobs of player"
+        jobs = self.config["jobs"]
+        return sorted(((job_id, job) for job_id, job in jobs.items() if player == None or job["player"] == player), key=lambda x: (x[1]["due"], x[0]))
+
+    def settle_due(self):
+        """Settle all jobs that are due, returns list of (job, messages)
+        Job is removed and settled without awaiting, so both land in the same flush"""
+        settled = []
+        jobs = self.config["jobs"]
+        now = self.clock.time()
+        while self.heap != [] and self.heap[0][0] <= now:
+            _, job_id = heapq.heappop(self.heap)
+            job = jobs.get(job_id)
+            if job == None:
+                continue
+            self.config.put("jobs", job_id, None)
+            try:
+                messages = self.handlers[job["kind"]](job)
+            except:
+                logging.error(traceback.format_exc())
+                logging.error(f"Unable to settle job {job_id}: {job}")
+                messages = [traceback.format_exc()]
+            settled.append((job, messages))
+        return settled
+
+    async def run(self):
+        "Dispatcher, sleeps until the earliest due job"
+        while True:
+            self.wake.clear()
+            for job, messages in self.settle_due():
+                asyncio.ensure_future(self.report(job, messages))
+            timeout = max(self.heap[0][0] - self.clock.time(),
+                          0) if self.heap != [] else None
+            await self.clock.wait(self.wake, timeout)
+
+    async def report(self, job: dict, messages: list):
+        try:
+            await self.send(job, messages)
+        except:
+            logging.error(traceback.format_exc())
+            logging.error(f"Unable to report job {job}")
+
+    def start(self):
+        "Load jobs and start dispatcher if it is not running yet"
+        if self.task != None and not self.task.done():
+            return
+        self.wake = asyncio.Event()
+        self.load()
+        overdue = len([due for due, _ in self.heap if due <= self.clock.time()])
+        logging.info(
+            f"Scheduler started: {len(self.heap)} jobs pending, {overdue} overdue")
+        self.task = asyncio.ensure_future(self.run())
@@ -0,0 +1,130 @@
+import logging
+import time
+
+from storage import snapshot
+
+STATS = ["diplomacy", "warlord", "intrique",
+         "stewardship", "trading", "bartering", "learning"]
+
+
+def new_player(default_balance: int):
+    """Record of new player, the only place where player fields are defined
+    upgrade holds only owned items and maxupgrade only limits that differ from shop catalog,
+    generation holds catalog generation of those entries where it is not 0"""
+    return {
+        "balance": default_balance,
+        "last-work": 0,
+        "xp": 0,
+        "level": 1,
+        "manpower": 0,
+        "skillpoints": 0,
+        "upgrade": {},
+        "maxupgrade": {},
+        "generation": {},
+        "player_shop": {},
+        "inventory": {},
+        "equiped": {},
+        "stats": {stat: 0 for stat in STATS}
+    }
+
+
+def drop_defaults(data: dict, default: dict):
+    for player in [player for player, record in data["players"].items() if record == default]:
+        del data["players"][player]
+
+
+# region Migrations
+# Every migration runs once over whole config, append new ones to the end of MIGRATIONS
+
+def add_collections(data: dict):
+    "Top level collections added after first release"
+    data.setdefault("loot-table", {})
+    data.setdefault("missions", {})
+
+
+def backfill_players(data: dict):
+    "Fields added to players after first release"
+    defaults = new_player(data.get("default_balance", 0))
+    for record in data["players"].values():
+        for field, value in defaults.items():
+            if not field in record:
+                record[field] = snapshot(value)
+        for stat in STATS:
+            record["stats"].setdefault(stat, 0)
+
+
+def drop_default_players(data: dict):
+    "Players are created on first change, records that were never changed are dropped"
+    upgrade, maxupgrade = data.get("upgrade", {}), data.get("maxupgrade", {})
+    drop_defaults(data, {
+        **new_player(data.get("default_balance", 0)),
+        "upgrade": {item: 0 for item in upgrade},
+        "maxupgrade": {item: maxupgrade.get(item) for item in upgrade}
+    })
+
+
+def sparse_upgrades(data: dict):
+    "Keep only owned upgrades and limits overriding shop catalog"
+    maxupgrade = data.get("maxupgrade", {})
+    for record in data["players"].values():
+        record["upgrade"] = {item: count for item,
+                             count in record["upgrade"].items() if count != 0}
+        record["maxupgrade"] = {item: limit for item, limit in record["maxupgrade"].items(
+        ) if not item in maxupgrade or limit != maxupgrade[item]}
+    drop_defaults(data, new_player(data.get("default_balance", 0)))
+
+
+def add_jobs(data: dict):
+    "Pending expeditions and attacks of scheduler"
+    data.setdefault("jobs", {})
+
+
+def add_names(data: dict):
+    "Display names of members, kept for players who left the guild"
+    data.setdefault("names", {})
+
+
+def add_auctions(data: dict):
+    "Open auctions with items and bids in escrow"
+    data.setdefault("auctions", {})
+
+
+def item_ids(data: dict):
+    "Stable ids of items in inventories, equiped slots and auctions, item_id is the last one given"
+    last = data.get("item_id", 0)
+    items = [item for record in data["players"].values() for slot in ["inventory", "equiped"]
+             for item in record.get(slot, {}).values()] + [auction["record"] for auction in data.get("auctions", {}).values()]
+    for item in items:
+        if not "id" in item:
+            last += 1
+            item["id"] = last
+    data["item_id"] = last
+
+
+def upgrade_generations(data: dict):
+    "Catalog generation of each upgrade, counts of players from older generation are ignored"
+    data.setdefault("generations", {})
+    for record in data["players"].values():
+        record.setdefault("generation", {})
+
+
+MIGRATIONS = [add_collections, backfill_players,
+              drop_default_players, sparse_upgrades, add_jobs, add_names, add_auctions, item_ids, upgrade_generations]
+SCHEMA_VERSION = len(MIGRATIONS)
+# endregion
+
+
+def migrate(data: dict):
+    "Apply pending migrations in order, returns number of applied migrations"
+    version = data.get("schema_version", 0)
+    if version > SCHEMA_VERSION:
+        raise ValueError(
+            f"Config schema version {version} is newer than supported {SCHEMA_VERSION}")
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        start = time.perf_counter()
+        migration(data)
+        data["schema_version"] = number
+        logging.info(
+            f"Schema migration {number} ({migration.__name__}): {len(data['players'])} players in {time.perf_counter() - start:.3f}s")
+    return SCHEMA_VERSION - version
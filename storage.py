@@ -0,0 +1,519 @@
+import hashlib
+import json
+import logging
+import os
+import platform
+import sqlite3
+import threading
+import time
+
+
+def jsonKeys2int(x):
+    if isinstance(x, dict):
+        try:
+            return {int(k): v for k, v in x.items()}
+        except:
+            pass
+    return x
+
+
+def snapshot(x):
+    "Fast deep copy of json-like data as plain JSON, taken on the event loop so it is consistent"
+    if isinstance(x, dict):
+        return {k: snapshot(v) for k, v in x.items()}
+    if isinstance(x, list):
+        return [snapshot(v) for v in x]
+    if hasattr(x, "to_json"):
+        return x.to_json()
+    return x
+
+
+def write_snapshot(path: str, data: dict):
+    "Write data through temporary file, fsync and rename, with checksum footer"
+    body = json.dumps(data, indent=4, sort_keys=True, ensure_ascii=False)
+    checksum = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(body)
+        f.write(f"\n#sha256={checksum}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path)
+
+
+def read_snapshot(path: str):
+    "Read file written by write_snapshot, files without footer are accepted as legacy"
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    body, sep, footer = text.rpartition("\n#sha256=")
+    if sep:
+        if hashlib.sha256(body.encode("utf-8")).hexdigest() != footer.strip():
+            raise ValueError(f"Checksum mismatch in {path}")
+    else:
+        body = text
+    return json.loads(body, object_hook=jsonKeys2int)
+
+
+def fsync_dir(path: str):
+    "Make rename of path durable, not supported on Windows"
+    if platform.system() != "Windows":
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def refresh_upgrade(player, item: str, generation: int):
+    """Drop count and limit of upgrade bought before item was last added to or removed from shop catalog
+    generation is catalog generation of item, see Configuration.reset_upgrade"""
+    if player["generation"].get(item, 0) != generation:
+        player["upgrade"].pop(item, None)
+        player["maxupgrade"].pop(item, None)
+        player["generation"][item] = generation
+
+
+def apply_record(data: dict, record):
+    "Apply one change record (without sequence number) to config data"
+    kind = record[0]
+    if kind == "add":
+        _, player, field, delta = record
+        data["players"][player][field] += delta
+    elif kind == "assign":
+        _, player, field, value = record
+        data["players"][player][field] = value
+    elif kind == "upgrade":
+        # Generation is taken before the record, so replay does not depend on order of catalog writes
+        _, player, item, count, *generation = record
+        player = data["players"][player]
+        refresh_upgrade(player, item, generation[0] if generation else data.get(
+            "generations", {}).get(item, 0))
+        upgrade = player["upgrade"]
+        upgrade[item] = upgrade.get(item, 0) + count
+    elif kind == "move":
+        _, player, name, source, target = record
+        player = data["players"][player]
+        player[target][name] = player[source].pop(name)
+    elif kind == "give":
+        # Name in target inventory is chosen before the record, so replay gives the same names
+        _, source, target, name, *rename = record
+        data["players"][target]["inventory"][rename[0] if rename else name] = data["players"][source]["inventory"].pop(name)
+    elif kind == "list":
+        _, player, name, price = record
+        if price is None:
+            del data["players"][player]["player_shop"][name]
+        else:
+            data["players"][player]["player_shop"][name] = price
+    elif kind == "income":
+        _, role, delta = record
+        data["income"][role] += delta
+    elif kind == "player":
+        _, player, value = record
+        if value is None:
+            data["players"].pop(player, None)
+        else:
+            data["players"][player] = snapshot(value)
+    elif kind == "key":
+        _, key, value = record
+        data[key] = value
+    elif kind == "entry":
+        # One entry of collection key like jobs or auctions, value None removes it
+        _, key, entry, value = record
+        if value is None:
+            data[key].pop(entry, None)
+        else:
+            data[key][entry] = value
+    else:
+        raise ValueError(f"Unknown record: {record}")
+
+
+class JSONStorage():
+    "Whole config in one JSON file, every write rewrites the file"
+    name = "json"
+    extension = ""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self):
+        return read_snapshot(self.path)
+
+    def write(self, data: dict):
+        write_snapshot(self.path, data)
+
+    def close(self):
+        pass
+
+
+STATS = ["diplomacy", "warlord", "intrique",
+         "stewardship", "trading", "bartering", "learning"]
+PLAYER_COLUMNS = {"balance": "balance", "last-work": "last_work", "xp": "xp",
+                  "level": "level", "manpower": "manpower", "skillpoints": "skillpoints"}
+ITEM_COLUMNS = ["description", "type", "rarity", "income",
+                "income_percent", "discount", "discount_percent"]
+MISSION_COLUMNS = ["cost", "hours", "manpower",
+                   "level", "chance", "xp", "description"]
+RARITIES = ["common", "uncommon", "rare", "epic", "legendary"]
+# Keys written by entry, so change of one job or auction touches one row
+ENTRY_KEYS = ["jobs", "auctions"]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS income (role_id INTEGER PRIMARY KEY, income NOT NULL);
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY, {", ".join(PLAYER_COLUMNS.values())}, {", ".join(STATS)}, extra TEXT);
+CREATE TABLE IF NOT EXISTS upgrades (
+    player_id INTEGER NOT NULL, item TEXT NOT NULL, count, max TEXT, generation INTEGER,
+    PRIMARY KEY (player_id, item));
+CREATE TABLE IF NOT EXISTS items (
+    player_id INTEGER NOT NULL, slot TEXT NOT NULL, name TEXT NOT NULL,
+    {", ".join(ITEM_COLUMNS)}, extra TEXT,
+    PRIMARY KEY (player_id, slot, name));
+CREATE TABLE IF NOT EXISTS player_shop (
+    player_id INTEGER NOT NULL, item TEXT NOT NULL, price NOT NULL,
+    PRIMARY KEY (player_id, item));
+CREATE TABLE IF NOT EXISTS loot_table (name TEXT PRIMARY KEY, {", ".join(ITEM_COLUMNS)}, extra TEXT);
+CREATE TABLE IF NOT EXISTS missions (
+    name TEXT PRIMARY KEY, {", ".join(MISSION_COLUMNS)}, {", ".join(RARITIES)}, extra TEXT);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT NOT NULL, entry INTEGER NOT NULL, value TEXT NOT NULL,
+    PRIMARY KEY (key, entry));
+"""
+
+
+def _extra(record: dict, known):
+    """Json encoded leftovers of record, so conversion stays lossless
+    Keys with None value are kept here too, NULL column means the key is missing"""
+    extra = {k: v for k, v in record.items() if k not in known or v is None}
+    return json.dumps(extra, ensure_ascii=False) if extra else None
+
+
+def _row(columns, values):
+    "Record from columns of row, NULL columns are missing keys"
+    return {key: value for key, value in zip(columns, values) if value is not None}
+
+
+def _plain(section: dict, columns):
+    "Section fits its columns: not empty, only known keys and no None values"
+    return isinstance(section, dict) and section != {} and all(key in columns and value is not None for key, value in section.items())
+
+
+def _load_extra(record: dict, extra):
+    if extra:
+        record.update(json.loads(extra, object_hook=jsonKeys2int))
+    return record
+
+
+class JournalStorage():
+    "JSON snapshot plus append-only log of changes, replayed on load and folded back by compaction"
+    name = "journal"
+    extension = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.log = path + ".log"
+        self.file = None
+        self.seq = 0
+        self.size = 0
+
+    def read(self):
+        start = time.perf_counter()
+        data = read_snapshot(self.path)
+        self.seq = data.pop("journal_seq", 0)
+        replayed = 0
+
+        if os.path.exists(self.log):
+            with open(self.log, "rb") as f:
+                content = f.read()
+            valid = 0
+            for line in content.splitlines(keepends=True):
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Record not terminated")
+                    record = json.loads(line, object_hook=jsonKeys2int)
+                except ValueError:
+                    break
+                valid += len(line)
+                # Records already folded into snapshot by interrupted compaction
+                if record[0] <= self.seq:
+                    continue
+                apply_record(data, record[1:])
+                self.seq = record[0]
+                replayed += 1
+
+            if valid < len(content):
+                logging.warning(
+                    f"Discarding {len(content) - valid} bytes of torn record at the end of {self.log}")
+                with open(self.log, "r+b") as f:
+                    f.truncate(valid)
+            self.size = valid
+
+        logging.info(
+            f"Journal recovery: {replayed} records replayed in {time.perf_counter() - start:.3f}s")
+        return data
+
+    def append(self, records: list):
+        "Append records to log, cost depends on size of change only"
+        if self.file is None:
+            self.file = open(self.log, "a", encoding="utf-8")
+        lines = []
+        for record in records:
+            self.seq += 1
+            lines.append(json.dumps([self.seq, *record],
+                                    ensure_ascii=False, separators=(",", ":")) + "\n")
+        text = "".join(lines)
+        self.file.write(text)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size += len(text.encode("utf-8"))
+
+    def write(self, data: dict):
+        "Compaction, write snapshot including every appended record and start new log"
+        self.close()
+        data["journal_seq"] = self.seq
+        write_snapshot(self.path, data)
+        if os.path.exists(self.log):
+            os.remove(self.log)
+        self.size = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class SQLiteStorage():
+    """Normalized SQLite database, change records are written as single rows (field of player, upgrade, item, listing)
+    and only players saved whole are written again with all their rows"""
+    name = "sqlite"
+    extension = ".sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=FULL")
+            self.connection.executescript(SCHEMA)
+            # Databases created before upgrade generations
+            if not "generation" in [row[1] for row in self.connection.execute("PRAGMA table_info(upgrades)")]:
+                self.connection.execute(
+                    "ALTER TABLE upgrades ADD COLUMN generation INTEGER")
+        return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def read(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+
+        with self.lock:
+            db = self.connect()
+            data = {}
+            for key, value in db.execute("SELECT key, value FROM settings"):
+                data[key] = json.loads(value, object_hook=jsonKeys2int)
+
+            # Older databases keep these keys in settings
+            for key in ENTRY_KEYS:
+                data.setdefault(key, {})
+            for key, entry, value in db.execute("SELECT key, entry, value FROM entries"):
+                data[key][entry] = json.loads(
+                    value, object_hook=jsonKeys2int)
+
+            data["income"] = {role: income for role, income in db.execute(
+                "SELECT role_id, income FROM income")}
+
+            players = {}
+            for row in db.execute(f"SELECT id, {', '.join(PLAYER_COLUMNS.values())}, {', '.join(STATS)}, extra FROM players"):
+                player = {key: value for key, value in zip(
+                    PLAYER_COLUMNS, row[1:]) if value is not None}
+                stats = _row(STATS, row[1+len(PLAYER_COLUMNS):-1])
+                if stats != {}:
+                    player["stats"] = stats
+                for section in ["upgrade", "maxupgrade", "generation", "inventory", "equiped", "player_shop"]:
+                    player[section] = {}
+                players[row[0]] = _load_extra(player, row[-1])
+
+            for player_id, item, count, _max, generation in db.execute("SELECT player_id, item, count, max, generation FROM upgrades"):
+                if count is not None:
+                    players[player_id]["upgrade"][item] = count
+                if _max is not None:
+                    players[player_id]["maxupgrade"][item] = json.loads(_max)
+                if generation is not None:
+                    players[player_id]["generation"][item] = generation
+
+            for row in db.execute(f"SELECT player_id, slot, name, {', '.join(ITEM_COLUMNS)}, extra FROM items"):
+                item = _load_extra(_row(ITEM_COLUMNS, row[3:-1]), row[-1])
+                players[row[0]][row[1]][row[2]] = item
+
+            for player_id, item, price in db.execute("SELECT player_id, item, price FROM player_shop"):
+                players[player_id]["player_shop"][item] = price
+            data["players"] = players
+
+            data["loot-table"] = {row[0]: _load_extra(_row(ITEM_COLUMNS, row[1:-1]), row[-1]) for row in db.execute(
+                f"SELECT name, {', '.join(ITEM_COLUMNS)}, extra FROM loot_table")}
+
+            missions = {}
+            for row in db.execute(f"SELECT name, {', '.join(MISSION_COLUMNS)}, {', '.join(RARITIES)}, extra FROM missions"):
+                mission = _row(MISSION_COLUMNS, row[1:])
+                loot = _row(RARITIES, row[1+len(MISSION_COLUMNS):-1])
+                if loot != {}:
+                    mission["loot-table"] = loot
+                missions[row[0]] = _load_extra(mission, row[-1])
+            data["missions"] = missions
+            return data
+
+    def write(self, data: dict):
+        "Replace whole database content in one transaction"
+        with self.lock:
+            db = self.connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ["settings", "entries", "income", "players", "upgrades", "items", "player_shop", "loot_table", "missions"]:
+                    db.execute(f"DELETE FROM {table}")
+                for key, value in data.items():
+                    self._write_key(db, key, value)
+                for player_id, player in data.get("players", {}).items():
+                    self._insert_player(db, player_id, player)
+                db.execute("COMMIT")
+            except:
+                db.execute("ROLLBACK")
+                raise
+
+    def write_partial(self, players: dict, keys: dict, entries: dict, parts: dict):
+        """Write changed players (None means deleted), top level keys, entries {(key, entry): value} of ENTRY_KEYS
+        (None means deleted) and parts {(player, section, name): value} of players (see Configuration.part)
+        in one transaction, each part is one row"""
+        with self.lock:
+            db = self.connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for key, value in keys.items():
+                    self._write_key(db, key, value)
+                for (key, entry), value in entries.items():
+                    if value is None:
+                        db.execute(
+                            "DELETE FROM entries WHERE key = ? AND entry = ?", (key, entry))
+                    else:
+                        db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                   (key, entry, json.dumps(value, ensure_ascii=False)))
+                for player_id, player in players.items():
+                    self._delete_player(db, player_id)
+                    if player is not None:
+                        self._insert_player(db, player_id, player)
+                for (player_id, section, name), value in parts.items():
+                    self._write_part(db, player_id, section, name, value)
+                db.execute("COMMIT")
+            except:
+                db.execute("ROLLBACK")
+                raise
+
+    def _write_key(self, db, key: str, value):
+        if key == "players":
+            return
+        elif key in ENTRY_KEYS:
+            db.execute("DELETE FROM settings WHERE key = ?", (key,))
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            db.executemany("INSERT INTO entries VALUES (?, ?, ?)", [
+                (key, entry, json.dumps(value, ensure_ascii=False)) for entry, value in value.items()])
+        elif key == "income":
+            db.execute("DELETE FROM income")
+            db.executemany("INSERT INTO income VALUES (?, ?)",
+                           list(value.items()))
+        elif key == "loot-table":
+            db.execute("DELETE FROM loot_table")
+            db.executemany(f"INSERT INTO loot_table VALUES ({', '.join('?'*(len(ITEM_COLUMNS)+2))})", [
+                (name, *[item.get(c) for c in ITEM_COLUMNS], _extra(item, ITEM_COLUMNS)) for name, item in value.items()])
+        elif key == "missions":
+            db.execute("DELETE FROM missions")
+            # Loot table that does not fit rarity columns is kept whole in extra
+            db.executemany(f"INSERT INTO missions VALUES ({', '.join('?'*(len(MISSION_COLUMNS)+len(RARITIES)+2))})", [
+                (name, *[mission.get(c) for c in MISSION_COLUMNS], *[mission["loot-table"].get(r) if _plain(mission.get("loot-table"), RARITIES) else None for r in RARITIES],
+                 _extra(mission, MISSION_COLUMNS + (["loot-table"] if _plain(mission.get("loot-table"), RARITIES) else []))) for name, mission in value.items()])
+        else:
+            db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)",
+                       (key, json.dumps(value, ensure_ascii=False)))
+
+    def _write_part(self, db, player_id: int, section: str, name: str, value):
+        if section == "field":
+            # Key with None value and keys without column live in extra, see _extra
+            path = f"$.{json.dumps(name)}"
+            if name in PLAYER_COLUMNS and value is not None:
+                db.execute(f"UPDATE players SET {PLAYER_COLUMNS[name]} = ?, extra = json_remove(extra, ?) WHERE id = ?",
+                           (value, path, player_id))
+            else:
+                db.execute(f"UPDATE players SET {PLAYER_COLUMNS[name] + ' = NULL, ' if name in PLAYER_COLUMNS else ''}extra = json_set(COALESCE(extra, '{{}}'), ?, json(?)) WHERE id = ?",
+                           (path, json.dumps(value, ensure_ascii=False), player_id))
+        elif section == "upgrade":
+            if value is None:
+                db.execute(
+                    "DELETE FROM upgrades WHERE player_id = ? AND item = ?", (player_id, name))
+            else:
+                db.execute("INSERT OR REPLACE INTO upgrades VALUES (?, ?, ?, ?, ?)",
+                           self._upgrade_row(player_id, name, value))
+        elif section == "player_shop":
+            if value is None:
+                db.execute(
+                    "DELETE FROM player_shop WHERE player_id = ? AND item = ?", (player_id, name))
+            else:
+                db.execute("INSERT OR REPLACE INTO player_shop VALUES (?, ?, ?)",
+                           (player_id, name, value))
+        else:
+            if value is None:
+                db.execute("DELETE FROM items WHERE player_id = ? AND slot = ? AND name = ?",
+                           (player_id, section, name))
+            else:
+                db.execute(f"INSERT OR REPLACE INTO items VALUES ({', '.join('?'*(len(ITEM_COLUMNS)+4))})",
+                           self._item_row(player_id, section, name, value))
+
+    def _upgrade_row(self, player_id: int, item: str, upgrade: dict):
+        "Row of upgrades from count, max and generation present for item"
+        return (player_id, item, upgrade.get("count"), json.dumps(upgrade["max"]) if "max" in upgrade else None, upgrade.get("generation"))
+
+    def _item_row(self, player_id: int, slot: str, name: str, item: dict):
+        return (player_id, slot, name, *[item.get(c) for c in ITEM_COLUMNS], _extra(item, ITEM_COLUMNS))
+
+    def _delete_player(self, db, player_id: int):
+        for table, column in [("players", "id"), ("upgrades", "player_id"), ("items", "player_id"), ("player_shop", "player_id")]:
+            db.execute(
+                f"DELETE FROM {table} WHERE {column} = ?", (player_id,))
+
+    def _insert_player(self, db, player_id: int, player: dict):
+        # Stats that do not fit stat columns are kept whole in extra
+        stats = player.get("stats", {}) if _plain(
+            player.get("stats"), STATS) else {}
+        sections = ["upgrade", "maxupgrade", "generation", "inventory", "equiped", "player_shop"] + \
+            (["stats"] if stats != {} else [])
+        db.execute(f"INSERT INTO players VALUES ({', '.join('?'*(len(PLAYER_COLUMNS)+len(STATS)+2))})", (
+            player_id, *[player.get(c) for c in PLAYER_COLUMNS], *[stats.get(s) for s in STATS], _extra(player, list(PLAYER_COLUMNS) + sections)))
+
+        upgrade = player.get("upgrade", {})
+        maxupgrade = player.get("maxupgrade", {})
+        generation = player.get("generation", {})
+        db.executemany("INSERT INTO upgrades VALUES (?, ?, ?, ?, ?)", [
+            self._upgrade_row(player_id, item, {key: values[item] for key, values in [("count", upgrade), ("max", maxupgrade), ("generation", generation)] if item in values})
+            for item in {**upgrade, **maxupgrade, **generation}])
+
+        for slot in ["inventory", "equiped"]:
+            db.executemany(f"INSERT INTO items VALUES ({', '.join('?'*(len(ITEM_COLUMNS)+4))})", [
+                self._item_row(player_id, slot, name, item) for name, item in player.get(slot, {}).items()])
+
+        db.executemany("INSERT INTO player_shop VALUES (?, ?, ?)", [
+            (player_id, item, price) for item, price in player.get("player_shop", {}).items()])
+
+
+STORAGES = {
+    "json": JSONStorage,
+    "journal": JournalStorage,
+    "sqlite": SQLiteStorage
+}
@@ -0,0 +1,83 @@
+import asyncio
+import contextlib
+
+
+class TransactionError(Exception):
+    "Transaction is not valid anymore, nothing was changed, field is the resource player did not have enough of (see charge)"
+
+    def __init__(self, message: str, field: str = None):
+        super().__init__(message)
+        self.field = field
+
+
+class PlayerLocks():
+    """Per-player asyncio locks
+    Locks are always taken in ascending order of player id, so transactions over several players can not deadlock"""
+
+    def __init__(self):
+        self.locks = {}
+
+    @contextlib.asynccontextmanager
+    async def __call__(self, *players: int):
+        registered = []
+        held = []
+        try:
+            for player in sorted(set(players)):
+                lock, users = self.locks.get(player, (asyncio.Lock(), 0))
+                self.locks[player] = (lock, users + 1)
+                registered.append(player)
+                await lock.acquire()
+                held.append(player)
+            yield
+        finally:
+            for player in reversed(registered):
+                lock, users = self.locks[player]
+                if player in held:
+                    lock.release()
+                if users == 1:
+                    del self.locks[player]
+                else:
+                    self.locks[player] = (lock, users - 1)
+
+
+# region Transactions
+# Called while holding locks of all involved players, everything is validated before first change
+
+def charge(config, player: int, **costs):
+    "Take balance, manpower, ... from player"
+    record = config.player(player)
+    for field, cost in costs.items():
+        if record[field] < cost:
+            raise TransactionError(
+                f"Not enought {'money' if field == 'balance' else field}", field)
+    for field, cost in costs.items():
+        config.add(player, field, -cost)
+
+
+def transfer(config, source: int, target: int, amount, field: str = "balance"):
+    "Move amount of field from source to target player"
+    if amount <= 0:
+        raise TransactionError("Invalid value")
+    charge(config, source, **{field: amount})
+    config.add(target, field, amount)
+
+
+def purchase(config, player: int, item: str, count: int, cost, manpower: int):
+    "Buy count of upgrade from shop catalog, limit is checked against current count"
+    owned, limit = config.upgrades(config.player(player), item)
+    if limit != None and owned + count > limit:
+        raise TransactionError("Limit reached")
+    charge(config, player, balance=cost)
+    config.upgrade(player, item, count)
+    config.add(player, "manpower", manpower)
+
+
+def trade(config, buyer: int, seller: int, item: str, price, cost):
+    "Buy listed item from seller for price, buyer pays cost (price after discount), returns name of item in inventory of buyer"
+    if config.player(seller).player_shop.get(item) != price or not item in config.player(seller).inventory:
+        raise TransactionError("Item is not for sale anymore")
+    charge(config, buyer, balance=cost)
+    config.add(seller, "balance", price)
+    config.list_item(seller, item, None)
+    return config.give_item(seller, buyer, item)
+# endregion